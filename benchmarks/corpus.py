@@ -0,0 +1,172 @@
+"""
+Generator for synthetic web stories, for benchmarking
+"""
+import random
+
+
+STORY_TEMPLATE = """<!doctype html>
+<html ⚡>
+  <head>
+    <meta charset="utf-8">
+    <title>{title}</title>
+    <link rel="canonical" href="story.html">
+    <meta name="viewport" content="width=device-width,minimum-scale=1,initial-scale=1">
+    <script async src="https://cdn.ampproject.org/v0.js"></script>
+    <script async custom-element="amp-video" src="https://cdn.ampproject.org/v0/amp-video-0.1.js"></script>
+    <script async custom-element="amp-story" src="https://cdn.ampproject.org/v0/amp-story-1.0.js"></script>
+    <style amp-custom>{css}</style>
+  </head>
+  <body>
+    <amp-story standalone
+        title="{title}"
+        publisher="Benchmark publisher"
+        publisher-logo-src="assets/logo.svg"
+        poster-portrait-src="assets/cover.jpg">
+{pages}
+    </amp-story>
+  </body>
+</html>
+"""
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut '
+    'labore et dolore magna aliqua café naïve &amp; &lt;tag&gt; &copy;'
+).split()
+
+# attributes that cleaning has to remove or sanitize
+HOSTILE_ATTRIBUTES = [
+    'onclick="alert(1)"',
+    'onmouseover="steal(document.cookie)"',
+    'style="background: url(javascript:alert(1))"',
+    'href="javascript:alert(1)"',
+    'src="data:text/html;base64,PHNjcmlwdD4="',
+    'data-bad<attr="x"',
+    'formaction="https://evil.example/"',
+    'title=\'quote " and &quot; mixed\'',
+]
+
+
+class StoryGenerator:
+    """
+    Generates the HTML of a synthetic story, deterministically for a given seed.
+
+    pages: number of <amp-story-page> elements
+    layers: number of <amp-story-grid-layer> elements per page
+    depth: nesting depth of block elements within each layer
+    media_density: probability of each block containing an <amp-img> or <amp-video>
+    script_density: probability of each page containing inline <script> elements
+    css_size: approximate size of the <style amp-custom> element, in characters
+    hostile_density: probability of each element carrying attributes that cleaning must remove
+    """
+    def __init__(
+        self, pages=30, layers=3, depth=3, media_density=0.3, script_density=0.2,
+        css_size=50000, hostile_density=0.1, seed=0
+    ):
+        self.pages = pages
+        self.layers = layers
+        self.depth = depth
+        self.media_density = media_density
+        self.script_density = script_density
+        self.css_size = css_size
+        self.hostile_density = hostile_density
+        self.random = random.Random(seed)
+
+    def text(self, words=8):
+        return ' '.join(self.random.choice(WORDS) for _ in range(self.random.randint(1, words)))
+
+    def attributes(self, *attrs):
+        attrs = list(attrs)
+        if self.random.random() < self.hostile_density:
+            attrs.append(self.random.choice(HOSTILE_ATTRIBUTES))
+        if self.random.random() < 0.3:
+            attrs.append('class="c%d"' % self.random.randint(0, 200))
+        if self.random.random() < 0.2:
+            attrs.append(
+                'animate-in="fly-in-bottom" animate-in-delay="0.%ds"' % self.random.randint(1, 9)
+            )
+        return ''.join(' ' + attr for attr in attrs)
+
+    def media(self):
+        if self.random.random() < 0.7:
+            return '<amp-img%s></amp-img>' % self.attributes(
+                'src="assets/image%d.jpg"' % self.random.randint(0, 1000),
+                'width="720" height="1280" layout="responsive"',
+                'alt="%s"' % self.text(4),
+            )
+        else:
+            return (
+                '<amp-video%s>'
+                '<source src="assets/video%d.mp4" type="video/mp4">'
+                '<track kind="captions" src="assets/video.vtt" srclang="en">'
+                '</amp-video>'
+            ) % (
+                self.attributes(
+                    'autoplay loop width="720" height="1280" layout="responsive"',
+                    'poster="assets/poster.jpg"',
+                ),
+                self.random.randint(0, 1000),
+            )
+
+    def block(self, depth):
+        parts = []
+        if self.random.random() < self.media_density:
+            parts.append(self.media())
+        if depth > 0:
+            tag = self.random.choice(['div', 'section', 'article', 'blockquote'])
+            parts.append('<%s%s>%s</%s>' % (
+                tag, self.attributes(),
+                ''.join(self.block(depth - 1) for _ in range(self.random.randint(1, 2))), tag
+            ))
+        else:
+            tag = self.random.choice(['p', 'h1', 'h2', 'q'])
+            parts.append('<%s%s>%s <b>%s</b> <a%s>%s</a></%s>' % (
+                tag, self.attributes(), self.text(), self.text(3),
+                self.attributes('href="https://example.com/%d"' % self.random.randint(0, 100)),
+                self.text(2), tag
+            ))
+        return '\n'.join(parts)
+
+    def page(self, index):
+        parts = []
+        for layer in range(self.layers):
+            template = 'fill' if layer == 0 else 'vertical'
+            parts.append(
+                '<amp-story-grid-layer template="%s"%s>\n%s\n</amp-story-grid-layer>'
+                % (template, self.attributes(), self.block(self.depth))
+            )
+        if self.random.random() < self.script_density:
+            parts.append(
+                '<script type="application/json">{"page": %d, "html": "<b>&amp;</b>"}</script>'
+                % index
+            )
+            parts.append('<script>document.write("<p>not allowed</p>")</script>')
+        return '      <amp-story-page id="page-%d"%s>\n%s\n      </amp-story-page>' % (
+            index, self.attributes(), '\n'.join(parts)
+        )
+
+    def css(self):
+        rules = []
+        size = 0
+        while size < self.css_size:
+            rule = '.c%d > p, #page-%d h1 { color: #%06x; margin: %dpx %dpx; }\n' % (
+                self.random.randint(0, 200), self.random.randint(0, self.pages),
+                self.random.randint(0, 0xffffff), self.random.randint(0, 40),
+                self.random.randint(0, 40),
+            )
+            rules.append(rule)
+            size += len(rule)
+        return ''.join(rules)
+
+    def story(self):
+        return STORY_TEMPLATE.format(
+            title='Synthetic story',
+            css=self.css(),
+            pages='\n'.join(self.page(index) for index in range(self.pages)),
+        )
+
+
+def generate_story(**kwargs):
+    """
+    Return the HTML of a synthetic story; keyword arguments are as per StoryGenerator
+    """
+    return StoryGenerator(**kwargs).story()
@@ -0,0 +1,192 @@
+"""
+Times the main operations of the webstories package on synthetic stories, and reports the
+results as JSON:
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --compare results.json
+"""
+import argparse
+import datetime
+import json
+import pickle
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from webstories import Story, StoryPage
+from webstories.backends import get_backend
+from webstories.cache import LRUCache, get_default_cache, set_default_cache
+
+from .corpus import generate_story
+
+
+# increment when the structure of the JSON output changes
+RESULTS_VERSION = 1
+
+SCENARIOS = {
+    'small': {'pages': 5, 'layers': 2, 'depth': 2, 'css_size': 2000},
+    'medium': {'pages': 30},
+    'large': {'pages': 200, 'depth': 4, 'media_density': 0.5, 'css_size': 200000},
+    'hostile': {'pages': 30, 'hostile_density': 0.8, 'script_density': 1.0},
+}
+
+
+def package_versions():
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+    except ImportError:
+        return {}
+
+    versions = {}
+    for package in ('webstories', 'beautifulsoup4', 'bleach', 'lxml', 'html5lib'):
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def measure(func, repeat):
+    """
+    Call func repeat times, returning timings in seconds and the peak memory allocated by a
+    separate call, in bytes
+    """
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    # tracemalloc slows everything down, so memory is measured on a separate run
+    tracemalloc.start()
+    try:
+        func()
+        __, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'repeat': repeat,
+        'peak_memory': peak_memory,
+    }
+
+
+def run_scenario(options, repeat=5, backend=None):
+    html = generate_story(**options)
+    story = Story(html, backend=backend)
+    pages = story.pages
+    page_htmls = [page.html for page in pages]
+    story_bytes = story.to_bytes()
+    story_pickle = pickle.dumps(story, pickle.HIGHEST_PROTOCOL)
+
+    def clean_pages():
+        return [page.get_clean_html(backend=backend) for page in pages]
+
+    def clean_fragments():
+        return [
+            StoryPage.clean_html_fragment(page_html, backend=backend) for page_html in page_htmls
+        ]
+
+    original_cache = get_default_cache()
+    results = {}
+    try:
+        set_default_cache(None)
+        results['parse'] = measure(lambda: Story(html, backend=backend), repeat)
+        results['parse_lazy'] = measure(lambda: Story(html, lazy=True, backend=backend), repeat)
+        results['page_html'] = measure(lambda: [page.html for page in pages], repeat)
+        results['get_clean_html'] = measure(clean_pages, repeat)
+        results['clean_html_fragment'] = measure(clean_fragments, repeat)
+
+        # loading a parsed story from a cache, as an alternative to re-parsing it
+        results['to_bytes'] = measure(story.to_bytes, repeat)
+        results['from_bytes'] = measure(lambda: Story.from_bytes(story_bytes), repeat)
+        results['pickle_dumps'] = measure(
+            lambda: pickle.dumps(story, pickle.HIGHEST_PROTOCOL), repeat
+        )
+        results['pickle_loads'] = measure(lambda: pickle.loads(story_pickle), repeat)
+
+        set_default_cache(LRUCache())
+        clean_pages()
+        results['get_clean_html_cached'] = measure(clean_pages, repeat)
+    finally:
+        set_default_cache(original_cache)
+
+    return {
+        'options': options,
+        'size': len(html),
+        'pages': len(pages),
+        'serialized_size': {'to_bytes': len(story_bytes), 'pickle': len(story_pickle)},
+        'results': results,
+    }
+
+
+def run(scenarios=None, repeat=5, backend=None):
+    backend = get_backend(backend)
+    return {
+        'version': RESULTS_VERSION,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'environment': {
+            'python': sys.version,
+            'platform': platform.platform(),
+            'packages': package_versions(),
+            'backend': backend.name,
+        },
+        'scenarios': {
+            name: run_scenario(SCENARIOS[name], repeat=repeat, backend=backend)
+            for name in (scenarios or SCENARIOS)
+        },
+    }
+
+
+def compare(results, baseline, output=sys.stdout):
+    """
+    Write a table of the median timings in results relative to those in baseline
+    """
+    output.write('%-10s %-24s %12s %12s %8s\n' % (
+        'scenario', 'benchmark', 'baseline', 'current', 'ratio'
+    ))
+    for name, scenario in results['scenarios'].items():
+        baseline_scenario = baseline['scenarios'].get(name)
+        if baseline_scenario is None:
+            continue
+        for benchmark, timing in scenario['results'].items():
+            baseline_timing = baseline_scenario['results'].get(benchmark)
+            if baseline_timing is None:
+                continue
+            output.write('%-10s %-24s %11.2fms %11.2fms %7.2fx\n' % (
+                name, benchmark, baseline_timing['median'] * 1000, timing['median'] * 1000,
+                timing['median'] / baseline_timing['median'],
+            ))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.strip())
+    parser.add_argument(
+        '--scenario', action='append', choices=sorted(SCENARIOS),
+        help="scenario to run (may be repeated; defaults to all)"
+    )
+    parser.add_argument('--repeat', type=int, default=5, help="number of timed runs per benchmark")
+    parser.add_argument('--backend', help="parser backend to benchmark (defaults to 'auto')")
+    parser.add_argument('--output', help="file to write JSON results to (defaults to stdout)")
+    parser.add_argument(
+        '--compare', help="JSON results file from an earlier run to compare against"
+    )
+    options = parser.parse_args(args)
+
+    results = run(options.scenario, repeat=options.repeat, backend=options.backend)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    elif not options.compare:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if options.compare:
+        with open(options.compare) as f:
+            compare(results, json.load(f))
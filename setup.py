@@ -18,10 +18,15 @@ setup(
         "License :: OSI Approved :: BSD License",
         "Operating System :: OS Independent",
     ],
-    python_requires=">=3.6",
+    python_requires=">=3.8",
     install_requires=[
         "beautifulsoup4>=4.6,<5",
         "bleach>=3.2,<4",
     ],
+    extras_require={
+        "lxml": ["lxml"],
+        "html5lib": ["html5lib"],
+        "aio": ["aiohttp>=3.7"],
+    },
     license="BSD",
 )
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from webstories import Story, StoryLimits, aio
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+
+def story_html(title, page_count=2):
+    return '<html><body><amp-story standalone title="%s">%s</amp-story></body></html>' % (
+        title, ''.join(
+            '<amp-story-page id="p%d"><p onclick="x">%d</p></amp-story-page>' % (i, i)
+            for i in range(page_count)
+        )
+    )
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+@unittest.skipIf(web is None, "aiohttp is not installed")
+class TestAio(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.active_requests = 0
+        self.max_active_requests = 0
+
+        async def story(request):
+            self.active_requests += 1
+            self.max_active_requests = max(self.max_active_requests, self.active_requests)
+            try:
+                await asyncio.sleep(0.02)
+            finally:
+                self.active_requests -= 1
+            name = request.match_info['name']
+            if name == 'utf16':
+                return web.Response(
+                    body=story_html('Ĝojo').encode('utf-16'),
+                    content_type='text/html', charset='utf-16'
+                )
+            return web.Response(text=story_html(name), content_type='text/html')
+
+        async def not_a_story(request):
+            return web.Response(text='<p>Hello</p>', content_type='text/html')
+
+        app = web.Application()
+        app.router.add_get('/story/{name}', story)
+        app.router.add_get('/not-a-story', not_a_story)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.base_url = 'http://127.0.0.1:%d' % port
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+
+    async def test_fetch_stories(self):
+        urls = ['%s/story/s%d' % (self.base_url, i) for i in range(12)]
+        urls.append(self.base_url + '/not-a-story')
+        urls.append(self.base_url + '/missing')
+
+        executor = CountingExecutor()
+        results = {}
+        async for result in aio.fetch_stories(
+            iter(urls), concurrency=8, per_host=3, executor=executor, clean=True
+        ):
+            results[result.url] = result
+        executor.shutdown()
+
+        self.assertEqual(set(results), set(urls))
+        self.assertLessEqual(self.max_active_requests, 3)
+        self.assertEqual(executor.submitted, 13)
+
+        result = results[urls[0]]
+        self.assertIsNone(result.error)
+        self.assertEqual(result.story.title, 's0')
+        self.assertEqual(result.clean_pages, [
+            '<amp-story-page id="p0"><p>0</p></amp-story-page>',
+            '<amp-story-page id="p1"><p>1</p></amp-story-page>',
+        ])
+        self.assertIsInstance(results[urls[-2]].error, Story.InvalidStoryException)
+        self.assertEqual(results[urls[-1]].error.status, 404)
+        self.assertIsNone(results[urls[-1]].story)
+
+    async def test_fetch_story(self):
+        result = await aio.fetch_story(self.base_url + '/story/utf16')
+        self.assertEqual(result.story.title, 'Ĝojo')
+        self.assertIsNone(result.clean_pages)
+
+        result = await aio.fetch_story(
+            self.base_url + '/story/big', limits=StoryLimits(max_bytes=100)
+        )
+        self.assertIsInstance(result.error, Story.LimitExceeded)
+        self.assertEqual(result.error.limit, 'max_bytes')
+
+    async def test_parse_errors_returned(self):
+        # errors other than invalid stories are returned too, without ending the other fetches
+        urls = ['%s/story/s%d' % (self.base_url, i) for i in range(3)]
+        results = [
+            result async for result in aio.fetch_stories(urls, backend='no-such-backend')
+        ]
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertIsInstance(result.error, ValueError)
+            self.assertIsNone(result.story)
+
+    async def test_cancel(self):
+        # cancelling a fetch while its story is being parsed cancels it, rather than returning
+        # a result
+        started = threading.Event()
+        release = threading.Event()
+
+        class BlockingExecutor(ThreadPoolExecutor):
+            def submit(self, fn, *args, **kwargs):
+                def blocking_fn(*args, **kwargs):
+                    started.set()
+                    release.wait()
+                    return fn(*args, **kwargs)
+                return super().submit(blocking_fn, *args, **kwargs)
+
+        executor = BlockingExecutor(max_workers=1)
+        task = asyncio.ensure_future(
+            aio.fetch_story(self.base_url + '/story/s0', executor=executor)
+        )
+        try:
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        finally:
+            release.set()
+            executor.shutdown()
+
+    async def test_stop_early(self):
+        urls = ['%s/story/s%d' % (self.base_url, i) for i in range(10)]
+        async with aio.create_session() as session:
+            results = aio.fetch_stories(urls, concurrency=4, session=session)
+            async for result in results:
+                break
+            await results.aclose()
+            self.assertFalse(session.closed)
+        self.assertIsNone(result.error)
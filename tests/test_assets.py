@@ -0,0 +1,90 @@
+import unittest
+
+from webstories import Story, StoryPage
+from webstories.assets import Asset, parse_srcset
+from webstories.backends import BACKENDS
+
+
+class TestAssets(unittest.TestCase):
+    def setUp(self):
+        self.html = """<!doctype html>
+<html ⚡>
+  <head><title>Assets</title></head>
+  <body>
+    <amp-story standalone title="Assets" publisher-logo-src="logo.svg"
+        poster-portrait-src="poster.jpg">
+      <amp-story-page id="one" background-audio="music.mp3">
+        <amp-story-grid-layer template="fill">
+          <amp-img src="cover.jpg" srcset="cover-320.jpg 320w, cover-720.jpg 720w"
+              width="720" height="1280" layout="responsive"></amp-img>
+        </amp-story-grid-layer>
+      </amp-story-page>
+      <amp-story-page id="two">
+        <amp-story-grid-layer template="fill">
+          <amp-video autoplay width="720" height="1280" layout="fill" poster="cover.jpg">
+            <source src="video.webm" type="video/webm">
+            <source src="video.mp4" type="video/mp4">
+          </amp-video>
+          <amp-audio src="voice.mp3"></amp-audio>
+          <amp-img src="poster.jpg" width="1" height="1"></amp-img>
+        </amp-story-grid-layer>
+      </amp-story-page>
+    </amp-story>
+  </body>
+</html>"""
+
+    def test_assets(self):
+        story = Story(self.html, backend='html.parser')
+        self.assertEqual(
+            [(asset.url, asset.type, asset.page_id) for asset in story.assets],
+            [
+                ('logo.svg', 'image', None),
+                ('poster.jpg', 'image', None),
+                ('music.mp3', 'audio', 'one'),
+                ('cover.jpg', 'image', 'one'),
+                ('video.webm', 'video', 'two'),
+                ('video.mp4', 'video', 'two'),
+                ('voice.mp3', 'audio', 'two'),
+            ]
+        )
+
+        cover = story.pages[0].assets[1]
+        self.assertEqual((cover.width, cover.height, cover.layout), ('720', '1280', 'responsive'))
+        self.assertEqual(cover.srcset, [('cover-320.jpg', '320w'), ('cover-720.jpg', '720w')])
+        self.assertEqual(cover.urls, ['cover.jpg', 'cover-320.jpg', 'cover-720.jpg'])
+
+        # de-duplicated within each page, but not between pages
+        self.assertEqual(
+            [asset.url for asset in story.pages[1].assets],
+            ['cover.jpg', 'video.webm', 'video.mp4', 'voice.mp3', 'poster.jpg']
+        )
+        video = story.pages[1].assets[1]
+        self.assertEqual((video.element, video.layout), ('source', 'fill'))
+
+    def test_backends_match(self):
+        reference = Story(self.html, backend='html.parser')
+        for name, backend in BACKENDS.items():
+            if not backend.is_available():
+                continue
+            with self.subTest(backend=name):
+                story = Story(self.html, backend=name)
+                self.assertEqual(story.assets, reference.assets)
+                for page, reference_page in zip(story.pages, reference.pages):
+                    self.assertEqual(page.assets, reference_page.assets)
+
+    def test_standalone_page(self):
+        page = StoryPage(
+            '<amp-story-page id="p"><amp-img src="a.jpg" srcset="a2.jpg 2x"></amp-img>'
+            '</amp-story-page>', id='p'
+        )
+        self.assertEqual(page.assets, [
+            Asset('a.jpg', 'image', 'amp-img', 'src', 'p', srcset=[('a2.jpg', '2x')]),
+        ])
+
+    def test_parse_srcset(self):
+        self.assertEqual(parse_srcset(''), [])
+        self.assertEqual(parse_srcset('a.jpg'), [('a.jpg', None)])
+        self.assertEqual(
+            parse_srcset(' a.jpg 1x ,b.jpg  2x, c,d.jpg 300w, e.jpg,'),
+            [('a.jpg', '1x'), ('b.jpg', '2x'), ('c,d.jpg', '300w'), ('e.jpg', None)]
+        )
@@ -0,0 +1,152 @@
+import unittest
+
+from webstories import Story, StoryPage
+from webstories.backends import (
+    BACKENDS, get_backend, get_default_backend, set_default_backend
+)
+
+from .test_story import TestStory
+
+
+# well-formed markup, for which every backend should produce the same clean output
+FRAGMENTS = [
+    """<amp-story-page id="p">\n  <amp-story-grid-layer template="vertical">\n    <h1 class="a  b" onclick="x">Title &amp; more</h1>\n    <p>Some <b>bold</b> and <a href="https://example.com/?a=1&amp;b=2">link</a> text<br>\n    café &copy; 2021</p>\n  </amp-story-grid-layer>\n</amp-story-page>""",
+    """<amp-story-page id="p"><ul>\n<li>one</li>\n<li></li>\n</ul><pre>\n  keep  spacing\n</pre></amp-story-page>""",
+    """<amp-story-page id="p"><amp-img src="a.jpg" width="720" height="1280" layout="responsive"></amp-img><wbr><script type="application/json">{"a": "<b>&amp;"}</script><script>alert(1)</script></amp-story-page>""",
+    """<amp-story-page id="p"><div title='say "hi"' data-vars-x="1" style="color: red"><!-- comment --><span>x &lt; y</span></div></amp-story-page>""",
+]
+
+# malformed markup, with its clean output as produced by html.parser in versions before parser
+# backends were added; the default backend must still produce this whether or not the other
+# backends are installed
+MALFORMED_FRAGMENTS = [
+    (
+        """<amp-story-page id="p"><p>Hello<div>x</div></p></amp-story-page>""",
+        """<amp-story-page id="p"><p>Hello</p><div>x</div><p></p></amp-story-page>""",
+    ),
+    (
+        """<amp-story-page id="p"><h1 title="a" title="b">Title</h1></amp-story-page>""",
+        """<amp-story-page id="p"><h1 title="b">Title</h1></amp-story-page>""",
+    ),
+    (
+        """<amp-story-page id="p"><p>one<p>two<p>three</amp-story-page>""",
+        """<amp-story-page id="p"><p>one</p><p>two</p><p>three</p><p></p><p></p></amp-story-page>""",
+    ),
+    (
+        """<amp-story-page id="p"><ul><li>one<li>two</ul><b><i>mis</b>nested</i></amp-story-page>""",
+        """<amp-story-page id="p"><ul><li>one</li><li>two</li></ul><b><i>mis</i></b>nested</amp-story-page>""",
+    ),
+    (
+        """<amp-story-page id="p"><a href="/x">a<a href="/y">b</a></a><table><tr><td>cell</table></amp-story-page>""",
+        """<amp-story-page id="p"><a href="/x">a</a><a href="/y">b</a><table><tbody><tr><td>cell</td></tr></tbody></table></amp-story-page>""",
+    ),
+    (
+        """<amp-story-page id="p"><span>unclosed <em>tags</amp-story-page></div></p>stray""",
+        """<amp-story-page id="p"><span>unclosed <em>tags</em></span></amp-story-page>stray""",
+    ),
+    (
+        """<amp-story-page id="p"><br></br><img src="a.png">text</img><hr/>after</amp-story-page>""",
+        """<amp-story-page id="p"><br>text<hr>after</amp-story-page>""",
+    ),
+]
+
+
+class TestBackends(unittest.TestCase):
+    def setUp(self):
+        example = TestStory()
+        example.setUp()
+        self.documents = [example.example_html, example.example_bad_html]
+
+    def available_backends(self):
+        return [name for name, backend in BACKENDS.items() if backend.is_available()]
+
+    def test_stories_match(self):
+        for html in self.documents:
+            reference = Story(html, backend='html.parser')
+            for name in self.available_backends():
+                with self.subTest(backend=name):
+                    story = Story(html, backend=name)
+                    self.assertEqual(story.title, reference.title)
+                    self.assertEqual(story.publisher_logo_src, reference.publisher_logo_src)
+                    self.assertEqual(story.custom_css, reference.custom_css)
+                    self.assertEqual(
+                        [page.id for page in story.pages], [page.id for page in reference.pages]
+                    )
+                    self.assertEqual(
+                        [page.get_clean_html(backend=name) for page in story.pages],
+                        [page.get_clean_html(backend='html.parser') for page in reference.pages]
+                    )
+
+                    lazy_story = Story(html, lazy=True, backend=name)
+                    self.assertEqual(lazy_story.title, reference.title)
+                    self.assertEqual(lazy_story.custom_css, reference.custom_css)
+                    self.assertEqual(len(lazy_story.pages), len(reference.pages))
+
+    def test_fragments_match(self):
+        for html in FRAGMENTS:
+            reference = StoryPage.clean_html_fragment(html, backend='html.parser')
+            for name in self.available_backends():
+                for engine in ('native', 'bleach'):
+                    with self.subTest(backend=name, engine=engine):
+                        self.assertEqual(
+                            StoryPage.clean_html_fragment(html, engine=engine, backend=name),
+                            reference
+                        )
+
+    def test_malformed_fragments_match_html_parser(self):
+        for html, expected in MALFORMED_FRAGMENTS:
+            for name in (None, 'auto', 'html.parser'):
+                for engine in ('native', 'bleach'):
+                    with self.subTest(html=html, backend=name, engine=engine):
+                        self.assertEqual(
+                            StoryPage.clean_html_fragment(html, engine=engine, backend=name),
+                            expected
+                        )
+
+        html = '<html><body><amp-story>%s</amp-story></body></html>' % ''.join(
+            html for html, expected in MALFORMED_FRAGMENTS[:3]
+        )
+        self.assertEqual(
+            [page.get_clean_html() for page in Story(html).pages],
+            [expected for html, expected in MALFORMED_FRAGMENTS[:3]]
+        )
+
+    def test_invalid_story(self):
+        for name in self.available_backends():
+            with self.subTest(backend=name):
+                with self.assertRaises(Story.InvalidStoryException):
+                    Story("<!doctype html><html><body><p>Not a story</p></body></html>", backend=name)
+                with self.assertRaises(Story.InvalidStoryException):
+                    Story("", backend=name)
+
+    def test_get_backend(self):
+        self.assertEqual(get_backend('html.parser').name, 'html.parser')
+        self.assertIs(get_backend('auto'), get_backend('html.parser'))
+        with self.assertRaises(ValueError):
+            get_backend('regex')
+
+    def test_auto_backend_pages_are_source_spans(self):
+        html = self.documents[0]
+        reference = Story(html, backend='html.parser')
+        story = Story(html, backend='auto')
+        for page, reference_page in zip(story.pages, reference.pages):
+            start, end = page.span
+            self.assertEqual(page.html, html[start:end])
+            self.assertEqual(page.fingerprint, reference_page.fingerprint)
+
+        # other backends re-serialize page HTML, so it has no span in the document
+        for name in self.available_backends():
+            if name != 'html.parser':
+                with self.subTest(backend=name):
+                    self.assertIsNone(Story(html, backend=name).pages[0].span)
+
+    def test_default_backend(self):
+        original_backend = get_default_backend()
+        try:
+            set_default_backend('html.parser')
+            self.assertEqual(get_default_backend().name, 'html.parser')
+            self.assertEqual(get_backend(None).name, 'html.parser')
+            with self.assertRaises(ValueError):
+                set_default_backend('regex')
+        finally:
+            set_default_backend(original_backend)
@@ -0,0 +1,46 @@
+import json
+import unittest
+
+from webstories import Story
+
+try:
+    from benchmarks.corpus import generate_story
+    from benchmarks.run import run_scenario
+except ImportError:
+    # the benchmarks are only available in a source checkout, not an installed package
+    generate_story = run_scenario = None
+
+
+@unittest.skipIf(generate_story is None, "the benchmarks package is not available")
+class TestBenchmarks(unittest.TestCase):
+    def test_generate_story(self):
+        options = {'pages': 4, 'css_size': 1000, 'hostile_density': 1.0, 'script_density': 1.0}
+        html = generate_story(**options)
+        self.assertEqual(html, generate_story(**options))
+        self.assertNotEqual(html, generate_story(seed=1, **options))
+
+        story = Story(html)
+        self.assertEqual(story.title, "Synthetic story")
+        self.assertEqual(
+            [page.id for page in story.pages], ['page-0', 'page-1', 'page-2', 'page-3']
+        )
+        self.assertGreaterEqual(len(story.custom_css), 1000)
+
+        clean_html = story.pages[0].get_clean_html()
+        self.assertIn('application/json', clean_html)
+        self.assertNotIn('onclick', clean_html)
+        self.assertNotIn('document.write', clean_html)
+
+    def test_run_scenario(self):
+        result = run_scenario({'pages': 2, 'css_size': 100}, repeat=1)
+        self.assertEqual(result['pages'], 2)
+        for benchmark in (
+            'parse', 'page_html', 'get_clean_html', 'clean_html_fragment', 'from_bytes',
+            'pickle_loads',
+        ):
+            self.assertGreater(result['results'][benchmark]['peak_memory'], 0)
+            self.assertGreaterEqual(result['results'][benchmark]['median'], 0)
+        self.assertLess(
+            result['serialized_size']['to_bytes'], result['serialized_size']['pickle']
+        )
+        json.dumps(result)
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+
+from webstories import Story, StoryPage, clean_many, cleaner
+from webstories.cache import (
+    DirectoryCache, LRUCache, SQLiteCache, get_default_cache, make_key, set_default_cache
+)
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.original_cache = get_default_cache()
+        self.cache = LRUCache()
+        set_default_cache(self.cache)
+        self.html = """<amp-story-page id="p"><h1 onclick="alert('boo')">Hello</h1></amp-story-page>"""
+
+    def tearDown(self):
+        set_default_cache(self.original_cache)
+
+    def test_hits_and_misses(self):
+        clean_html = StoryPage.clean_html_fragment(self.html)
+        self.assertEqual(clean_html, '<amp-story-page id="p"><h1>Hello</h1></amp-story-page>')
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+        self.assertEqual(StoryPage.clean_html_fragment(self.html), clean_html)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+        # engines are cached separately
+        StoryPage.clean_html_fragment(self.html, engine='bleach')
+        self.assertEqual(self.cache.stats()['misses'], 2)
+        StoryPage.clean_html_fragment(self.html, compact=True)
+        self.assertEqual(self.cache.stats()['misses'], 3)
+        self.assertNotEqual(make_key(self.html, 'native', compact=True), make_key(self.html, 'native'))
+
+    def test_allowlist_change_invalidates(self):
+        key = make_key(self.html, 'native')
+        StoryPage.clean_html_fragment(self.html)
+
+        rule = cleaner.ALLOWED_STORY_PAGE_ATTRIBUTES['h1']
+        rule.allowed_attributes.add('onclick')
+        try:
+            self.assertNotEqual(make_key(self.html, 'native'), key)
+            self.assertEqual(
+                StoryPage.clean_html_fragment(self.html),
+                """<amp-story-page id="p"><h1 onclick="alert('boo')">Hello</h1></amp-story-page>"""
+            )
+        finally:
+            rule.allowed_attributes.remove('onclick')
+
+        self.assertEqual(make_key(self.html, 'native'), key)
+
+    def test_callable_rules_not_cached(self):
+        # callables are only identified by their repr, which may be reused by another callable
+        # once they are garbage collected
+        policy = cleaner.SanitizationPolicy(
+            tags=['amp-story-page', 'h1'], attributes={'*': lambda tag, name, value: name == 'id'}
+        )
+        self.assertFalse(policy.cacheable)
+        self.assertTrue(cleaner.default_policy().cacheable)
+        with self.assertRaises(ValueError):
+            make_key(self.html, 'native', policy=policy)
+
+        clean_html = '<amp-story-page id="p"><h1>Hello</h1></amp-story-page>'
+        self.assertEqual(StoryPage.clean_html_fragment(self.html, policy=policy), clean_html)
+        self.assertEqual(
+            list(clean_many([self.html], executor='thread', policy=policy)), [clean_html]
+        )
+        self.assertEqual(self.cache.get_or_clean(self.html, 'native', str, policy=policy), '')
+        self.assertEqual(self.cache.stats()['entries'], 0)
+        self.assertEqual(self.cache.stats()['misses'], 0)
+
+        # clean HTML is not stored with the story either
+        story = Story.from_bytes(Story(
+            '<html><body><amp-story>%s</amp-story></body></html>' % self.html
+        ).to_bytes(clean=True, policy=policy))
+        self.assertIsNone(story.pages[0]._stored_clean)
+
+    def test_lru_eviction(self):
+        cache = LRUCache(max_size=10)
+        cache.set('a', '1234')
+        cache.set('b', '1234')
+        cache.get('a')
+        cache.set('c', '1234')
+        self.assertEqual(cache.get('a'), '1234')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), '1234')
+        self.assertEqual(cache.size, 8)
+
+    def test_disk_backends(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for backend in (
+                SQLiteCache(os.path.join(temp_dir, 'cache.sqlite3')),
+                DirectoryCache(os.path.join(temp_dir, 'cache')),
+            ):
+                set_default_cache(LRUCache(backend=backend))
+                clean_html = StoryPage.clean_html_fragment(self.html)
+
+                # a fresh in-process cache finds the entry in the backend
+                cache = LRUCache(backend=backend)
+                set_default_cache(cache)
+                self.assertEqual(StoryPage.clean_html_fragment(self.html), clean_html)
+                self.assertEqual(cache.stats()['hits'], 1)
+
+                if isinstance(backend, SQLiteCache):
+                    backend.close()
@@ -0,0 +1,136 @@
+import io
+import json
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from contextlib import redirect_stderr, redirect_stdout
+
+from webstories import Story
+from webstories.cli import Checkpoint, iter_sources, main, process
+
+
+def story_html(title, page_ids):
+    return '<html><body><amp-story standalone title="%s">%s</amp-story></body></html>' % (
+        title, ''.join(
+            '<amp-story-page id="%s"><p onclick="x">%s</p></amp-story-page>' % (page_id, page_id)
+            for page_id in page_ids
+        )
+    )
+
+
+class TestCLI(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = self.tempdir.name
+        os.makedirs(os.path.join(self.path, 'stories', 'sub'))
+        self.write('stories/one.html', story_html('One', ['a', 'b']))
+        self.write('stories/sub/two.htm', story_html('Two', ['c']))
+        self.write('stories/notes.txt', 'not a story')
+        self.write('stories/bad.html', '<p>not a story</p>')
+
+        with tarfile.open(os.path.join(self.path, 'stories.tar.gz'), 'w:gz') as archive:
+            archive.add(os.path.join(self.path, 'stories/one.html'), 'tar/one.html')
+        with zipfile.ZipFile(os.path.join(self.path, 'stories.zip'), 'w') as archive:
+            archive.writestr('zip/three.html', story_html('Three', ['d']))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def write(self, name, html):
+        with open(os.path.join(self.path, name), 'w') as f:
+            f.write(html)
+
+    def run_main(self, *args, stdin=None):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            main(list(args), stdin=stdin)
+        results = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        return results, stderr.getvalue()
+
+    def test_iter_sources(self):
+        names = [
+            os.path.relpath(name, self.path) for name, data in iter_sources([
+                os.path.join(self.path, 'stories'),
+                os.path.join(self.path, 'stories.tar.gz'),
+                os.path.join(self.path, 'stories.zip'),
+                os.path.join(self.path, 'stories', '**', '*.htm'),
+                os.path.join(self.path, 'missing.html'),
+            ])
+        ]
+        self.assertEqual(names, [
+            'stories/bad.html', 'stories/one.html', 'stories/sub/two.htm',
+            'stories.tar.gz:tar/one.html', 'stories.zip:zip/three.html', 'stories/sub/two.htm',
+            'missing.html',
+        ])
+
+    def test_main(self):
+        results, stderr = self.run_main(
+            os.path.join(self.path, 'stories'), os.path.join(self.path, 'stories.zip'),
+            '--workers', '2', '--executor', 'thread',
+        )
+        results = {os.path.relpath(result['source'], self.path): result for result in results}
+        self.assertEqual(set(results), {
+            'stories/bad.html', 'stories/one.html', 'stories/sub/two.htm',
+            'stories.zip:zip/three.html',
+        })
+        self.assertEqual(results['stories/bad.html']['error'], 'InvalidStoryException')
+        self.assertEqual(results['stories/one.html']['title'], 'One')
+        self.assertEqual(results['stories/one.html']['pages'], [
+            {'id': 'a', 'html': '<amp-story-page id="a"><p>a</p></amp-story-page>'},
+            {'id': 'b', 'html': '<amp-story-page id="b"><p>b</p></amp-story-page>'},
+        ])
+        self.assertIn('4 stories (4 pages, 1 errors, 0 skipped)', stderr)
+        self.assertIn('stories/s', stderr)
+        self.assertIn('MB/s', stderr)
+
+    def test_page_output(self):
+        html = story_html('Stdin', ['e', 'f'])
+        results, stderr = self.run_main(
+            '-', '--pages', 'fingerprint', '--quiet', stdin=io.BytesIO(html.encode('utf-8'))
+        )
+        self.assertEqual(results, [{
+            'source': '-', 'title': 'Stdin', 'publisher': None, 'publisher_logo_src': None,
+            'poster_portrait_src': None, 'poster_square_src': None, 'poster_landscape_src': None,
+            'pages': [
+                {'id': page.id, 'fingerprint': page.fingerprint} for page in Story(html).pages
+            ],
+        }])
+        self.assertEqual(stderr, '')
+
+        results, stderr = self.run_main(
+            '-', '--pages', 'none', '--quiet', stdin=io.BytesIO(html.encode('utf-8'))
+        )
+        self.assertEqual(results[0]['page_count'], 2)
+        self.assertNotIn('pages', results[0])
+
+    def test_process_pool(self):
+        sources = iter_sources([os.path.join(self.path, 'stories')])
+        output = io.StringIO()
+        stats = process(sources, output, workers=2, executor='process', pages='none')
+        self.assertEqual(stats.stories, 3)
+        self.assertEqual(stats.pages, 3)
+        self.assertEqual(len(output.getvalue().splitlines()), 3)
+
+    def test_resume_from_checkpoint(self):
+        output_path = os.path.join(self.path, 'output.jsonl')
+        checkpoint_path = os.path.join(self.path, 'checkpoint')
+        stories = os.path.join(self.path, 'stories')
+        with redirect_stderr(io.StringIO()):
+            main([
+                os.path.join(stories, 'one.html'), '--output', output_path,
+                '--checkpoint', checkpoint_path,
+            ])
+            main([stories, '--output', output_path, '--checkpoint', checkpoint_path])
+
+        with open(output_path) as f:
+            sources = [json.loads(line)['source'] for line in f]
+        self.assertEqual(sorted(sources), sorted(
+            os.path.join(stories, name) for name in ('one.html', 'bad.html', 'sub/two.htm')
+        ))
+
+        checkpoint = Checkpoint(checkpoint_path)
+        checkpoint.close()
+        self.assertEqual(checkpoint.done, set(sources))
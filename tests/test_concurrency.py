@@ -0,0 +1,156 @@
+import sys
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from webstories import StoryPage, cleaner
+from webstories.cache import LRUCache, get_default_cache, set_default_cache
+from webstories.cleaner import CleanerPool, SanitizationPolicy, default_policy
+
+
+# pages covering hostile attributes and URLs, media, significant and insignificant whitespace,
+# allowed and disallowed scripts, and markup that the native engine hands over to bleach
+PAGES = [
+    """<amp-story-page id="cover" onclick="steal()">
+    <amp-story-grid-layer template="fill">
+        <amp-img src="cover.jpg" width="720" height="1280" layout="responsive"
+            onerror="steal()" srcset="cover-2x.jpg 2x"></amp-img>
+    </amp-story-grid-layer>
+    <amp-story-grid-layer template="vertical">
+        <h1 style="color: red; position: fixed">Hello <b>world</b></h1>
+        <a href="javascript:steal()" data-vars-x="1">link</a>
+    </amp-story-grid-layer>
+</amp-story-page>""",
+    """<amp-story-page id="video">
+    <amp-story-grid-layer template="fill">
+        <amp-video width="720" height="1280" layout="responsive" autoplay>
+            <source src="video.mp4" type="video/mp4">
+            <track kind="captions" src="video.vtt" srclang="en">
+        </amp-video>
+    </amp-story-grid-layer>
+    <script type="application/json">{"html": "<b>&amp;</b>"}</script>
+    <script>document.write("<p>not allowed</p>")</script>
+</amp-story-page>""",
+    """<amp-story-page id="text">
+    <amp-story-grid-layer template="vertical">
+        <pre>  keep
+    this  </pre>
+        <p>  collapse   <i>this</i>  </p>
+        <svg><path d="M0 0"></path></svg>
+        <blink>gone</blink> &lt;escaped&gt;
+    </amp-story-grid-layer>
+</amp-story-page>""",
+    """<amp-story-page id="fallback">
+    <amp-story-grid-layer template="vertical">
+        <a href="/x"><a href="/y">nested</a></a>
+        <table><tr><td>cell</td></tr></table>
+        <p>unclosed <div>block</div>
+    </amp-story-grid-layer>
+</amp-story-page>""",
+]
+
+
+class TestCleanerPool(unittest.TestCase):
+    def test_reuse(self):
+        pool = CleanerPool(max_size=2)
+        policy = default_policy()
+        html = '<amp-story-page id="a"><p onclick="x">hello</p>  <p>world</p></amp-story-page>'
+        self.assertEqual(
+            pool.clean(html, policy),
+            '<amp-story-page id="a"><p>hello</p>  <p>world</p></amp-story-page>'
+        )
+        cleaner = pool.cleaners()[(policy, False)]
+        self.assertEqual(
+            pool.clean(html, policy, compact=True),
+            '<amp-story-page id="a"><p>hello</p><p>world</p></amp-story-page>'
+        )
+        pool.clean(html, policy)
+        self.assertIs(pool.cleaners()[(policy, False)], cleaner)
+
+        # the least recently used cleaner is evicted
+        pool.clean(html, SanitizationPolicy(tags=['p']))
+        self.assertEqual(len(pool.cleaners()), 2)
+        self.assertNotIn((policy, True), pool.cleaners())
+
+        # each thread has its own cleaners
+        other_cleaners = []
+        thread = threading.Thread(target=lambda: other_cleaners.append(pool.cleaners()))
+        thread.start()
+        thread.join()
+        self.assertEqual(other_cleaners, [{}])
+
+    def test_reentrant(self):
+        pool = CleanerPool()
+        inner_results = []
+
+        def allow_attribute(tag, name, value):
+            # clean another fragment while the outer cleaner is in use
+            if value == 'outer':
+                inner_results.append(pool.clean('<p onclick="x">inner</p>', policy))
+            return name == 'id'
+
+        policy = SanitizationPolicy(tags=['p'], attributes={'p': allow_attribute})
+        self.assertEqual(pool.clean('<p id="outer">a</p>', policy), '<p id="outer">a</p>')
+        self.assertEqual(inner_results, ['<p>inner</p>'])
+
+    def test_story_page_uses_pool(self):
+        original_cache = get_default_cache()
+        set_default_cache(None)
+        try:
+            StoryPage.clean_html_fragment(
+                '<amp-story-page id="a"><table></table></amp-story-page>', engine='bleach'
+            )
+        finally:
+            set_default_cache(original_cache)
+        self.assertIn((default_policy(), False), cleaner.cleaner_pool.cleaners())
+
+
+class TestConcurrentCleaning(unittest.TestCase):
+    """
+    Clean the same pages from many threads at once, checking that the results are identical to
+    cleaning them one at a time
+    """
+    def setUp(self):
+        self.original_cache = get_default_cache()
+        self.original_switch_interval = sys.getswitchinterval()
+        # switch threads as often as possible, to make any shared state more likely to show up
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        set_default_cache(self.original_cache)
+        sys.setswitchinterval(self.original_switch_interval)
+
+    def get_tasks(self):
+        policies = [default_policy(), default_policy().derive(tags=['svg'], styles=['color'])]
+        return [
+            (html, engine, policy, compact)
+            for html in PAGES
+            for engine in ('native', 'bleach')
+            for policy in policies
+            for compact in (False, True)
+        ]
+
+    def clean(self, task):
+        html, engine, policy, compact = task
+        return StoryPage.clean_html_fragment(
+            html, engine=engine, policy=policy, compact=compact
+        )
+
+    def check_concurrent_results(self, cache, rounds):
+        tasks = self.get_tasks()
+        set_default_cache(None)
+        expected = [self.clean(task) for task in tasks]
+        set_default_cache(cache)
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(self.clean, tasks * rounds))
+        self.assertEqual(len(results), len(tasks) * rounds)
+        for i, result in enumerate(results):
+            self.assertEqual(result, expected[i % len(tasks)])
+
+    def test_concurrent_cleaning(self):
+        self.check_concurrent_results(None, rounds=64)
+
+    def test_concurrent_cleaning_with_cache(self):
+        # small enough that entries are evicted while other threads are reading them
+        self.check_concurrent_results(LRUCache(max_size=4000), rounds=32)
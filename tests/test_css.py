@@ -0,0 +1,93 @@
+import unittest
+
+from webstories import Story
+from webstories.css import SelectorIndex, compound_keys, prune_css
+
+
+class TestCSS(unittest.TestCase):
+    def setUp(self):
+        self.index = SelectorIndex.build("""
+            <amp-story-page id="cover">
+                <h1 class="title large">Title</h1>
+                <p lang="en">Text</p>
+            </amp-story-page>
+        """)
+
+    def test_selector_matches(self):
+        for selector in [
+            'h1', '#cover', '.title', 'h1.title.large', 'p[lang|=en]', '#cover > h1 + p', '*',
+            'p:not(.title)::first-line', 'svg|rect', 'amp-story-page[active] h1',
+            '.i-amphtml-story-page .title',
+        ]:
+            with self.subTest(selector=selector):
+                self.assertTrue(self.index.selector_matches(selector))
+
+        for selector in [
+            'h2', '#other', '.title.small', 'p.title', '[data-x]', '#cover .missing', '.md\\:flex'
+        ]:
+            with self.subTest(selector=selector):
+                self.assertFalse(self.index.selector_matches(selector))
+
+    def test_runtime_children(self):
+        index = SelectorIndex.build("""
+            <amp-story-page id="cover">
+                <amp-img src="a.jpg" layout="fill"></amp-img>
+                <amp-video layout="fill"><source src="a.mp4" type="video/mp4"></amp-video>
+            </amp-story-page>
+        """)
+        for selector in [
+            'amp-img img', 'amp-video video', 'amp-img > img.i-amphtml-fill-content', 'video',
+        ]:
+            with self.subTest(selector=selector):
+                self.assertTrue(index.selector_matches(selector))
+
+        # the rendered elements have none of the attributes of the AMP element
+        for selector in ['audio', 'amp-audio audio', 'img[src]', 'img.hero', 'img#cover']:
+            with self.subTest(selector=selector):
+                self.assertFalse(index.selector_matches(selector))
+
+        css = 'amp-img img {object-fit: cover} amp-audio audio {display: none}'
+        self.assertEqual(prune_css(css, index).css, 'amp-img img {object-fit: cover}')
+
+    def test_compound_keys(self):
+        self.assertEqual(
+            compound_keys('div.a#b[data-x="1"]:hover::before'),
+            [('tag', 'div'), ('class', 'a'), ('id', 'b'), ('attr', 'data-x')]
+        )
+        self.assertEqual(compound_keys('.a\\31 23'), [('class', 'a123')])
+        self.assertIsNone(compound_keys('&:hover'))
+
+    def test_prune_css(self):
+        css = (
+            '@charset "utf-8"; /* comment */ #cover > .title { color: red }\n'
+            '.unused, h2 { color: blue } @media print { .unused { color: red } }\n'
+            '@media (min-width: 10px) { h1 { margin: 0 } .unused { margin: 0 } }\n'
+            '@keyframes fade { from { opacity: 0 } } .unused, p { content: "}" }\n'
+            '.truncated { color: red'
+        )
+        result = prune_css(css, self.index)
+        self.assertEqual(result.css, (
+            '@charset "utf-8";\n'
+            '#cover > .title { color: red }\n'
+            '@media (min-width: 10px) {h1 { margin: 0 }}\n'
+            '@keyframes fade { from { opacity: 0 } }\n'
+            '.unused, p { content: "}" }\n'
+            '.truncated { color: red'
+        ))
+        self.assertEqual(result.removed_rules, 3)
+        self.assertEqual(result.savings, len(css) - len(result.css))
+
+    def test_get_optimized_css(self):
+        html = """<!doctype html><html><head>
+            <style amp-custom>body { margin: 0 } .used { color: red } .unused { color: blue }</style>
+            </head><body><amp-story standalone title="CSS">
+            <amp-story-page id="one"><p class="used">Hi</p></amp-story-page>
+            </amp-story></body></html>"""
+        story = Story(html, lazy=True)
+        result = story.get_optimized_css()
+        self.assertEqual(result.css, 'body { margin: 0 }\n.used { color: red }')
+        self.assertEqual(result.original_size, len(story.custom_css))
+        self.assertGreater(result.savings, 0)
+
+        html = html.replace('<style amp-custom>', '<style>')
+        self.assertIsNone(Story(html).get_optimized_css())
@@ -0,0 +1,162 @@
+import unittest
+
+from webstories import Story
+from webstories.cache import get_default_cache, set_default_cache
+from webstories.cleaner import SanitizationPolicy, default_policy
+from webstories.document import required_extensions, story_start_tag
+from webstories.profiling import profile
+
+
+STORY_HTML = """<!doctype html>
+<html amp>
+<head>
+    <style amp-custom>h1 { color: red; } .unused { color: blue; }</style>
+</head>
+<body>
+    <amp-story standalone title="Tom &amp; Jerry" publisher="Acme" onclick="steal()"
+        poster-portrait-src="javascript:alert(1)" publisher-logo-src="logo.png"
+        data-story-id="42">
+        <amp-story-page id="cover">
+            <amp-story-grid-layer template="fill">
+                <amp-img src="cover.jpg" width="720" height="1280" layout="responsive"></amp-img>
+            </amp-story-grid-layer>
+            <amp-story-grid-layer template="vertical">
+                <h1 onclick="steal()">Hello</h1>
+            </amp-story-grid-layer>
+        </amp-story-page>
+        <amp-story-page id="poll">
+            <amp-story-grid-layer template="vertical">
+                <amp-story-interactive-poll option-1-text="Yes" option-2-text="No">
+                </amp-story-interactive-poll>
+                <AMP-VIDEO src="video.mp4" width="720" height="1280" layout="fill"></AMP-VIDEO>
+                <amp-iframe src="https://example.com/"></amp-iframe>
+            </amp-story-grid-layer>
+        </amp-story-page>
+    </amp-story>
+</body>
+</html>
+"""
+
+
+class TestAMPDocument(unittest.TestCase):
+    def setUp(self):
+        self.story = Story(STORY_HTML)
+
+    def test_iter_amp_html(self):
+        chunks = list(self.story.iter_amp_html(canonical_url='https://example.com/story/'))
+        self.assertEqual(len(chunks), 5)
+        head = chunks[0]
+        self.assertTrue(head.startswith('<!doctype html>\n<html amp>\n<head>\n'))
+        self.assertIn('<title>Tom &amp; Jerry</title>', head)
+        self.assertIn('<link rel="canonical" href="https://example.com/story/">', head)
+        self.assertIn('<style amp-boilerplate>', head)
+        self.assertIn('<style amp-custom>h1 { color: red; } .unused { color: blue; }</style>', head)
+        self.assertEqual(chunks[1], (
+            '<amp-story data-story-id="42" publisher="Acme" publisher-logo-src="logo.png" '
+            'standalone title="Tom &amp; Jerry">\n'
+        ))
+        self.assertEqual(chunks[2:4], [
+            page.get_clean_html() + '\n' for page in self.story.pages
+        ])
+        self.assertEqual(chunks[4], '</amp-story>\n</body>\n</html>\n')
+
+        # the document can be parsed back into the same story
+        story = Story(''.join(chunks))
+        self.assertEqual(story.title, 'Tom & Jerry')
+        self.assertEqual(story.custom_css, self.story.custom_css)
+        self.assertEqual(
+            [page.html for page in story.pages],
+            [page.get_clean_html() for page in self.story.pages]
+        )
+
+    def test_extensions(self):
+        head = next(self.story.iter_amp_html())
+        scripts = [line for line in head.splitlines() if 'custom-element' in line]
+        self.assertEqual(scripts, [
+            '<script async custom-element="amp-story" '
+            'src="https://cdn.ampproject.org/v0/amp-story-1.0.js"></script>',
+            '<script async custom-element="amp-story-interactive" '
+            'src="https://cdn.ampproject.org/v0/amp-story-interactive-0.1.js"></script>',
+            '<script async custom-element="amp-video" '
+            'src="https://cdn.ampproject.org/v0/amp-video-0.1.js"></script>',
+        ])
+
+        # elements removed by cleaning need no extension
+        policy = default_policy().derive(tags=['amp-iframe'])
+        self.assertEqual(
+            required_extensions([page.html for page in self.story.pages], policy),
+            ['amp-iframe', 'amp-story', 'amp-story-interactive', 'amp-video']
+        )
+
+        # nor do elements within comments, raw text or <noscript>, which end up as text
+        html = (
+            '<amp-story-page id="a"><!-- <amp-video></amp-video> -->'
+            '<script type="application/json">{"html": "<amp-iframe></amp-iframe>"}</script>'
+            '<noscript><amp-analytics></amp-analytics></noscript>'
+            '<amp-story-grid-layer template="fill"><amp-img src="a.jpg"></amp-img>'
+            '</amp-story-grid-layer></amp-story-page>'
+        )
+        policy = default_policy().derive(tags=['amp-analytics', 'amp-iframe', 'amp-video'])
+        self.assertEqual(required_extensions([html], policy), ['amp-story'])
+        self.assertEqual(
+            required_extensions([html.replace('noscript', 'div')], policy),
+            ['amp-analytics', 'amp-story']
+        )
+
+    def test_custom_css(self):
+        html = ''.join(self.story.iter_amp_html(optimize_css=True))
+        self.assertIn('h1 { color: red; }', html)
+        self.assertNotIn('.unused', html)
+
+        self.story.custom_css = 'p::after { content: "</style><script>"; }'
+        html = ''.join(self.story.iter_amp_html())
+        self.assertIn('content: "<\\/style><script>"', html)
+
+    def test_story_start_tag(self):
+        self.assertEqual(
+            story_start_tag({'title': '"quoted"', 'onload': 'x'}, default_policy()),
+            '<amp-story standalone title=\'"quoted"\'>'
+        )
+
+        # values are cleaned as for elements within pages
+        story_attrs = {
+            'standalone': '',
+            'style': 'background:url(javascript:alert(1)) !important',
+            'on': "tap:AMP.navigateTo(url='javascript:alert(1)')",
+            'entity-url': 'javascript:alert(1)',
+            'publisher-logo-src': 'logo.png',
+        }
+        self.assertEqual(
+            story_start_tag(story_attrs, default_policy()),
+            '<amp-story publisher-logo-src="logo.png" standalone style="">'
+        )
+        self.assertEqual(
+            story_start_tag(
+                {'style': 'color: red; position: fixed'},
+                default_policy().derive(styles=['color'])
+            ),
+            '<amp-story standalone style="color: red;">'
+        )
+
+        # as are the attributes allowed by the policy
+        policy = SanitizationPolicy(tags=['p'], attributes={'amp-story': ['title']})
+        self.assertEqual(
+            story_start_tag({'title': 'Title', 'publisher': 'Acme'}, policy),
+            '<amp-story standalone title="Title">'
+        )
+
+    def test_pages_cleaned_as_generated(self):
+        original_cache = get_default_cache()
+        set_default_cache(None)
+        try:
+            chunks = self.story.iter_amp_html()
+            with profile() as stats:
+                next(chunks)
+                next(chunks)
+            self.assertEqual(stats.phases(), [])
+
+            with profile() as stats:
+                next(chunks)
+            self.assertEqual(len(stats.durations('parse_fragment')), 1)
+        finally:
+            set_default_cache(original_cache)
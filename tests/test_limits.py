@@ -0,0 +1,126 @@
+import pickle
+import unittest
+
+from webstories import (
+    InvalidStoryException, LimitExceeded, Story, StoryLimits, get_default_limits,
+    set_default_limits
+)
+from webstories.backends import BACKENDS, get_backend
+
+
+STORY_END = '</amp-story></body></html>'
+
+
+def story_html(pages, css=None):
+    head = '<head><style amp-custom>%s</style></head>' % css if css is not None else ''
+    return '<html>%s<body><amp-story standalone title="Limits">%s%s' % (
+        head, ''.join(pages), STORY_END
+    )
+
+
+class TestLimits(unittest.TestCase):
+    def setUp(self):
+        self.backends = [name for name, backend in BACKENDS.items() if backend.is_available()]
+
+    def assertLimitExceeded(self, html, limit, limits, lazy=False):
+        for backend in self.backends:
+            with self.subTest(backend=backend, limit=limit):
+                with self.assertRaises(LimitExceeded) as context:
+                    story = Story(html, backend=backend, limits=limits, lazy=lazy)
+                    story.pages
+                self.assertEqual(context.exception.limit, limit)
+                self.assertEqual(context.exception.maximum, getattr(limits, limit))
+                # still within the limits when they are disabled
+                Story(html, backend=backend, limits=StoryLimits.unlimited()).pages
+
+    def test_within_limits(self):
+        html = story_html(
+            ['<amp-story-page id="p%d"><p>%d</p></amp-story-page>' % (i, i) for i in range(3)],
+            css='p {color: red}'
+        )
+        limits = StoryLimits(
+            max_bytes=len(html), max_pages=3, max_depth=6, max_page_nodes=2, max_css_bytes=14
+        )
+        for backend in self.backends:
+            story = Story(html, backend=backend, limits=limits)
+            self.assertEqual([page.id for page in story.pages], ['p0', 'p1', 'p2'])
+
+    def test_max_bytes(self):
+        html = story_html(['<amp-story-page id="p"></amp-story-page>'])
+        self.assertLimitExceeded(html, 'max_bytes', StoryLimits(max_bytes=len(html) - 1))
+        self.assertLimitExceeded(
+            html.encode('utf-8'), 'max_bytes', StoryLimits(max_bytes=len(html) - 1)
+        )
+
+    def test_max_pages(self):
+        html = story_html(['<amp-story-page id="p"></amp-story-page>'] * 3)
+        self.assertLimitExceeded(html, 'max_pages', StoryLimits(max_pages=2))
+        self.assertLimitExceeded(html, 'max_pages', StoryLimits(max_pages=2), lazy=True)
+
+    def test_max_depth(self):
+        html = story_html(['<amp-story-page id="p">%s</amp-story-page>' % ('<div>' * 300)])
+        self.assertLimitExceeded(html, 'max_depth', StoryLimits(max_depth=200))
+
+    def test_implicitly_closed_elements(self):
+        # a browser closes each of these elements at the start of the next, so they do not nest
+        html = story_html([
+            '<amp-story-page id="p"><amp-story-grid-layer template="vertical">%s%s%s'
+            '</amp-story-grid-layer></amp-story-page>' % (
+                '<p>Paragraph' * 300,
+                '<ul>%s</ul>' % ('<li>Item<p>Text' * 300),
+                '<dl>%s</dl>' % ('<dt>Term<dd>Definition' * 300),
+            )
+        ])
+        for backend in self.backends:
+            with self.subTest(backend=backend):
+                story = Story(html, backend=backend)
+                self.assertEqual([page.id for page in story.pages], ['p'])
+
+        # elements that are not closed implicitly still count
+        html = story_html(['<amp-story-page id="p">%s</amp-story-page>' % ('<div><p>' * 150)])
+        self.assertLimitExceeded(html, 'max_depth', StoryLimits(max_depth=100))
+
+    def test_max_page_nodes(self):
+        html = story_html([
+            '<amp-story-page id="small"><p>one</p></amp-story-page>',
+            '<amp-story-page id="big">%s</amp-story-page>' % ('<p>x</p>' * 20),
+        ])
+        self.assertLimitExceeded(html, 'max_page_nodes', StoryLimits(max_page_nodes=20))
+
+    def test_max_css_bytes(self):
+        html = story_html(['<amp-story-page id="p"></amp-story-page>'], css='p {content: "é"}')
+        self.assertLimitExceeded(html, 'max_css_bytes', StoryLimits(max_css_bytes=16))
+
+    def test_reject_without_story_element(self):
+        for backend in self.backends:
+            with self.assertRaises(InvalidStoryException):
+                Story(
+                    '<html><body><amp-story-page></amp-story-page></body></html>', backend=backend
+                )
+
+        # the pre-scan does not reject a story element written in upper case
+        self.assertEqual(Story('<AMP-STORY\ttitle="x"></AMP-STORY>').title, 'x')
+
+    def test_default_limits(self):
+        original_limits = get_default_limits()
+        html = story_html(['<amp-story-page id="p"></amp-story-page>'] * 2)
+        try:
+            set_default_limits(StoryLimits(max_pages=1))
+            with self.assertRaises(LimitExceeded):
+                Story(html)
+            set_default_limits(None)
+            self.assertEqual(len(Story(html).pages), 2)
+        finally:
+            set_default_limits(original_limits)
+
+    def test_exception(self):
+        self.assertIs(Story.InvalidStoryException, InvalidStoryException)
+        self.assertTrue(issubclass(Story.LimitExceeded, Story.InvalidStoryException))
+        error = pickle.loads(pickle.dumps(LimitExceeded('max_pages', 10)))
+        self.assertEqual((error.limit, error.maximum), ('max_pages', 10))
+        self.assertEqual(str(error), "Story exceeds max_pages (10)")
+
+    def test_backend_without_limits(self):
+        html = story_html(['<amp-story-page id="p"></amp-story-page>'] * 3)
+        for backend in self.backends:
+            self.assertEqual(len(get_backend(backend).parse_story(html).pages), 3)
@@ -0,0 +1,75 @@
+import unittest
+
+from benchmarks.corpus import generate_story
+from webstories import Story
+from webstories.manifest import StoryManifest
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.html = generate_story(pages=6, css_size=100)
+        self.story = Story(self.html, backend='html.parser')
+
+    def edit(self, html, old, new):
+        self.assertIn(old, html)
+        return Story(html.replace(old, new, 1), backend='html.parser')
+
+    def test_fingerprint(self):
+        page = self.story.pages[2]
+        self.assertEqual(
+            page.fingerprint, Story(self.html, backend='html.parser').pages[2].fingerprint
+        )
+        self.assertNotEqual(page.fingerprint, self.story.pages[3].fingerprint)
+
+    def test_manifest_round_trip(self):
+        manifest = self.story.manifest()
+        self.assertEqual(manifest.metadata['title'], 'Synthetic story')
+        self.assertEqual([id for id, fingerprint in manifest.pages], [
+            'page-0', 'page-1', 'page-2', 'page-3', 'page-4', 'page-5'
+        ])
+        self.assertEqual(StoryManifest.from_json(manifest.to_json()), manifest)
+        with self.assertRaises(ValueError):
+            StoryManifest.from_dict(dict(manifest.as_dict(), version=0))
+
+    def test_no_changes(self):
+        diff = Story(self.html, backend='html.parser').diff(self.story.manifest())
+        self.assertFalse(diff.has_changes)
+        self.assertEqual(len(diff.unchanged), 6)
+        self.assertEqual(diff.pages_to_clean, [])
+
+    def test_changes(self):
+        pages = self.html.split('      <amp-story-page')
+        # move page-4 to the start, remove page-1, and add a new page at the end
+        reordered = ''.join(
+            [pages[0], '      <amp-story-page' + pages[5]]
+            + ['      <amp-story-page' + page for page in pages[1:5] if 'id="page-1"' not in page]
+            + ['      <amp-story-page' + pages[6]]
+        )
+        html = reordered.replace(
+            '</amp-story-page>\n    </amp-story>',
+            '</amp-story-page>\n<amp-story-page id="new"><p>New</p></amp-story-page>\n    </amp-story>'
+        )
+        story = self.edit(html, 'id="page-2"', 'id="page-2" class="edited"')
+
+        diff = story.diff(self.story)
+        self.assertEqual(diff.added, ['new'])
+        self.assertEqual(diff.removed, ['page-1'])
+        self.assertEqual(diff.changed, ['page-2'])
+        self.assertEqual(diff.reordered, ['page-4'])
+        self.assertEqual(diff.unchanged, ['page-4', 'page-0', 'page-3', 'page-5'])
+        self.assertEqual([page.id for page in diff.pages_to_clean], ['page-2', 'new'])
+        self.assertEqual(diff.metadata_changed, [])
+        self.assertFalse(diff.custom_css_changed)
+
+    def test_metadata_changes(self):
+        diff = self.edit(self.html, 'title="Synthetic story"', 'title="Renamed"').diff(
+            self.story.manifest()
+        )
+        self.assertEqual(diff.metadata_changed, ['title'])
+        self.assertFalse(diff.custom_css_changed)
+        self.assertTrue(diff.has_changes)
+        self.assertEqual(diff.pages_to_clean, [])
+
+        diff = self.edit(self.html, '{ color:', '{ colour:').diff(self.story)
+        self.assertEqual(diff.metadata_changed, [])
+        self.assertTrue(diff.custom_css_changed)
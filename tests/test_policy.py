@@ -0,0 +1,93 @@
+import pickle
+import unittest
+
+from webstories import StoryPage, cleaner
+from webstories.cleaner import SVG_TAGS, SanitizationPolicy, StoryPageCleaner, default_policy
+
+
+class TestSanitizationPolicy(unittest.TestCase):
+    def test_default_policy(self):
+        policy = default_policy()
+        self.assertIs(default_policy(), policy)
+        self.assertIn('amp-img', policy.tags)
+        self.assertTrue(policy.allows_attribute('a', 'href'))
+        self.assertTrue(policy.allows_attribute('a', 'animate-in'))
+        self.assertTrue(policy.allows_attribute('a', 'data-vars-foo'))
+        self.assertFalse(policy.allows_attribute('a', 'data-vars-foo!'))
+        self.assertFalse(policy.allows_attribute('a', 'onclick'))
+        self.assertFalse(policy.allows_attribute('blink', 'id'))
+        self.assertTrue(policy.allows_script('application/json'))
+        self.assertFalse(policy.allows_script(None))
+
+        # animation attributes are no longer appended to the global attributes list
+        self.assertNotIn('animate-in', cleaner.GLOBAL_ATTRIBUTES)
+
+    def test_immutable(self):
+        policy = default_policy()
+        with self.assertRaises(AttributeError):
+            policy.tags = frozenset()
+        with self.assertRaises(AttributeError):
+            del policy.fingerprint
+
+        copied_policy = pickle.loads(pickle.dumps(policy))
+        self.assertEqual(copied_policy.fingerprint, policy.fingerprint)
+
+    def test_bleach_style_rules(self):
+        policy = SanitizationPolicy(
+            tags=['a', 'img'],
+            attributes={
+                'a': ['href'],
+                'img': lambda tag, name, value: name == 'src' and value.endswith('.png'),
+                '*': ['title'],
+            }
+        )
+        self.assertTrue(policy.allows_attribute('a', 'href'))
+        self.assertTrue(policy.allows_attribute('a', 'title'))
+        self.assertFalse(policy.allows_attribute('a', 'data-foo'))
+        self.assertTrue(policy.allows_attribute('img', 'src', 'a.png'))
+        self.assertFalse(policy.allows_attribute('img', 'src', 'a.gif'))
+        self.assertFalse(policy.allows_attribute('img', 'title'))
+
+        html = '<a href="/" title="x" class="y"><img src="a.png"><img src="a.gif"><b>z</b></a>'
+        self.assertEqual(
+            StoryPage.clean_html_fragment(html, policy=policy),
+            '<a href="/" title="x"><img src="a.png"><img>z</a>'
+        )
+        self.assertEqual(
+            StoryPage.clean_html_fragment(html, policy=policy, engine='bleach'),
+            StoryPage.clean_html_fragment(html, policy=policy)
+        )
+        self.assertEqual(
+            StoryPageCleaner(policy).clean(html),
+            StoryPage.clean_html_fragment(html, policy=policy)
+        )
+
+    def test_derive(self):
+        base_policy = default_policy()
+        svg_policy = base_policy.derive(
+            tags=SVG_TAGS,
+            attributes={'svg': ['viewBox'], 'path': ['d'], 'h1': ['onclick']},
+        )
+        self.assertNotEqual(svg_policy.fingerprint, base_policy.fingerprint)
+        self.assertTrue(svg_policy.allows_attribute('path', 'd'))
+        self.assertTrue(svg_policy.allows_attribute('path', 'class'))
+        self.assertTrue(svg_policy.allows_attribute('h1', 'onclick'))
+        self.assertTrue(svg_policy.allows_attribute('h1', 'data-foo'))
+
+        # neither the base policy nor the module globals are affected
+        self.assertFalse(base_policy.allows_attribute('h1', 'onclick'))
+        self.assertNotIn('svg', cleaner.ALLOWED_STORY_PAGE_TAGS)
+        self.assertNotIn('onclick', cleaner.ALLOWED_STORY_PAGE_ATTRIBUTES['h1'].allowed_attributes)
+
+        html = (
+            '<amp-story-page id="p"><svg viewBox="0 0 1 1" onload="x">'
+            '<path d="M0" onclick="y"/></svg></amp-story-page>'
+        )
+        self.assertEqual(
+            StoryPage.clean_html_fragment(html, policy=svg_policy),
+            '<amp-story-page id="p"><svg viewBox="0 0 1 1"><path d="M0"></path></svg></amp-story-page>'
+        )
+        self.assertEqual(
+            StoryPage.clean_html_fragment(html),
+            '<amp-story-page id="p"></amp-story-page>'
+        )
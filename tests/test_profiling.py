@@ -0,0 +1,79 @@
+import unittest
+
+from webstories import Story
+from webstories.cache import LRUCache, get_default_cache, set_default_cache
+from webstories.profiling import PhaseStats, add_hook, profile, remove_hook
+
+from .test_story import TestStory
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        example = TestStory()
+        example.setUp()
+        self.html = example.example_html
+        self.original_cache = get_default_cache()
+        set_default_cache(LRUCache())
+
+    def tearDown(self):
+        set_default_cache(self.original_cache)
+
+    def test_hook(self):
+        calls = []
+
+        def hook(phase, duration, size, page_id):
+            calls.append((phase, size, page_id))
+
+        add_hook(hook)
+        try:
+            story = Story(self.html, backend='html.parser')
+            story.pages[1].get_clean_html(backend='html.parser')
+        finally:
+            remove_hook(hook)
+
+        page_size = len(story.pages[1].html)
+        self.assertEqual(calls, [
+            ('parse_story', len(self.html), None),
+            ('cache_lookup', page_size, 'page1'),
+            ('parse_fragment', page_size, 'page1'),
+            ('clean_native', page_size, 'page1'),
+        ])
+
+        # no calls once the hook is removed
+        Story(self.html).pages[0].get_clean_html(engine='bleach')
+        self.assertEqual(len(calls), 4)
+
+    def test_profile(self):
+        with profile() as stats:
+            story = Story(self.html, lazy=True)
+            for page in story.pages:
+                page.get_clean_html(engine='bleach')
+            for page in story.pages:
+                page.get_clean_html(engine='bleach')
+
+        summary = stats.summary()
+        self.assertEqual(summary['parse_story']['count'], 1)
+        self.assertEqual(summary['parse_pages']['count'], 1)
+        self.assertEqual(summary['cache_lookup']['count'], 2 * len(story.pages))
+        for phase in ('parse_fragment', 'strip_scripts', 'serialize', 'clean_bleach'):
+            self.assertEqual(summary[phase]['count'], len(story.pages))
+        self.assertNotIn('clean_native', summary)
+        self.assertEqual(summary['parse_story']['size'], len(self.html))
+        self.assertLessEqual(summary['clean_bleach']['p50'], summary['clean_bleach']['p99'])
+
+    def test_percentiles(self):
+        stats = PhaseStats()
+        for duration in (4, 1, 3, 2, 5):
+            stats('clean_native', duration, None, None)
+
+        self.assertEqual(stats.percentile('clean_native', 0), 1)
+        self.assertEqual(stats.percentile('clean_native', 50), 3)
+        self.assertEqual(stats.percentile('clean_native', 90), 4.6)
+        self.assertEqual(stats.percentile('clean_native', 100), 5)
+        self.assertIsNone(stats.percentile('parse_story', 50))
+        self.assertEqual(stats.summary(percentiles=(50,)), {
+            'clean_native': {'count': 5, 'total': 15, 'size': 0, 'p50': 3},
+        })
+
+        stats.reset()
+        self.assertEqual(stats.summary(), {})
@@ -0,0 +1,93 @@
+import unittest
+
+from benchmarks.corpus import generate_story
+from webstories import Story, StoryPage, serialization
+from webstories.backends import BACKENDS
+from webstories.cache import get_default_cache, set_default_cache
+from webstories.profiling import profile
+
+
+class TestSerialization(unittest.TestCase):
+    def setUp(self):
+        self.html = generate_story(pages=4, css_size=500, media_density=1.0, hostile_density=0.5)
+        self.original_cache = get_default_cache()
+        set_default_cache(None)
+
+    def tearDown(self):
+        set_default_cache(self.original_cache)
+
+    def test_story_round_trip(self):
+        for backend in BACKENDS:
+            if not BACKENDS[backend].is_available():
+                continue
+            story = Story(self.html, backend=backend)
+            for compress in (True, False):
+                with self.subTest(backend=backend, compress=compress):
+                    loaded = Story.from_bytes(story.to_bytes(compress=compress))
+                    for field in (
+                        'title', 'publisher', 'publisher_logo_src', 'poster_portrait_src',
+                        'poster_square_src', 'poster_landscape_src', 'custom_css',
+                    ):
+                        self.assertEqual(getattr(loaded, field), getattr(story, field))
+                    self.assertEqual(
+                        [(page.id, page.html, page.span) for page in loaded.pages],
+                        [(page.id, page.html, page.span) for page in story.pages]
+                    )
+                    self.assertEqual(loaded.assets, story.assets)
+                    self.assertEqual(loaded.manifest(), story.manifest())
+                    self.assertEqual(
+                        str(loaded.get_optimized_css()), str(story.get_optimized_css())
+                    )
+                    self.assertEqual(
+                        loaded.pages[0].get_clean_html(), story.pages[0].get_clean_html()
+                    )
+
+        # pages are stored as spans of the document where possible, rather than copies of it
+        loaded = Story.from_bytes(Story(self.html, backend='html.parser').to_bytes())
+        self.assertIs(loaded.pages[0]._source, loaded._html)
+
+    def test_clean_html(self):
+        story = Story(self.html)
+        expected = [page.get_clean_html() for page in story.pages]
+        loaded = Story.from_bytes(story.to_bytes(clean=True))
+
+        with profile() as stats:
+            self.assertEqual([page.get_clean_html() for page in loaded.pages], expected)
+        self.assertEqual(stats.phases(), [])
+
+        # stored clean HTML is only used for the options it was produced with
+        with profile() as stats:
+            self.assertEqual(
+                [page.get_clean_html(compact=True) for page in loaded.pages],
+                [page.get_clean_html(compact=True) for page in story.pages]
+            )
+        self.assertIn('parse_fragment', stats.phases())
+
+    def test_page_round_trip(self):
+        page = Story(self.html).pages[1]
+        loaded = StoryPage.from_bytes(page.to_bytes())
+        self.assertEqual((loaded.id, loaded.html), (page.id, page.html))
+        self.assertEqual(loaded.fingerprint, page.fingerprint)
+
+        loaded = StoryPage.from_bytes(page.to_bytes(clean=True, compress=False))
+        self.assertEqual(loaded._stored_clean[1], page.get_clean_html())
+        self.assertEqual(loaded.get_clean_html(), page.get_clean_html())
+
+    def test_invalid_data(self):
+        story = Story(self.html)
+        data = story.to_bytes(compress=False)
+        invalid_data = [
+            b'',
+            b'<html>' + data,
+            data[:4] + bytes([serialization.FORMAT_VERSION + 1]) + data[5:],
+            data[:-1],
+            data + b'\x00',
+            story.to_bytes()[:-10],
+            story.pages[0].to_bytes(),
+        ]
+        for value in invalid_data:
+            with self.assertRaises(ValueError):
+                Story.from_bytes(value)
+
+        with self.assertRaises(ValueError):
+            StoryPage.from_bytes(data)
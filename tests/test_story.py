@@ -1,7 +1,10 @@
 import unittest
+from unittest import mock
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 
-from webstories import Story, StoryPage
+import webstories
+from webstories import Story, StoryPage, clean_many
 
 
 class TestStory(unittest.TestCase):
@@ -176,3 +179,159 @@ class TestStory(unittest.TestCase):
             </amp-story-page>
         """
         self.assertHTMLEqual(StoryPage.clean_html_fragment(bad_html), self.expected_clean_html_bad)
+
+    def test_clean_html_engines_match(self):
+        for html in (self.example_html, self.example_bad_html):
+            for page in Story(html).pages:
+                self.assertEqual(page.get_clean_html(), page.get_clean_html(engine='bleach'))
+
+        fragments = [
+            """<amp-story-page id="p"><p title='say "hi"' class="a  b" style="color: red">x &amp; y &lt; z</p></amp-story-page>""",
+            """<amp-story-page id="p"><a href="javascript:alert(1)" title="&amp;copy;">link</a><br/><wbr/></amp-story-page>""",
+            """<amp-story-page id="p"><pre>\nkeep\n</pre><noscript><p>raw</p></noscript><!-- comment --></amp-story-page>""",
+            """<amp-story-page id="p"><script type="text/plain" async="async">a &amp; b < c</script></amp-story-page>""",
+            # markup that html5lib restructures, handled by falling back on bleach
+            """<amp-story-page id="p"><p>para<div>block</div></p><ul><li>one<li>two</ul></amp-story-page>""",
+            """<amp-story-page id="p"><table><tr><td>cell</td></tr></table></amp-story-page>""",
+            # <template> is not a scoping element in the html5lib version bundled with bleach
+            """<amp-story-page id="p"><a href="/x"><template><a href="/y">y</a></template></a></amp-story-page>""",
+            """<amp-story-page id="p"><button><template><button>b</button></template></button></amp-story-page>""",
+        ]
+        for html in fragments:
+            self.assertEqual(
+                StoryPage.clean_html_fragment(html),
+                StoryPage.clean_html_fragment(html, engine='bleach')
+            )
+
+    def test_clean_html_compact(self):
+        html = """
+            <amp-story-page id="p">
+                <amp-story-grid-layer template="vertical">
+                    <h1>  The   Joy of
+                        Pets  </h1>
+                    <p>By <b>AMP</b> <i> Tutorials </i>&amp;  friends</p>
+                    <pre>
+  keep   this
+</pre>
+                    <script type="application/json">{"a":  [1,
+                        2]}</script>
+                </amp-story-grid-layer>
+            </amp-story-page>
+        """
+        expected = (
+            '<amp-story-page id="p"><amp-story-grid-layer template="vertical">'
+            '<h1>The Joy of Pets</h1>'
+            '<p>By <b>AMP</b> <i> Tutorials </i>&amp; friends</p>'
+            '<pre>  keep   this\n</pre>'
+            '<script type="application/json">{"a":  [1,\n                        2]}</script>'
+            '</amp-story-grid-layer></amp-story-page>'
+        )
+        for engine in ('native', 'bleach'):
+            self.assertEqual(
+                StoryPage.clean_html_fragment(html, engine=engine, compact=True), expected
+            )
+
+        # compact output is cached separately
+        self.assertNotEqual(StoryPage.clean_html_fragment(html), expected)
+
+        for html in (self.example_html, self.example_bad_html):
+            story = Story(html)
+            expected = [page.get_clean_html(compact=True) for page in story.pages]
+            self.assertEqual(
+                [page.get_clean_html(engine='bleach', compact=True) for page in story.pages],
+                expected
+            )
+            self.assertEqual(story.get_clean_pages(workers=2, compact=True), expected)
+
+    def test_clean_html_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            StoryPage.clean_html_fragment("<amp-story-page></amp-story-page>", engine='regex')
+
+    def test_lazy_properties(self):
+        for html in (self.example_html, self.example_bad_html, self.example_html.encode('utf-8')):
+            eager = Story(html)
+            lazy = Story(html, lazy=True)
+            for attr in (
+                'title', 'publisher', 'publisher_logo_src', 'poster_portrait_src',
+                'poster_square_src', 'poster_landscape_src', 'custom_css',
+            ):
+                self.assertEqual(getattr(lazy, attr), getattr(eager, attr))
+
+            self.assertIsNone(lazy._pages)
+            self.assertEqual([page.id for page in lazy.pages], [page.id for page in eager.pages])
+            self.assertEqual(lazy.pages[0].get_clean_html(), eager.pages[0].get_clean_html())
+
+    def test_lazy_reject_invalid_story(self):
+        with self.assertRaises(Story.InvalidStoryException):
+            Story("<!doctype html><html><head></head><body><p>Not a story</p></body></html>", lazy=True)
+
+    def test_page_html_is_source_span(self):
+        story = Story(self.example_html, backend='html.parser')
+        page = story.pages[1]
+        start, end = page.span
+        self.assertEqual(page.html, self.example_html[start:end])
+        self.assertTrue(page.html.startswith('<amp-story-page id="page1">'))
+        self.assertTrue(page.html.endswith('</amp-story-page>'))
+        self.assertFalse(hasattr(page, '__dict__'))
+
+    def test_unclosed_pages(self):
+        story = Story(
+            '<amp-story title="Unclosed"><amp-story-page id="one"><p>One</p></amp-story>'
+            '<amp-story-page id="not-in-story"></amp-story-page>',
+            backend='html.parser'
+        )
+        self.assertEqual([page.id for page in story.pages], ["one"])
+        self.assertEqual(story.pages[0].html, '<amp-story-page id="one"><p>One</p>')
+        self.assertEqual(
+            story.pages[0].get_clean_html(), '<amp-story-page id="one"><p>One</p></amp-story-page>'
+        )
+
+    def test_get_clean_pages(self):
+        story = Story(self.example_bad_html)
+        expected = [page.get_clean_html() for page in story.pages]
+        for executor in ('process', 'thread'):
+            self.assertEqual(story.get_clean_pages(workers=2, executor=executor), expected)
+        self.assertEqual(story.get_clean_pages(workers=1), expected)
+
+        # pages are cleaned in the current thread unless workers is given, and a story of
+        # chunk_size pages or fewer is cleaned without starting a pool
+        story = Story('<html><body><amp-story>%s</amp-story></body></html>' % ''.join(
+            '<amp-story-page id="p%d"><p onclick="x">%d</p></amp-story-page>' % (i, i)
+            for i in range(3)
+        ))
+        expected = [page.get_clean_html() for page in story.pages]
+        with mock.patch('os.cpu_count', return_value=4):
+            with mock.patch('webstories.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as pool:
+                self.assertEqual(story.get_clean_pages(chunk_size=1, executor='thread'), expected)
+                self.assertEqual(story.get_clean_pages(workers=None, executor='thread'), expected)
+                pool.assert_not_called()
+                self.assertEqual(
+                    story.get_clean_pages(workers=None, executor='thread', chunk_size=1), expected
+                )
+                pool.assert_called_once_with(max_workers=3)
+
+        # the process pool is reused between calls
+        self.assertEqual(story.get_clean_pages(workers=2, chunk_size=1), expected)
+        process_pool = webstories._process_pools[2]
+        self.assertEqual(story.get_clean_pages(workers=2, chunk_size=1), expected)
+        self.assertIs(webstories._process_pools[2], process_pool)
+
+    def test_clean_many(self):
+        htmls = [
+            '<amp-story-page id="p%d"><p onclick="x">%d</p></amp-story-page>' % (i, i)
+            for i in range(25)
+        ]
+        expected = ['<amp-story-page id="p%d"><p>%d</p></amp-story-page>' % (i, i) for i in range(25)]
+
+        # input is consumed lazily, and results are returned in order
+        results = clean_many(iter(htmls), workers=2, executor='thread', chunk_size=3)
+        self.assertEqual(next(results), expected[0])
+        self.assertEqual(list(results), expected[1:])
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(list(clean_many(htmls, executor=executor, chunk_size=4)), expected)
+            # the passed executor is left running
+            self.assertEqual(executor.submit(len, 'abc').result(), 3)
+
+        with self.assertRaises(ValueError):
+            clean_many(htmls, executor='gpu')
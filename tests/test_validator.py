@@ -0,0 +1,88 @@
+import unittest
+
+from webstories import Story
+from webstories.cleaner import default_policy
+from webstories.validator import Violation, validate_html
+
+from .test_story import TestStory
+
+
+class TestValidator(unittest.TestCase):
+    def setUp(self):
+        example = TestStory()
+        example.setUp()
+        self.example = example
+
+    def test_clean_pages(self):
+        story = Story(self.example.example_html)
+        self.assertTrue(story.pages[1].is_clean())
+        self.assertEqual(story.pages[1].validate(), [])
+
+        # pages that cleaning leaves intact validate
+        for html in [page.get_clean_html() for page in story.pages]:
+            self.assertEqual(validate_html(html), [])
+
+    def test_violations(self):
+        story = Story(self.example.example_bad_html)
+        page = story.pages[0]
+        self.assertFalse(page.is_clean())
+        self.assertEqual(page.validate(), [
+            Violation(
+                'disallowed_attribute', '/amp-story-page/amp-story-grid-layer',
+                'amp-story-grid-layer', 'sugar'
+            ),
+            Violation('disallowed_script', '/amp-story-page/amp-story-grid-layer/script', 'script'),
+            Violation('disallowed_tag', '/amp-story-page/amp-story-grid-layer[2]/form', 'form'),
+        ])
+        self.assertEqual(page.validate(first_only=True), page.validate()[:1])
+
+    def test_attribute_values(self):
+        html = (
+            '<amp-story-page id="p"><a href="javascript:alert(1)">x</a><a href="/ok">y</a>'
+            '<p style="color: red">z</p><p class="a" class="b"></p></amp-story-page>'
+        )
+        self.assertEqual(validate_html(html), [
+            Violation('disallowed_value', '/amp-story-page/a', 'a', 'href'),
+            Violation('disallowed_value', '/amp-story-page/p', 'p', 'style'),
+            Violation('duplicate_attribute', '/amp-story-page/p[2]', 'p', 'class'),
+        ])
+
+        policy = default_policy().derive(styles=['color'])
+        self.assertEqual(len(validate_html(html, policy=policy)), 2)
+
+    def test_unsafe_markup(self):
+        fragments = [
+            '<amp-story-page id="p"><!-- comment --></amp-story-page>',
+            '<amp-story-page id="p"><p>unterminated <!-- comment</p>',
+            '<amp-story-page id="p"><script type="application/json">"<!--<script>"</script>',
+            '<amp-story-page id="p"><noscript><p title="</noscript><b onclick=1>"></p></noscript>',
+            '<amp-story-page id="p"><![CDATA[x]]></amp-story-page>',
+        ]
+        for html in fragments:
+            with self.subTest(html=html):
+                self.assertNotEqual(validate_html(html), [])
+
+    def test_unclosed_raw_text(self):
+        # served as-is, these would take in the rest of the document as text
+        html = '<amp-story-page id="p"><script type="application/json">{}</amp-story-page>'
+        self.assertEqual(
+            validate_html(html), [Violation('unsafe_text', '/amp-story-page/script', 'script')]
+        )
+        self.assertEqual(
+            validate_html('<amp-story-page id="p"><noscript>x'),
+            [Violation('unsafe_text', '/amp-story-page/noscript', 'noscript')]
+        )
+
+    def test_noscript_markup(self):
+        # cleaning escapes markup within <noscript> as text
+        html = '<amp-story-page id="p"><noscript><p>x</p></b></noscript></amp-story-page>'
+        self.assertEqual(
+            validate_html(html), [
+                Violation('noscript_markup', '/amp-story-page/noscript/p', 'p'),
+                Violation('noscript_markup', '/amp-story-page/noscript'),
+            ]
+        )
+        self.assertEqual(
+            validate_html('<amp-story-page id="p"><noscript>x &amp; y</noscript></amp-story-page>'),
+            []
+        )
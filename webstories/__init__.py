@@ -1,34 +1,248 @@
-import copy
-from bs4 import BeautifulSoup
+import os
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 
-from .cleaner import StoryPageCleaner
+from . import serialization
+from .assets import node_assets, story_assets, unique_assets
+from .backends import get_backend
+from .cleaner import (
+    SanitizationPolicy, StoryPageCleaner, StoryPageTreeCleaner, cleaner_pool, default_policy
+)
+from .cache import get_default_cache, variant_key
+from .css import SelectorIndex, prune_css
+from .document import DOCUMENT_END, document_head, required_extensions, story_start_tag
+from .limits import (
+    InvalidStoryException, LimitExceeded, StoryLimits, get_default_limits, set_default_limits
+)
+from .manifest import StoryDiff, StoryManifest, fingerprint
+from .parser import decode_html, may_be_story
+from .profiling import record, start_timer
+from .validator import validate_html
 
 
 class Story:
-    class InvalidStoryException(ValueError):
-        pass
+    InvalidStoryException = InvalidStoryException
+    LimitExceeded = LimitExceeded
 
-    def __init__(self, html):
-        self._dom = BeautifulSoup(html, 'html.parser')
-        self._story_node = self._dom.find('amp-story')
+    def __init__(self, html, lazy=False, backend=None, limits=None):
+        """
+        Parse the passed HTML document as a web story. If lazy is true, parsing stops as soon as
+        the story metadata and custom CSS have been found, and the rest of the document is only
+        parsed on first access to `pages`. backend is the name of the parser backend to use (see
+        webstories.backends), defaulting to the module-level default. limits is a StoryLimits
+        object to enforce while parsing, defaulting to the one set by set_default_limits;
+        documents that exceed it raise Story.LimitExceeded.
+        """
+        if limits is None:
+            limits = get_default_limits()
+        if limits is not None:
+            limits.check('max_bytes', len(html))
+        self._html = decode_html(html)
+        if not may_be_story(self._html):
+            raise Story.InvalidStoryException("The passed HTML is not a valid web story")
+
+        self._backend = get_backend(backend)
+        self._limits = limits
+        self._pages = None
+        self._selector_index = None
 
-        if not self._story_node:
+        start = start_timer()
+        parser = self._backend.parse_story(self._html, metadata_only=lazy, limits=limits)
+        record('parse_story', start, len(self._html))
+        if parser.story_attrs is None:
             raise Story.InvalidStoryException("The passed HTML is not a valid web story")
+        if not lazy:
+            self._pages = self._pages_from_parser(parser)
+        self._set_story_attrs(parser.story_attrs, parser.custom_css)
+
+    def _set_story_attrs(self, story_attrs, custom_css):
+        self._story_attrs = story_attrs
+        self.title = story_attrs.get('title')
+        self.publisher = story_attrs.get('publisher')
+        self.publisher_logo_src = story_attrs.get('publisher-logo-src')
+        self.poster_portrait_src = story_attrs.get('poster-portrait-src')
+        self.poster_square_src = story_attrs.get('poster-square-src')
+        self.poster_landscape_src = story_attrs.get('poster-landscape-src')
+
+        self.custom_css = custom_css
+        self._story_assets = story_assets(story_attrs)
+
+    def _pages_from_parser(self, parser):
+        return [
+            StoryPage(source, start, end, id, assets)
+            for source, start, end, id, assets in parser.pages
+        ]
+
+    @property
+    def pages(self):
+        if self._pages is None:
+            start = start_timer()
+            parser = self._backend.parse_story(self._html, limits=self._limits)
+            record('parse_pages', start, len(self._html))
+            self._pages = self._pages_from_parser(parser)
+        return self._pages
+
+    @property
+    def assets(self):
+        """
+        A list of the Assets referenced by the story metadata and its pages, in document order,
+        with only the first of any with the same URL
+        """
+        return unique_assets(
+            self._story_assets + [asset for page in self.pages for asset in page.assets]
+        )
+
+    def get_optimized_css(self):
+        """
+        Return an OptimizedCSS object for custom_css with the rules that cannot match any element
+        of the story removed (or None if there is no custom CSS), counting the elements that the
+        AMP runtime renders, such as the <img> within an <amp-img>. Its css attribute is the new
+        stylesheet, and savings the reduction in size, in bytes.
+        """
+        if self.custom_css is None:
+            return None
+        if self._selector_index is None:
+            self._selector_index = SelectorIndex.build(self._html)
+        return prune_css(self.custom_css, self._selector_index)
+
+    def get_clean_pages(
+        self, engine='native', policy=None, workers=1, executor='process', chunk_size=8,
+        backend=None, compact=False
+    ):
+        """
+        Return a list of the AMP-cleaned HTML of each page, as per StoryPage.get_clean_html. By
+        default, pages are cleaned one after another in the current thread; cleaning is pure
+        Python, so spreading it over threads gives no speedup.
+
+        If workers is greater than 1 (or None, for the number of CPUs), chunks of chunk_size
+        pages are cleaned in parallel as per clean_many, over a process pool of that many
+        workers that is started on first use and reused by later calls. No more workers are
+        used than there are chunks, so a story of chunk_size pages or fewer is always cleaned
+        in the current thread. On platforms that spawn worker processes (Windows and macOS), the
+        calling script must be guarded by `if __name__ == '__main__'`. executor may also be
+        'thread' or an existing concurrent.futures.Executor, as per clean_many.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, -(-len(self.pages) // max(chunk_size, 1)))
+        if executor == 'process' and workers > 1:
+            executor = _shared_process_pool(workers)
+        return list(clean_many(
+            (page.html for page in self.pages), workers=workers, executor=executor,
+            chunk_size=chunk_size, engine=engine, policy=policy, backend=backend, compact=compact,
+        ))
+
+    def iter_amp_html(
+        self, engine='native', policy=None, backend=None, compact=False, canonical_url=None,
+        optimize_css=False
+    ):
+        """
+        Generate a standalone AMP story document for this story, as a sequence of strings: the
+        document head, then the <amp-story> start tag, then the clean HTML of each page (as per
+        StoryPage.get_clean_html) as soon as it is produced, then the end of the document.
+        Suitable for passing to a streaming HTTP response once encoded.
+
+        The head includes the AMP boilerplate, the custom CSS (with unused rules removed, if
+        optimize_css is true), a canonical link to canonical_url if given (which AMP requires),
+        and a script for each extension used by the allowed elements of the pages; these are
+        found by scanning the page source before cleaning any of them, as the scripts must
+        precede the pages. Only the attributes of the original <amp-story> element that the
+        policy allows on it are kept, with their values cleaned as for elements within pages.
+        """
+        if policy is None:
+            policy = default_policy()
+        pages = self.pages
+        css = self.custom_css
+        if optimize_css and css is not None:
+            css = self.get_optimized_css().css
+
+        yield document_head(
+            self.title, required_extensions((page.html for page in pages), policy), css=css,
+            canonical_url=canonical_url
+        )
+        yield story_start_tag(self._story_attrs, policy) + '\n'
+        for page in pages:
+            yield page.get_clean_html(
+                engine=engine, policy=policy, backend=backend, compact=compact
+            ) + '\n'
+        yield DOCUMENT_END
+
+    def to_bytes(
+        self, clean=False, engine='native', policy=None, backend=None, compact=False,
+        compress=True
+    ):
+        """
+        Return this story in a compact binary form that Story.from_bytes can load without
+        re-parsing it: the attributes of the <amp-story> element, the custom CSS, the source
+        document and the id, HTML and assets of each page. If clean is true, the clean HTML of
+        each page (as per StoryPage.get_clean_html with the given options) is included too, and
+        returned by get_clean_html on the loaded pages when called with the same options; it is
+        left out if the policy is not cacheable. If compress is true, the data is compressed with
+        zlib.
+        """
+        variant = variant_key(engine, policy, backend, compact) if clean else None
+        writer = serialization.Writer(serialization.STORY)
+        writer.string(self._backend.name)
+        writer.uint(len(self._story_attrs))
+        for name, value in self._story_attrs.items():
+            writer.string(name)
+            writer.string(value)
+        writer.string(self.custom_css)
+        writer.string(self._html)
+        writer.string(variant)
+        writer.uint(len(self.pages))
+        for page in self.pages:
+            page._write(writer, self._html, variant and page.get_clean_html(
+                engine=engine, policy=policy, backend=backend, compact=compact
+            ))
+        return writer.getvalue(compress=compress)
 
-        self.title = self._story_node.get('title')
-        self.publisher = self._story_node.get('publisher')
-        self.publisher_logo_src = self._story_node.get('publisher-logo-src')
-        self.poster_portrait_src = self._story_node.get('poster-portrait-src')
-        self.poster_square_src = self._story_node.get('poster-square-src')
-        self.poster_landscape_src = self._story_node.get('poster-landscape-src')
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Load a story from the output of Story.to_bytes. Raises ValueError if the data is invalid
+        or was written by an incompatible version of this package.
+        """
+        reader = serialization.Reader(data, serialization.STORY)
+        story = cls.__new__(cls)
+        backend_name = reader.string()
+        try:
+            story._backend = get_backend(backend_name)
+        except ValueError:
+            # not installed here
+            story._backend = get_backend()
+        story._limits = get_default_limits()
+        story._selector_index = None
 
-        self.pages = [
-            StoryPage(node)
-            for node in self._story_node.find_all('amp-story-page', recursive=False)
+        story_attrs = {}
+        for i in range(reader.uint()):
+            name = reader.string()
+            story_attrs[name] = reader.string()
+        custom_css = reader.string()
+        story._html = reader.string()
+        story._set_story_attrs(story_attrs, custom_css)
+
+        variant = reader.string()
+        story._pages = [
+            StoryPage._read(reader, story._html, variant) for i in range(reader.uint())
         ]
+        reader.finish()
+        return story
+
+    def manifest(self):
+        """
+        Return a StoryManifest recording this story's metadata and page fingerprints
+        """
+        return StoryManifest.from_story(self)
 
-        custom_css_node = self._dom.find('style', attrs={'amp-custom': True})
-        self.custom_css = custom_css_node and custom_css_node.string
+    def diff(self, previous):
+        """
+        Compare this story against an earlier version of it, given as a Story or StoryManifest,
+        returning a StoryDiff of the added, removed, changed and reordered pages
+        """
+        return StoryDiff(self, previous)
 
     def __str__(self):
         return "<Story: %s>" % self.title
@@ -38,48 +252,433 @@ class Story:
 
 
 class StoryPage:
-    def __init__(self, node):
-        self._node = node
+    __slots__ = (
+        '_source', '_start', '_end', 'id', '_fingerprint', '_assets', '_assets_data',
+        '_stored_clean',
+    )
 
-        self.id = self._node.get('id')
+    def __init__(self, source, start=0, end=None, id=None, assets=None):
+        """
+        A page of a story, located by its span within the source HTML of the story document.
+        The source string is shared between pages rather than copied. If start is None, the
+        source is the page's own HTML (as re-serialized by a parser backend) rather than the
+        story document. assets is the list of Assets referenced by the page, if already known.
+        """
+        self._source = source
+        self._start = start
+        self._end = len(source) if end is None else end
+        self.id = id
+        self._fingerprint = None
+        self._assets = assets
+        # assets and (variant_key, clean HTML) loaded by from_bytes
+        self._assets_data = None
+        self._stored_clean = None
 
     @property
     def html(self):
-        return str(self._node)
+        return self._source[self._start:self._end]
 
-    def get_clean_html(self):
-        # reject <script> tags without an allowed type attribute, as per
-        # https://amp.dev/documentation/guides-and-tutorials/learn/spec/amphtml/?format=websites#html-tags
-        # (we can't do this within a bleach Cleaner instance)
-        node = copy.copy(self._node)
-        return StoryPage._clean_html_from_node(node)
+    @property
+    def span(self):
+        """
+        The (start, end) character offsets of this page within the story document, or None if
+        its HTML was re-serialized by the parser backend rather than taken from the document
+        """
+        if self._start is None:
+            return None
+        return (self._start, self._end)
+
+    @property
+    def assets(self):
+        """
+        A list of the Assets referenced by this page, in document order, with only the first of
+        any with the same URL
+        """
+        if self._assets is None and self._assets_data is not None:
+            self._assets = serialization.load_assets(self._assets_data, self.id)
+            self._assets_data = None
+        elif self._assets is None:
+            node = get_backend().parse_fragment(self.html).find('amp-story-page')
+            self._assets = [] if node is None else node_assets(node, self.id)
+        return unique_assets(self._assets)
+
+    @property
+    def fingerprint(self):
+        """
+        A stable hash of this page's id and HTML. As the HTML is re-serialized by the lxml and
+        html5lib backends (but not by html.parser, the default), fingerprints should be compared
+        between stories parsed with the same backend.
+        """
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self.id, self.html)
+        return self._fingerprint
+
+    def get_clean_html(self, engine='native', policy=None, backend=None, compact=False):
+        """
+        Return the AMP-cleaned version of this page, as an HTML string. engine may be 'native' (the
+        default) to sanitize the parsed page in a single pass, or 'bleach' to serialize it and
+        re-parse it through bleach. policy is a SanitizationPolicy to clean with, defaulting to
+        the allowlists in webstories.cleaner. backend is the name of the parser backend to parse
+        the page with. If compact is true, whitespace that does not affect rendering is removed
+        from the output, leaving that within <pre>, <textarea> and <script> elements intact.
+        """
+        if self._stored_clean is not None:
+            variant, clean_html = self._stored_clean
+            if variant == variant_key(engine, policy, backend, compact):
+                return clean_html
+        return StoryPage._clean_html_cached(
+            self.html, engine=engine, policy=policy, backend=backend, page_id=self.id,
+            compact=compact
+        )
+
+    def to_bytes(
+        self, clean=False, engine='native', policy=None, backend=None, compact=False,
+        compress=True
+    ):
+        """
+        Return this page's id, HTML and assets (and, if clean is true, its clean HTML) in the
+        binary form described in Story.to_bytes, to be loaded with StoryPage.from_bytes
+        """
+        variant = variant_key(engine, policy, backend, compact) if clean else None
+        writer = serialization.Writer(serialization.PAGE)
+        writer.string(variant)
+        self._write(writer, None, variant and self.get_clean_html(
+            engine=engine, policy=policy, backend=backend, compact=compact
+        ))
+        return writer.getvalue(compress=compress)
+
+    @classmethod
+    def from_bytes(cls, data):
+        reader = serialization.Reader(data, serialization.PAGE)
+        variant = reader.string()
+        page = cls._read(reader, None, variant)
+        reader.finish()
+        return page
+
+    def _write(self, writer, document, clean_html):
+        writer.string(self.id)
+        if document is not None and self._source is document:
+            writer.uint(serialization.PAGE_SPAN)
+            writer.uint(self._start)
+            writer.uint(self._end)
+        else:
+            writer.uint(serialization.PAGE_HTML)
+            writer.string(self.html)
+        if self._assets is None:
+            writer.string(self._assets_data)
+        else:
+            writer.string(serialization.dump_assets(self._assets))
+        if clean_html is not None:
+            writer.string(clean_html)
+
+    @classmethod
+    def _read(cls, reader, document, variant):
+        id = reader.string()
+        storage = reader.uint()
+        if storage == serialization.PAGE_SPAN:
+            start = reader.uint()
+            end = reader.uint()
+            if document is None or not start <= end <= len(document):
+                raise ValueError("Invalid page span")
+            page = cls(document, start, end, id)
+        elif storage == serialization.PAGE_HTML:
+            html = reader.string()
+            if html is None:
+                raise ValueError("Missing page HTML")
+            page = cls(html, None, None, id)
+        else:
+            raise ValueError("Invalid page storage type: %r" % storage)
+        page._assets_data = reader.string()
+        if variant is not None:
+            page._stored_clean = (variant, reader.string())
+        return page
+
+    def validate(self, policy=None, first_only=False):
+        """
+        Return a list of the parts of this page that cleaning would remove or alter, as
+        webstories.validator.Violation objects, without cleaning it. If first_only is true,
+        checking stops at the first violation.
+        """
+        start = start_timer()
+        violations = validate_html(self.html, policy=policy, first_only=first_only)
+        record('validate', start, self._end - (self._start or 0), self.id)
+        return violations
+
+    def is_clean(self, policy=None):
+        """
+        Return whether this page contains only markup allowed by the policy (defaulting to the
+        allowlists in webstories.cleaner), in which case its original HTML can be used in place
+        of get_clean_html()
+        """
+        return not self.validate(policy=policy, first_only=True)
 
     @staticmethod
-    def clean_html_fragment(html):
+    def clean_html_fragment(html, engine='native', policy=None, backend=None, compact=False):
         """
         Given an HTML fragment with <amp-story-page> as its root element, return a version with
-        non-AMP-valid tags removed
+        non-AMP-valid tags removed. Results are cached in the cache returned by
+        webstories.cache.get_default_cache().
         """
-        node = BeautifulSoup(html, 'html.parser')
-        return StoryPage._clean_html_from_node(node)
+        return StoryPage._clean_html_cached(
+            html, engine=engine, policy=policy, backend=backend, compact=compact
+        )
 
     @staticmethod
-    def _clean_html_from_node(node):
+    def _clean_html_cached(
+        html, engine='native', policy=None, backend=None, page_id=None, compact=False
+    ):
+        if policy is None:
+            policy = default_policy()
+        backend = get_backend(backend)
+
+        cache = get_default_cache()
+        if cache is None or not policy.cacheable:
+            return StoryPage._clean_html(
+                html, engine, policy, backend, page_id=page_id, compact=compact
+            )
+
+        start = start_timer()
+        key, value = cache.lookup(html, engine, policy=policy, backend=backend, compact=compact)
+        record('cache_lookup', start, len(html), page_id)
+        if value is None:
+            value = StoryPage._clean_html(
+                html, engine, policy, backend, page_id=page_id, compact=compact
+            )
+            cache.set(key, value)
+        return value
+
+    @staticmethod
+    def _clean_html(
+        html, engine='native', policy=None, backend=None, page_id=None, compact=False
+    ):
+        """
+        Return the AMP-cleaned version of an HTML fragment, bypassing the cache
+        """
+        start = start_timer()
+        node = get_backend(backend).parse_fragment(html)
+        record('parse_fragment', start, len(html), page_id)
+        return StoryPage._clean_html_from_node(
+            node, engine=engine, policy=policy, size=len(html), page_id=page_id, compact=compact
+        )
+
+    @staticmethod
+    def _clean_html_from_node(
+        node, engine='native', policy=None, size=None, page_id=None, compact=False
+    ):
         """
         Return the AMP-cleaned version of a BeautifulSoup DOM node object, as an HTML string.
-        May modify the node object.
+        May modify the node object. size and page_id are passed to profiling hooks.
         """
+        if policy is None:
+            policy = default_policy()
+
+        if engine == 'native':
+            start = start_timer()
+            try:
+                clean_html = StoryPageTreeCleaner(policy, compact=compact).clean_node(node)
+                record('clean_native', start, size, page_id)
+                return clean_html
+            except StoryPageTreeCleaner.UnsupportedMarkup:
+                # html5lib would restructure this markup; leave that to bleach
+                pass
+        elif engine != 'bleach':
+            raise ValueError("Unknown cleaning engine: %r" % engine)
+
         # reject <script> tags without an allowed type attribute, as per
         # https://amp.dev/documentation/guides-and-tutorials/learn/spec/amphtml/?format=websites#html-tags
         # (we can't do this within a bleach Cleaner instance)
+        start = start_timer()
         for script in node.find_all('script'):
-            if script.get('type') not in ('application/ld+json', 'application/json', 'text/plain'):
+            if not policy.allows_script(script.get('type')):
                 script.extract()
+        record('strip_scripts', start, size, page_id)
+
+        start = start_timer()
         html_without_scripts = str(node)
-        return StoryPageCleaner().clean(html_without_scripts)
+        record('serialize', start, size, page_id)
+
+        start = start_timer()
+        clean_html = cleaner_pool.clean(html_without_scripts, policy, compact=compact)
+        record('clean_bleach', start, len(html_without_scripts), page_id)
+        return clean_html
 
     def __str__(self):
         return "<StoryPage: %s>" % self.id
 
     def __repr__(self):
         return str(self)
+
+
+def clean_many(
+    html_iterable, workers=None, executor='process', chunk_size=8, engine='native', policy=None,
+    backend=None, compact=False
+):
+    """
+    Clean each of the page HTML fragments in html_iterable as per StoryPage.clean_html_fragment,
+    spreading the work over a pool of workers. Returns an iterator over the clean HTML strings
+    in the same order as the input, yielding each one as soon as it and all earlier ones are
+    ready; html_iterable is consumed incrementally, so it can be a generator over a large corpus.
+
+    executor may be 'process', 'thread' or an existing concurrent.futures.Executor, which is
+    left running afterwards. workers is the size of the pool to create (defaulting to the number
+    of CPUs); with a single worker, pages are cleaned in the current thread. Fragments are sent
+    to workers in lists of chunk_size, to reduce the per-task overhead for small pages. Lookups
+    in the default cache happen in the calling process, so only uncached pages are sent out.
+    """
+    if policy is None:
+        policy = default_policy()
+    backend = get_backend(backend)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    if not isinstance(executor, Executor) and executor not in ('process', 'thread'):
+        raise ValueError("Unknown executor: %r" % executor)
+
+    chunks = _iter_chunks(html_iterable, chunk_size)
+    if isinstance(executor, Executor):
+        pool = executor
+        owns_pool = False
+        task_args = (engine, policy, backend.name, compact)
+    elif workers <= 1:
+        return (
+            html
+            for chunk in chunks
+            for html in _CleanChunk(chunk, engine, policy, backend, compact).results
+        )
+    elif executor == 'process':
+        # send the policy to each worker process once, rather than pickling it with every chunk
+        pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_clean_worker,
+            initargs=(engine, policy, backend.name, compact)
+        )
+        owns_pool = True
+        task_args = ()
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+        owns_pool = True
+        task_args = (engine, policy, backend, compact)
+
+    return _clean_chunks_in_pool(
+        chunks, pool, owns_pool, task_args, engine, policy, backend, compact, workers
+    )
+
+
+# process pools shared between Story.get_clean_pages calls, by number of workers
+_process_pools = {}
+_process_pools_lock = threading.Lock()
+
+
+def _shared_process_pool(workers):
+    with _process_pools_lock:
+        pool = _process_pools.get(workers)
+        if pool is None:
+            pool = _process_pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+
+def _iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class _CleanChunk:
+    """
+    A chunk of page HTML fragments being cleaned by clean_many. Cached results are filled in
+    immediately; the rest are cleaned in the current thread unless a pool is given, in which
+    case they are submitted to it as a single task.
+    """
+    def __init__(self, htmls, engine, policy, backend, compact=False, pool=None, task_args=None):
+        self.cache = get_default_cache() if policy.cacheable else None
+        self.results = [None] * len(htmls)
+        # list of (index, key) for results that are not in the cache
+        self.misses = []
+        uncached_htmls = []
+
+        for i, html in enumerate(htmls):
+            if self.cache is not None:
+                start = start_timer()
+                key, self.results[i] = self.cache.lookup(
+                    html, engine, policy, backend, compact
+                )
+                record('cache_lookup', start, len(html))
+            else:
+                key = None
+            if self.results[i] is None:
+                self.misses.append((i, key))
+                uncached_htmls.append(html)
+
+        self.future = None
+        if not uncached_htmls:
+            return
+        if pool is None:
+            self.store(_clean_chunk(uncached_htmls, engine, policy, backend, compact))
+        else:
+            self.future = pool.submit(_clean_chunk, uncached_htmls, *task_args)
+
+    def store(self, clean_htmls):
+        for (i, key), clean_html in zip(self.misses, clean_htmls):
+            self.results[i] = clean_html
+            if self.cache is not None:
+                self.cache.set(key, clean_html)
+
+    @property
+    def ready(self):
+        return self.future is None or self.future.done()
+
+    def wait(self):
+        if self.future is not None:
+            self.store(self.future.result())
+            self.future = None
+        return self.results
+
+
+def _clean_chunks_in_pool(
+    chunks, pool, owns_pool, task_args, engine, policy, backend, compact, workers
+):
+    # keep enough chunks in flight to keep every worker busy, without reading the whole input
+    # up front
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(
+                _CleanChunk(
+                    chunk, engine, policy, backend, compact, pool=pool, task_args=task_args
+                )
+            )
+            while len(pending) > workers * 2 or (pending and pending[0].ready):
+                yield from pending.popleft().wait()
+        while pending:
+            yield from pending.popleft().wait()
+    finally:
+        for clean_chunk in pending:
+            if clean_chunk.future is not None:
+                clean_chunk.future.cancel()
+        if owns_pool:
+            pool.shutdown()
+
+
+# engine, policy, backend and compact flag for _clean_chunk calls within a clean_many worker
+# process
+_worker_options = None
+
+
+def _init_clean_worker(engine, policy, backend, compact=False):
+    global _worker_options
+    _worker_options = (engine, policy, backend, compact)
+
+
+def _clean_chunk(htmls, engine=None, policy=None, backend=None, compact=False):
+    if engine is None:
+        engine, policy, backend, compact = _worker_options
+    return [
+        StoryPage._clean_html(
+            html, engine=engine, policy=policy, backend=backend, compact=compact
+        )
+        for html in htmls
+    ]
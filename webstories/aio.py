@@ -0,0 +1,191 @@
+"""
+asyncio API for fetching and parsing stories over HTTP, using aiohttp (install with
+`pip install webstories[aio]`):
+
+    async for result in fetch_stories(urls, concurrency=20, clean=True):
+        if result.error is None:
+            store(result.url, result.story.title, result.clean_pages)
+
+Requests share a pooled aiohttp session, with a limit on the number of connections to each
+host. Parsing and cleaning happen in an executor, so that they don't block the event loop.
+"""
+import asyncio
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from . import Story
+from .limits import LimitExceeded, get_default_limits
+
+
+# size of the chunks in which response bodies are read, while checking the max_bytes limit
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class FetchResult:
+    """
+    The outcome of fetching and parsing a story: the URL, the Story (or None if fetching or
+    parsing failed), a list of the clean HTML of each page (if cleaning was requested), and the
+    exception raised, if any
+    """
+    def __init__(self, url, story=None, clean_pages=None, error=None):
+        self.url = url
+        self.story = story
+        self.clean_pages = clean_pages
+        self.error = error
+
+    def __repr__(self):
+        if self.error is not None:
+            return "<FetchResult: %s (%s)>" % (self.url, type(self.error).__name__)
+        return "<FetchResult: %s>" % self.url
+
+
+def check_available():
+    if aiohttp is None:
+        raise ImportError(
+            "aiohttp is required for webstories.aio; install it with: pip install webstories[aio]"
+        )
+
+
+def create_session(concurrency=10, per_host=4, timeout=30):
+    """
+    Return an aiohttp ClientSession with a pool of up to concurrency connections, of which at
+    most per_host are to the same host, and the given total timeout per request in seconds
+    """
+    check_available()
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host),
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    )
+
+
+def parse_story(html, limits=None, backend=None, clean=False, engine='native', compact=False):
+    """
+    Parse (and optionally clean) a story, returning a (story, clean_pages) tuple. Run within
+    an executor, so it must be picklable for use with a process pool.
+    """
+    story = Story(html, backend=backend, limits=limits)
+    clean_pages = None
+    if clean:
+        clean_pages = [
+            page.get_clean_html(engine=engine, backend=backend, compact=compact)
+            for page in story.pages
+        ]
+    return story, clean_pages
+
+
+async def read_body(response, max_bytes=None):
+    """
+    Return the body of an aiohttp response, decoded as per its Content-Type charset if it has
+    one (and otherwise as bytes, for Story to detect the encoding). Raises LimitExceeded without
+    reading the rest of the body if it is longer than max_bytes.
+    """
+    if (
+        max_bytes is not None and response.content_length is not None
+        and response.content_length > max_bytes
+    ):
+        raise LimitExceeded('max_bytes', max_bytes)
+
+    chunks = []
+    size = 0
+    async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            raise LimitExceeded('max_bytes', max_bytes)
+        chunks.append(chunk)
+    body = b''.join(chunks)
+
+    if response.charset:
+        try:
+            return body.decode(response.charset)
+        except (LookupError, UnicodeDecodeError):
+            pass
+    return body
+
+
+async def fetch_story(
+    url, session=None, executor=None, limits=None, backend=None, clean=False, engine='native',
+    compact=False
+):
+    """
+    Fetch and parse a single story, returning a FetchResult. Errors from fetching (including
+    HTTP error statuses) and any exception raised while parsing are returned in its error
+    attribute rather than raised.
+    session is an aiohttp ClientSession, defaulting to a new one from create_session();
+    executor is the concurrent.futures.Executor to parse in, defaulting to the event loop's
+    default executor. limits is the StoryLimits to apply, defaulting to the module-level default;
+    its max_bytes limit is also applied to the response body.
+    """
+    if session is None:
+        async with create_session() as session:
+            return await fetch_story(
+                url, session=session, executor=executor, limits=limits, backend=backend,
+                clean=clean, engine=engine, compact=compact
+            )
+
+    if limits is None:
+        limits = get_default_limits()
+    try:
+        async with session.get(url) as response:
+            response.raise_for_status()
+            html = await read_body(response, limits and limits.max_bytes)
+    except (aiohttp.ClientError, asyncio.TimeoutError, Story.InvalidStoryException) as e:
+        return FetchResult(url, error=e)
+
+    try:
+        story, clean_pages = await asyncio.get_running_loop().run_in_executor(
+            executor, parse_story, html, limits, backend, clean, engine, compact
+        )
+    except asyncio.CancelledError:
+        # a subclass of Exception before Python 3.8
+        raise
+    except Exception as e:
+        # as per cli.process_story, any failure to parse one story is reported rather than
+        # ending the whole run
+        return FetchResult(url, error=e)
+    return FetchResult(url, story, clean_pages)
+
+
+async def fetch_stories(
+    urls, concurrency=10, per_host=4, timeout=30, session=None, executor=None, limits=None,
+    backend=None, clean=False, engine='native', compact=False
+):
+    """
+    Fetch and parse the stories at the given URLs, yielding a FetchResult for each as soon as
+    it is ready (so not necessarily in the order of urls). urls may be any iterable, and is
+    consumed incrementally, with at most concurrency stories in progress at once. per_host and
+    timeout are passed to create_session() if no session is given. The other arguments are as
+    per fetch_story.
+    """
+    check_available()
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    owns_session = session is None
+    if owns_session:
+        session = create_session(concurrency=concurrency, per_host=per_host, timeout=timeout)
+
+    pending = set()
+    try:
+        for url in urls:
+            pending.add(asyncio.ensure_future(fetch_story(
+                url, session=session, executor=executor, limits=limits, backend=backend,
+                clean=clean, engine=engine, compact=compact
+            )))
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        if owns_session:
+            await session.close()
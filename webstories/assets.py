@@ -0,0 +1,164 @@
+import re
+
+
+# elements whose <source> children are media of the element's type
+MEDIA_ELEMENTS = {'amp-video': 'video', 'amp-audio': 'audio'}
+
+# elements within a page that may reference assets (as well as the page itself)
+ASSET_ELEMENTS = frozenset(['amp-img', 'amp-video', 'amp-audio', 'source'])
+
+# <amp-story> attributes referencing assets, and their types
+STORY_ASSET_ATTRIBUTES = (
+    ('publisher-logo-src', 'image'),
+    ('poster-portrait-src', 'image'),
+    ('poster-square-src', 'image'),
+    ('poster-landscape-src', 'image'),
+    ('background-audio', 'audio'),
+)
+
+SRCSET_URL_RE = re.compile(r'[\s,]*([^\s,]\S*)')
+SRCSET_DESCRIPTOR_RE = re.compile(r'[^,]*')
+
+
+class Asset:
+    """
+    A media file referenced by a story. type is 'image', 'video' or 'audio'; element and
+    attribute give the element and attribute it was found in, and page_id the id of the page (or
+    None for assets of the story as a whole). width, height and layout are as declared on the
+    element (or for a <source>, on the enclosing media element). srcset is a list of
+    (url, descriptor) candidates, where descriptor is a string such as '720w' or None.
+    """
+    def __init__(
+        self, url, type, element, attribute, page_id=None, width=None, height=None, layout=None,
+        srcset=()
+    ):
+        self.url = url
+        self.type = type
+        self.element = element
+        self.attribute = attribute
+        self.page_id = page_id
+        self.width = width
+        self.height = height
+        self.layout = layout
+        self.srcset = list(srcset)
+
+    @property
+    def urls(self):
+        """
+        All URLs for this asset, including those of its srcset candidates
+        """
+        urls = [self.url]
+        for url, descriptor in self.srcset:
+            if url not in urls:
+                urls.append(url)
+        return urls
+
+    def __eq__(self, other):
+        return isinstance(other, Asset) and self.__dict__ == other.__dict__
+
+    def __repr__(self):
+        return "<Asset: %s %s>" % (self.type, self.url)
+
+
+def parse_srcset(value):
+    """
+    Return a list of (url, descriptor) tuples for the candidates in a srcset attribute value
+    """
+    candidates = []
+    position = 0
+    while True:
+        match = SRCSET_URL_RE.match(value, position)
+        if match is None:
+            return candidates
+        url = match.group(1)
+        position = match.end()
+        if url.endswith(','):
+            candidates.append((url.rstrip(','), None))
+            continue
+        match = SRCSET_DESCRIPTOR_RE.match(value, position)
+        descriptor = match.group().strip()
+        candidates.append((url, descriptor or None))
+        position = match.end() + 1
+
+
+def element_assets(tag, attrs, page_id=None, media=None):
+    """
+    Return a list of the Assets referenced by an element with the given name and attribute dict.
+    media is the (name, attribute dict) of the nearest enclosing amp-video or amp-audio element,
+    if any.
+    """
+    if tag == 'amp-story-page':
+        url = attrs.get('background-audio')
+        if url:
+            return [Asset(url, 'audio', tag, 'background-audio', page_id)]
+        return []
+
+    if tag == 'source':
+        if media is None or not attrs.get('src'):
+            return []
+        media_tag, media_attrs = media
+        return [Asset(
+            attrs['src'], MEDIA_ELEMENTS[media_tag], tag, 'src', page_id, media_attrs.get('width'),
+            media_attrs.get('height'), media_attrs.get('layout'),
+        )]
+
+    assets = []
+    width, height, layout = attrs.get('width'), attrs.get('height'), attrs.get('layout')
+    if tag == 'amp-img':
+        srcset = parse_srcset(attrs.get('srcset') or '')
+        url = attrs.get('src') or (srcset and srcset[0][0])
+        if url:
+            assets.append(Asset(
+                url, 'image', tag, 'src' if attrs.get('src') else 'srcset', page_id, width,
+                height, layout, srcset
+            ))
+    elif tag in MEDIA_ELEMENTS:
+        if attrs.get('src'):
+            assets.append(Asset(
+                attrs['src'], MEDIA_ELEMENTS[tag], tag, 'src', page_id, width, height, layout
+            ))
+        if tag == 'amp-video' and attrs.get('poster'):
+            assets.append(Asset(
+                attrs['poster'], 'image', tag, 'poster', page_id, width, height, layout
+            ))
+    return assets
+
+
+def story_assets(story_attrs):
+    """
+    Return a list of the Assets referenced by the attributes of an <amp-story> element
+    """
+    return [
+        Asset(story_attrs[name], type, 'amp-story', name)
+        for name, type in STORY_ASSET_ATTRIBUTES
+        if story_attrs.get(name)
+    ]
+
+
+def node_assets(node, page_id=None):
+    """
+    Return a list of the Assets referenced within a BeautifulSoup element (including the element
+    itself)
+    """
+    assets = element_assets(node.name, node.attrs, page_id)
+    for element in node.find_all(list(ASSET_ELEMENTS)):
+        media = None
+        if element.name == 'source':
+            media_node = element.find_parent(list(MEDIA_ELEMENTS))
+            if media_node is not None:
+                media = (media_node.name, media_node.attrs)
+        assets.extend(element_assets(element.name, element.attrs, page_id, media))
+    return assets
+
+
+def unique_assets(assets):
+    """
+    Return the given Assets with only the first of any with the same URL
+    """
+    seen = set()
+    result = []
+    for asset in assets:
+        if asset.url not in seen:
+            seen.add(asset.url)
+            result.append(asset)
+    return result
@@ -0,0 +1,339 @@
+from html import escape
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+from bs4.builder import HTMLTreeBuilder, builder_registry
+from bs4.element import NavigableString
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+from .assets import ASSET_ELEMENTS, MEDIA_ELEMENTS, element_assets, node_assets
+from .limits import LimitExceeded, StoryLimits
+from .parser import ASCII_SPACES, EMPTY_ELEMENT_TAGS, StoryParser, tag_string
+from .profiling import record, start_timer
+
+
+# elements whose content html.parser does not parse as markup
+CDATA_CONTENT_ELEMENTS = frozenset(HTMLParser.CDATA_CONTENT_ELEMENTS)
+
+# elements within which BeautifulSoup leaves whitespace-only strings intact
+PRESERVE_WHITESPACE_TAGS = list(HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS)
+
+
+class ParsedStory:
+    """
+    The result of parsing a story document: the attributes of its <amp-story> element (None if
+    there is none), the content of its <style amp-custom> element, and a list of
+    (source, start, end, id, assets) tuples locating the HTML of each page within a source string
+    and listing the Assets it references. start and end are None where the source is the page's
+    own re-serialized HTML, rather than the story document.
+    """
+    def __init__(self, story_attrs, custom_css, pages):
+        self.story_attrs = story_attrs
+        self.custom_css = custom_css
+        self.pages = pages
+
+
+class ParserBackend:
+    """
+    Base class for the HTML parsers used to read story documents and page fragments. Subclasses
+    build BeautifulSoup trees with the tree builder named by `features`.
+    """
+    name = None
+    features = None
+
+    @classmethod
+    def is_available(cls):
+        return builder_registry.lookup(cls.features) is not None
+
+    def parse_story(self, html, metadata_only=False, limits=None):
+        """
+        Parse a story document, returning a ParsedStory. If metadata_only is true, the backend
+        may skip finding the pages. If a StoryLimits object is passed, LimitExceeded is raised
+        for documents that exceed it, without building a full tree.
+        """
+        if limits is not None:
+            # BeautifulSoup gives us no way to stop part way through building the tree, so check
+            # the limits with a streaming pass first
+            StoryParser.parse(html, metadata_only=metadata_only, limits=limits)
+        soup = BeautifulSoup(html, self.features, multi_valued_attributes=None)
+        story_node = soup.find('amp-story')
+        if story_node is None:
+            return ParsedStory(None, None, [])
+
+        custom_css_node = soup.find('style', attrs={'amp-custom': True})
+        pages = []
+        if not metadata_only:
+            start = start_timer()
+            for node in story_node.find_all('amp-story-page', recursive=False):
+                page_html = str(node)
+                pages.append((
+                    page_html, None, None, node.get('id'), node_assets(node, node.get('id'))
+                ))
+            record('find_pages', start, len(html))
+
+        return ParsedStory(
+            dict(story_node.attrs), custom_css_node and tag_string(custom_css_node.string), pages
+        )
+
+    def parse_fragment(self, html):
+        """
+        Return a BeautifulSoup document for an HTML fragment. Any <html>, <head> or <body>
+        elements that the parser wraps around it are removed by cleaning, as they are not
+        allowed tags.
+        """
+        return BeautifulSoup(html, self.features)
+
+    def __repr__(self):
+        return "<ParserBackend: %s>" % self.name
+
+
+class HTMLParserBackend(ParserBackend):
+    """
+    Python's built-in html.parser. Stories are read with the streaming StoryParser, so page HTML
+    is taken directly from the source document.
+    """
+    name = 'html.parser'
+    features = 'html.parser'
+
+    def parse_story(self, html, metadata_only=False, limits=None):
+        parser = StoryParser.parse(html, metadata_only=metadata_only, limits=limits)
+        return ParsedStory(
+            parser.story_attrs,
+            parser.custom_css,
+            [(html, start, end, id, assets) for start, end, id, assets in parser.page_spans],
+        )
+
+
+class LXMLBackend(ParserBackend):
+    """
+    The libxml2 HTML parser, via lxml. Page HTML is re-serialized from the parsed tree.
+    """
+    name = 'lxml'
+    features = 'lxml'
+
+    # number of characters initially passed to the parser at a time, so that we can stop early
+    # once the metadata has been found; this doubles with each chunk
+    chunk_size = 4 * 1024
+
+    @classmethod
+    def is_available(cls):
+        return etree is not None and super().is_available()
+
+    def parse_story(self, html, metadata_only=False, limits=None):
+        if limits is None:
+            limits = StoryLimits.unlimited()
+        parser = etree.HTMLPullParser(events=('start', 'end'))
+        story_element = story_attrs = custom_css = None
+        found_custom_css = False
+        # as per StoryParser, avoid looking for a <style amp-custom> that cannot exist
+        custom_css_expected = 'amp-custom' in html
+        depth = page_count = page_nodes = 0
+        page_element = None
+
+        try:
+            offset = 0
+            chunk_size = self.chunk_size
+            while offset < len(html):
+                parser.feed(html[offset:offset + chunk_size])
+                offset += chunk_size
+                chunk_size *= 2
+                for event, element in parser.read_events():
+                    if event == 'start':
+                        depth += 1
+                        if limits.max_depth is not None and depth > limits.max_depth:
+                            raise LimitExceeded('max_depth', limits.max_depth)
+                        if page_element is not None:
+                            page_nodes += 1
+                            if (
+                                limits.max_page_nodes is not None
+                                and page_nodes > limits.max_page_nodes
+                            ):
+                                raise LimitExceeded('max_page_nodes', limits.max_page_nodes)
+
+                        if element.tag == 'amp-story' and story_element is None:
+                            story_element = element
+                            story_attrs = dict(element.attrib)
+                        elif (
+                            element.tag == 'amp-story-page' and story_element is not None
+                            and element.getparent() is story_element
+                        ):
+                            page_count += 1
+                            if limits.max_pages is not None and page_count > limits.max_pages:
+                                raise LimitExceeded('max_pages', limits.max_pages)
+                            page_element = element
+                            page_nodes = 1
+                    else:
+                        depth -= 1
+                        if element is page_element:
+                            page_element = None
+                        elif (
+                            element.tag == 'style' and not found_custom_css
+                            and 'amp-custom' in element.attrib
+                        ):
+                            found_custom_css = True
+                            custom_css = tag_string(element.text)
+                            if limits.max_css_bytes is not None and custom_css:
+                                limits.check(
+                                    'max_css_bytes',
+                                    len(custom_css.encode('utf-8', 'surrogatepass'))
+                                )
+
+                if (
+                    metadata_only and story_element is not None
+                    and (found_custom_css or not custom_css_expected)
+                ):
+                    return ParsedStory(story_attrs, custom_css, [])
+
+            parser.close()
+        except etree.XMLSyntaxError:
+            # raised for documents with no content at all
+            pass
+
+        if story_element is None:
+            return ParsedStory(None, None, [])
+
+        pages = []
+        if not metadata_only:
+            for element in story_element:
+                if element.tag == 'amp-story-page':
+                    output = []
+                    self.serialize(element, output)
+                    page_html = ''.join(output)
+                    pages.append((
+                        page_html, None, None, element.get('id'), self.page_assets(element)
+                    ))
+
+        return ParsedStory(story_attrs, custom_css, pages)
+
+    @staticmethod
+    def page_assets(page_element):
+        page_id = page_element.get('id')
+        assets = element_assets(page_element.tag, dict(page_element.attrib), page_id)
+        for element in page_element.iter(*ASSET_ELEMENTS):
+            media = None
+            if element.tag == 'source':
+                for media_element in element.iterancestors(*MEDIA_ELEMENTS):
+                    media = (media_element.tag, dict(media_element.attrib))
+                    break
+            assets.extend(element_assets(element.tag, dict(element.attrib), page_id, media))
+        return assets
+
+    @classmethod
+    def serialize(cls, element, output):
+        """
+        Append the HTML for an lxml element (excluding its tail text) to the output list.
+        libxml2's own HTML serializer omits some end tags and escapes URLs, which would change
+        the result of parsing the page again, so we write markup in the same form as
+        BeautifulSoup instead.
+        """
+        tag = element.tag
+        if tag is etree.Comment:
+            output.append('<!--%s-->' % element.text)
+            return
+        elif not isinstance(tag, str):
+            # processing instructions and entities
+            return
+
+        output.append('<' + tag)
+        for name, value in element.items():
+            output.append(' %s="%s"' % (name, escape(value)))
+        if tag in EMPTY_ELEMENT_TAGS and element.text is None and not len(element):
+            output.append('/>')
+            return
+        output.append('>')
+
+        escape_text = str if tag in CDATA_CONTENT_ELEMENTS else escape
+        if element.text:
+            output.append(escape_text(element.text))
+        for child in element:
+            cls.serialize(child, output)
+            if child.tail:
+                output.append(escape_text(child.tail))
+        output.append('</%s>' % tag)
+
+
+class HTML5LibBackend(ParserBackend):
+    """
+    The html5lib parser, which builds the same tree as a browser (and bleach) would, but is the
+    slowest of the available backends
+    """
+    name = 'html5lib'
+    features = 'html5lib'
+
+    def parse_fragment(self, html):
+        soup = super().parse_fragment(html)
+
+        # The html5lib tree builder bypasses BeautifulSoup's normalisation of strings consisting
+        # only of whitespace, which the other tree builders (and the cleaning output) rely on
+        for string in soup.find_all(string=True):
+            if (
+                not string.strip(ASCII_SPACES) and string not in ('\n', ' ')
+                and type(string) is NavigableString
+                and string.find_parent(PRESERVE_WHITESPACE_TAGS) is None
+            ):
+                string.replace_with(tag_string(string))
+
+        return soup
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (HTMLParserBackend, LXMLBackend, HTML5LibBackend)
+}
+
+# other names for backends. 'auto' is the default, which cleans pages with html.parser whether
+# or not the other backends are installed, as their trees differ for malformed markup
+BACKEND_ALIASES = {'auto': 'html.parser'}
+
+_backends = {}
+_default_backend = 'auto'
+
+
+def get_backend(name=None):
+    """
+    Return the ParserBackend instance with the given name, or 'auto' for html.parser. None
+    returns the default backend, as set by set_default_backend. Raises ValueError for unknown or
+    unavailable backends.
+    """
+    if name is None:
+        name = _default_backend
+    if isinstance(name, ParserBackend):
+        return name
+    name = BACKEND_ALIASES.get(name, name)
+
+    try:
+        return _backends[name]
+    except KeyError:
+        pass
+
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError("Unknown parser backend: %r" % name)
+    if not backend_class.is_available():
+        raise ValueError("The %r parser backend is not installed" % name)
+    backend = backend_class()
+
+    _backends[name] = backend
+    return backend
+
+
+def get_default_backend():
+    """
+    Return the ParserBackend used when no backend is specified
+    """
+    return get_backend(_default_backend)
+
+
+def set_default_backend(name):
+    """
+    Set the backend used when none is specified: 'auto' (the initial setting), 'lxml',
+    'html5lib', 'html.parser' or a ParserBackend instance
+    """
+    global _default_backend
+    get_backend(name)
+    _default_backend = name
@@ -0,0 +1,244 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+from .backends import get_backend
+from .cleaner import default_policy
+
+
+# bump this whenever a change to the cleaning code alters its output, to invalidate entries in
+# on-disk caches written by earlier versions
+CACHE_VERSION = 1
+
+
+def make_key(html, engine, policy=None, backend=None, compact=False):
+    """
+    Return the cache key for the clean version of the given page HTML, as produced by the given
+    engine and parser backend under the given SanitizationPolicy (or the module-level allowlists
+    if None), with or without compact output. Raises ValueError if the policy is not cacheable.
+    """
+    variant = variant_key(engine, policy, backend, compact)
+    if variant is None:
+        raise ValueError("Results of cleaning with %r cannot be cached" % policy)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update((variant + ':').encode('ascii'))
+    digest.update(html.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+
+def variant_key(engine, policy=None, backend=None, compact=False):
+    """
+    Return a string identifying the cleaning options (and version of the cleaning code) that
+    clean HTML was produced with, so that it can be stored alongside the original HTML, or None
+    if the policy is not cacheable
+    """
+    if policy is None:
+        policy = default_policy()
+    if not policy.cacheable:
+        return None
+    backend = get_backend(backend)
+    if compact:
+        engine += '+compact'
+    return '%d:%s:%s:%s' % (CACHE_VERSION, engine, backend.features, policy.fingerprint)
+
+
+class CleanHTMLCache:
+    """
+    Base class for caches of cleaned page HTML. Subclasses implement get and set; keys are
+    content hashes as returned by make_key, and values are the clean HTML strings.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the value cached under key, or None if there is none
+        """
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def lookup(self, html, engine, policy=None, backend=None, compact=False):
+        """
+        Return a (key, value) tuple for the given page HTML, where value is the cached clean HTML
+        or None if there is none, and record the hit or miss
+        """
+        key = make_key(html, engine, policy, backend, compact)
+        value = self.get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return key, value
+
+    def get_or_clean(self, html, engine, clean, policy=None, backend=None, compact=False):
+        """
+        Return the clean version of the given page HTML from the cache if available, or
+        otherwise call clean() to produce it and store the result. If the policy is not
+        cacheable, clean() is always called.
+        """
+        if policy is not None and not policy.cacheable:
+            return clean()
+        key, value = self.lookup(html, engine, policy, backend, compact)
+        if value is None:
+            value = clean()
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class LRUCache(CleanHTMLCache):
+    """
+    In-process cache that evicts the least recently used entries once the total length of the
+    cached HTML exceeds max_size characters. If a backend cache is given, it is consulted on
+    misses and written to on every set, so that it can outlive the process.
+    """
+    def __init__(self, max_size=16 * 1024 * 1024, backend=None):
+        super().__init__()
+        self.max_size = max_size
+        self.size = 0
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+
+        if self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self._store(key, value)
+        return value
+
+    def set(self, key, value):
+        self._store(key, value)
+        if self.backend is not None:
+            self.backend.set(key, value)
+
+    def _store(self, key, value):
+        if len(value) > self.max_size:
+            return
+
+        with self._lock:
+            old_value = self._entries.pop(key, None)
+            if old_value is not None:
+                self.size -= len(old_value)
+            self._entries[key] = value
+            self.size += len(value)
+
+            while self.size > self.max_size:
+                __, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({'entries': len(self._entries), 'size': self.size})
+        return stats
+
+
+class SQLiteCache(CleanHTMLCache):
+    """
+    On-disk cache stored in an SQLite database at the given path, which can be shared between
+    processes
+    """
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS clean_html (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM clean_html WHERE key = ?", (key,)
+            ).fetchone()
+        return row and row[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO clean_html (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM clean_html")
+
+    def close(self):
+        self._connection.close()
+
+
+class DirectoryCache(CleanHTMLCache):
+    """
+    On-disk cache storing each entry as a file within the given directory
+    """
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _path_for_key(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def get(self, key):
+        try:
+            with open(self._path_for_key(key), encoding='utf-8', newline='') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        path = self._path_for_key(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        # write to a temporary file first, so that readers never see a partially written entry
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                f.write(value)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+_default_cache = LRUCache()
+
+
+def get_default_cache():
+    """
+    Return the cache used by StoryPage.get_clean_html and StoryPage.clean_html_fragment, or None
+    if caching is disabled
+    """
+    return _default_cache
+
+
+def set_default_cache(cache):
+    """
+    Set the cache used by StoryPage.get_clean_html and StoryPage.clean_html_fragment; pass None
+    to disable caching
+    """
+    global _default_cache
+    _default_cache = cache
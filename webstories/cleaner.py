@@ -1,5 +1,14 @@
+import copy
+import hashlib
 import re
-from bleach.sanitizer import Cleaner
+import threading
+from bleach import html5lib_shim
+from bleach.sanitizer import (
+    ALLOWED_PROTOCOLS, INVISIBLE_CHARACTERS_RE, INVISIBLE_REPLACEMENT_CHAR, Cleaner
+)
+from bs4 import BeautifulSoup
+from bs4.element import NavigableString, PreformattedString
+from urllib.parse import urlparse
 
 
 ALLOWED_STORY_PAGE_TAGS = [
@@ -58,14 +67,15 @@ ANIMATION_ATTRIBUTES = [
     'animate-in-after', 'scale-start', 'scale-end', 'translate-x', 'translate-y',
 ]
 
-GLOBAL_ATTRIBUTES += ANIMATION_ATTRIBUTES
-
 DATA_ATTR_RE = re.compile(r'^data-[A-Za-z0-9-_:.]*$')
 
 
 class AttributeRule:
     def __init__(self, attrs=None):
-        self.allowed_attributes = set((attrs or []) + GLOBAL_ATTRIBUTES)
+        self.allowed_attributes = set((attrs or []) + GLOBAL_ATTRIBUTES + ANIMATION_ATTRIBUTES)
+
+    def __repr__(self):
+        return "<AttributeRule: %s>" % ' '.join(sorted(self.allowed_attributes))
 
     def __call__(self, tag, attr_name, attr_value):
         return (
@@ -171,6 +181,13 @@ ALLOWED_STORY_PAGE_ATTRIBUTES = {
     'var': AttributeRule([]),
     'wbr': AttributeRule([]),
 
+    # not allowed within pages, but used for the <amp-story> element of documents built by
+    # Story.iter_amp_html
+    'amp-story': AttributeRule([
+        'standalone', 'title', 'publisher', 'publisher-logo-src', 'poster-portrait-src',
+        'poster-square-src', 'poster-landscape-src', 'background-audio', 'entity',
+        'entity-logo-src', 'entity-url', 'live-story', 'live-story-disabled', 'supports-landscape',
+    ]),
     'amp-story-page': AttributeRule(['auto-advance-after', 'background-audio']),
     'amp-story-cta-layer': AttributeRule([]),
     'amp-story-grid-layer': AttributeRule(['template', 'grid-area', 'aspect-ratio']),
@@ -218,11 +235,812 @@ ALLOWED_STORY_PAGE_ATTRIBUTES = {
 
 
 class StoryPageCleaner(Cleaner):
-    def __init__(self, **kwargs):
+    def __init__(self, policy=None, compact=False, **kwargs):
+        if policy is None:
+            policy = default_policy()
         opts = {
-            'tags': ALLOWED_STORY_PAGE_TAGS,
-            'attributes': ALLOWED_STORY_PAGE_ATTRIBUTES,
+            'tags': sorted(policy.tags),
+            'attributes': policy.allows_attribute,
+            'styles': sorted(policy.styles),
+            'protocols': sorted(policy.protocols),
             'strip': True,
         }
+        if compact:
+            opts['filters'] = [CompactWhitespaceFilter]
         opts.update(kwargs)
         super().__init__(**opts)
+
+
+class CleanerPool:
+    """
+    Reuses StoryPageCleaner instances between cleaning calls, to avoid the cost of setting up a
+    new html5lib parser and serializer for each one.
+
+    A bleach Cleaner keeps parser state while cleaning, so an instance must only be used by one
+    call at a time: each thread has its own set of cleaners, and a cleaner is taken out of the
+    pool while in use, so that re-entrant calls never share it either. (StoryPageTreeCleaner and
+    SanitizationPolicy objects hold no per-call state, and can be shared between threads.)
+    """
+    def __init__(self, max_size=8):
+        # maximum number of cleaners kept per thread, for different policies / options
+        self.max_size = max_size
+        self._local = threading.local()
+
+    def clean(self, html, policy=None, compact=False):
+        """
+        Clean an HTML string with a StoryPageCleaner for the given policy and compact option
+        """
+        if policy is None:
+            policy = default_policy()
+        cleaners = self.cleaners()
+        key = (policy, compact)
+        cleaner = cleaners.pop(key, None)
+        if cleaner is None:
+            cleaner = StoryPageCleaner(policy, compact=compact)
+        try:
+            return cleaner.clean(html)
+        finally:
+            # re-insert as the most recently used, evicting the least recently used
+            cleaners[key] = cleaner
+            if len(cleaners) > self.max_size:
+                del cleaners[next(iter(cleaners))]
+
+    def cleaners(self):
+        """
+        Return the dict of (policy, compact) => idle StoryPageCleaner for the current thread
+        """
+        try:
+            return self._local.cleaners
+        except AttributeError:
+            cleaners = self._local.cleaners = {}
+            return cleaners
+
+
+cleaner_pool = CleanerPool()
+
+
+# <script> tags are only allowed with one of these type attributes, as per
+# https://amp.dev/documentation/guides-and-tutorials/learn/spec/amphtml/?format=websites#html-tags
+ALLOWED_SCRIPT_TYPES = ('application/ld+json', 'application/json', 'text/plain')
+
+
+class SanitizationPolicy:
+    """
+    An immutable set of sanitization rules, compiled into per-tag lookup tables. Policies can be
+    shared between threads and reused across any number of cleaning calls.
+
+    tags, attributes, styles and protocols are as per bleach's Cleaner; attributes must be a dict
+    mapping tag names (or '*') to lists of attribute names, AttributeRule instances or callables.
+    The module-level allowlists are used for any arguments left as None.
+
+    Callables cannot be reliably identified by the policy's fingerprint, so the results of
+    cleaning with a policy that uses them are never cached; its cacheable attribute is false.
+    """
+    def __init__(
+        self, tags=None, attributes=None, styles=(), protocols=ALLOWED_PROTOCOLS, script_types=None,
+        data_attribute_pattern=None
+    ):
+        if tags is None:
+            tags = ALLOWED_STORY_PAGE_TAGS
+        if attributes is None:
+            attributes = ALLOWED_STORY_PAGE_ATTRIBUTES
+        if script_types is None:
+            script_types = ALLOWED_SCRIPT_TYPES
+        if data_attribute_pattern is None:
+            data_attribute_pattern = DATA_ATTR_RE
+        elif isinstance(data_attribute_pattern, str):
+            data_attribute_pattern = re.compile(data_attribute_pattern)
+
+        set_attr = super().__setattr__
+        set_attr('tags', frozenset(tag.lower() for tag in tags))
+        set_attr('styles', frozenset(styles))
+        set_attr('protocols', frozenset(protocols))
+        set_attr('script_types', frozenset(script_types))
+        set_attr('data_attribute_pattern', data_attribute_pattern)
+
+        # tag => (allowed attribute names, whether data-* attributes are allowed, callable or None,
+        # whether to fall back on the '*' rule when the attribute is not found)
+        rules = {}
+        for tag, rule in attributes.items():
+            if isinstance(rule, AttributeRule):
+                rules[tag] = (frozenset(rule.allowed_attributes), True, None, False)
+            elif callable(rule):
+                rules[tag] = (frozenset(), False, rule, False)
+            else:
+                rules[tag] = (frozenset(rule), False, None, True)
+        set_attr('_rules', rules)
+        set_attr('cacheable', all(func is None for _, _, func, _ in rules.values()))
+        set_attr('_global_rule', rules.pop('*', None))
+        set_attr('fingerprint', self._compute_fingerprint())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SanitizationPolicy objects are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("SanitizationPolicy objects are immutable")
+
+    def __repr__(self):
+        return "<SanitizationPolicy: %s>" % self.fingerprint
+
+    def _compute_fingerprint(self):
+        """
+        Return a hash of this policy's rules, which is stable across processes as long as the
+        rules do not include callables. Callables are identified by their repr, which may be
+        reused by another callable once they are garbage collected, so fingerprints of policies
+        that are not cacheable must not be used as cache keys.
+        """
+        def canonical_rule(rule):
+            names, allow_data, func, fall_back = rule
+            return (sorted(names), allow_data, None if func is None else repr(func), fall_back)
+
+        rules = dict(self._rules)
+        if self._global_rule is not None:
+            rules['*'] = self._global_rule
+        canonical = repr((
+            sorted(self.tags),
+            sorted((tag, canonical_rule(rule)) for tag, rule in rules.items()),
+            sorted(self.styles),
+            sorted(self.protocols),
+            sorted(self.script_types),
+            self.data_attribute_pattern.pattern,
+        ))
+        return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+    def allows_attribute(self, tag, name, value=None):
+        """
+        Return whether the attribute with the given name (and value) is allowed on the given tag.
+        This accepts the same arguments as a bleach attribute filter.
+        """
+        for rule in (self._rules.get(tag), self._global_rule):
+            if rule is None:
+                continue
+            names, allow_data, func, fall_back = rule
+            if func is not None:
+                return bool(func(tag, name, value))
+            if name in names:
+                return True
+            # only attribute names with the data- prefix need to be checked against the pattern
+            if allow_data and name.startswith('data-') and self.data_attribute_pattern.match(name):
+                return True
+            if not fall_back:
+                return False
+        return False
+
+    def allows_script(self, script_type):
+        """
+        Return whether a <script> element with the given type attribute (None if absent) is allowed
+        """
+        return script_type in self.script_types
+
+    def derive(self, tags=(), attributes=None, styles=(), protocols=(), script_types=()):
+        """
+        Return a new policy that additionally allows the given tags, styles, protocols and script
+        types. attributes is a dict mapping tag names to lists of attribute names to allow on
+        them, on top of those already allowed; tags not already covered by this policy also get
+        the global and data-* attributes, as per AttributeRule. A callable or AttributeRule
+        replaces the tag's existing rule.
+
+        For example, to allow simple inline SVG:
+
+            policy.derive(tags=['svg', 'path'], attributes={'svg': ['viewBox'], 'path': ['d']})
+        """
+        rules = self.attribute_rules()
+        for tag, extra in (attributes or {}).items():
+            rule = rules.get(tag)
+            if isinstance(extra, AttributeRule) or callable(extra):
+                rules[tag] = extra
+            elif isinstance(rule, AttributeRule):
+                rules[tag] = AttributeRule(sorted(rule.allowed_attributes.union(extra)))
+            elif rule is not None and not callable(rule):
+                rules[tag] = sorted(set(rule).union(extra))
+            else:
+                rules[tag] = AttributeRule(list(extra))
+
+        return SanitizationPolicy(
+            tags=self.tags | frozenset(tags),
+            attributes=rules,
+            styles=self.styles | frozenset(styles),
+            protocols=self.protocols | frozenset(protocols),
+            script_types=self.script_types | frozenset(script_types),
+            data_attribute_pattern=self.data_attribute_pattern,
+        )
+
+    def attribute_rules(self):
+        """
+        Return a new dict of this policy's attribute rules, in the form accepted by the
+        constructor
+        """
+        rules = dict(self._rules)
+        if self._global_rule is not None:
+            rules['*'] = self._global_rule
+
+        for tag, (names, allow_data, func, fall_back) in rules.items():
+            if func is not None:
+                rules[tag] = func
+            elif allow_data:
+                rule = AttributeRule()
+                rule.allowed_attributes = set(names)
+                rules[tag] = rule
+            else:
+                rules[tag] = sorted(names)
+        return rules
+
+
+# the most recently seen module-level allowlists and the policy compiled from them
+_default_policy = (None, None)
+
+
+def default_policy():
+    """
+    Return a SanitizationPolicy for the module-level allowlists. This is only recompiled when
+    ALLOWED_STORY_PAGE_TAGS, ALLOWED_STORY_PAGE_ATTRIBUTES, ALLOWED_SCRIPT_TYPES or DATA_ATTR_RE
+    are modified or replaced.
+    """
+    global _default_policy
+
+    # compare the live AttributeRule sets to the stored copies, rather than copying them on
+    # every call, as this runs for each page cleaned
+    attributes = {
+        tag: rule.allowed_attributes if isinstance(rule, AttributeRule) else rule
+        for tag, rule in ALLOWED_STORY_PAGE_ATTRIBUTES.items()
+    }
+    allowlist = (
+        tuple(ALLOWED_STORY_PAGE_TAGS), attributes, tuple(ALLOWED_SCRIPT_TYPES), DATA_ATTR_RE,
+    )
+    last_allowlist, policy = _default_policy
+    if allowlist != last_allowlist:
+        policy = SanitizationPolicy()
+        attributes = {
+            tag: frozenset(rule.allowed_attributes) if isinstance(rule, AttributeRule) else rule
+            for tag, rule in ALLOWED_STORY_PAGE_ATTRIBUTES.items()
+        }
+        _default_policy = (allowlist[:1] + (attributes,) + allowlist[2:], policy)
+
+    return policy
+
+
+# The following tables mirror the html5lib parser and serializer behaviour that StoryPageCleaner
+# relies on, so that StoryPageTreeCleaner can reproduce its output without re-parsing.
+
+# elements serialized without a closing tag
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'command', 'embed', 'event-source', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track',
+])
+
+# elements that the html5lib parser never gives any content, but which are not serialized as void;
+# other parsers may place content inside them, which html5lib would move after the element
+PARSER_VOID_ELEMENTS = frozenset(['basefont', 'bgsound', 'frame', 'image', 'keygen', 'wbr'])
+
+# attributes serialized in minimized form, keyed by element name ('' applies to all elements)
+BOOLEAN_ATTRIBUTES = {
+    '': frozenset(['irrelevant', 'itemscope']),
+    'audio': frozenset(['autoplay', 'controls']),
+    'button': frozenset(['disabled', 'autofocus']),
+    'command': frozenset(['hidden', 'disabled', 'checked', 'default']),
+    'datagrid': frozenset(['multiple', 'disabled']),
+    'details': frozenset(['open']),
+    'fieldset': frozenset(['disabled', 'readonly']),
+    'hr': frozenset(['noshade']),
+    'iframe': frozenset(['seamless']),
+    'img': frozenset(['ismap']),
+    'input': frozenset(['disabled', 'readonly', 'required', 'autofocus', 'checked', 'ismap']),
+    'menu': frozenset(['autosubmit']),
+    'optgroup': frozenset(['disabled', 'readonly']),
+    'option': frozenset(['disabled', 'readonly', 'selected']),
+    'output': frozenset(['disabled', 'readonly']),
+    'script': frozenset(['defer', 'async']),
+    'select': frozenset(['disabled', 'readonly', 'autofocus', 'multiple']),
+    'style': frozenset(['scoped']),
+    'video': frozenset(['autoplay', 'controls']),
+}
+
+# attributes whose values are checked against the allowed URL protocols
+URI_ATTRIBUTES = frozenset([
+    'action', 'background', 'cite', 'datasrc', 'dynsrc', 'href', 'longdesc', 'lowsrc', 'ping',
+    'poster', 'src',
+])
+
+# elements and attributes whose handling in html5lib (foreign content, table fostering, form
+# controls, raw text content, SVG references) is not reproduced by StoryPageTreeCleaner
+UNSUPPORTED_TAGS = frozenset([
+    'applet', 'body', 'caption', 'col', 'colgroup', 'form', 'frame', 'frameset', 'head', 'html',
+    'iframe', 'image', 'input', 'keygen', 'listing', 'marquee', 'math', 'nobr', 'noembed',
+    'noframes', 'object', 'optgroup', 'option', 'plaintext', 'select', 'style', 'svg', 'table',
+    'tbody', 'td', 'textarea', 'tfoot', 'th', 'thead', 'title', 'tr', 'xmp',
+])
+UNSUPPORTED_ATTRIBUTES = frozenset([
+    'clip-path', 'color-profile', 'cursor', 'fill', 'filter', 'marker', 'marker-end', 'marker-mid',
+    'marker-start', 'mask', 'stroke',
+])
+
+# start tags that implicitly close an open <p>
+CLOSES_P_TAGS = frozenset([
+    'address', 'article', 'aside', 'blockquote', 'center', 'dd', 'details', 'dialog', 'dir', 'div',
+    'dl', 'dt', 'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5',
+    'h6', 'header', 'hgroup', 'hr', 'li', 'listing', 'main', 'menu', 'nav', 'ol', 'p', 'plaintext',
+    'pre', 'section', 'summary', 'table', 'ul', 'xmp',
+])
+HEADING_TAGS = frozenset(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+RUBY_TAGS = frozenset(['rb', 'rp', 'rt', 'rtc'])
+IMPLIED_END_TAGS = frozenset([
+    'dd', 'dt', 'li', 'option', 'optgroup', 'p', 'rb', 'rp', 'rt', 'rtc',
+])
+SCOPE_TAGS = frozenset([
+    'applet', 'caption', 'html', 'marquee', 'object', 'table', 'td', 'th',
+])
+BUTTON_SCOPE_TAGS = SCOPE_TAGS | {'button'}
+SPECIAL_TAGS = frozenset([
+    'address', 'applet', 'area', 'article', 'aside', 'base', 'basefont', 'bgsound', 'blockquote',
+    'body', 'br', 'button', 'caption', 'center', 'col', 'colgroup', 'command', 'dd', 'details',
+    'dir', 'div', 'dl', 'dt', 'embed', 'fieldset', 'figure', 'footer', 'form', 'frame', 'frameset',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'head', 'header', 'hr', 'html', 'iframe', 'image', 'img',
+    'input', 'isindex', 'li', 'link', 'listing', 'marquee', 'menu', 'meta', 'nav', 'noembed',
+    'noframes', 'noscript', 'object', 'ol', 'p', 'param', 'plaintext', 'pre', 'script', 'section',
+    'select', 'style', 'table', 'tbody', 'td', 'textarea', 'tfoot', 'th', 'thead', 'title', 'tr',
+    'ul', 'wbr', 'xmp',
+])
+
+# bs4's html.parser tree builder keeps the content of these elements as unparsed text
+CDATA_TAGS = frozenset(['script', 'style'])
+
+SPACE_CHARACTERS = '\t\n\x0c\r '
+INVALID_ATTRIBUTE_NAME_RE = re.compile(r'[\s"\'<>=/]')
+URI_STRIP_RE = re.compile(r'[`\000-\040\177-\240\s]+')
+CSS_URL_RE = re.compile(r'url\s*\(\s*[^\s)]+?\s*\)\s*')
+CSS_GAUNTLET_RE = re.compile(
+    r"""^([/:,#%!.\s\w]|\w-\w|'[\s\w]+'\s*|"[\s\w]+"|\([\d,%\.\s]+\))*$""", flags=re.U
+)
+CSS_DECLARATIONS_RE = re.compile(r'^\s*([-\w]+\s*:[^:;]*(;\s*|$))*$')
+CSS_DECLARATION_RE = re.compile(r'([-\w]+)\s*:\s*([^:;]*)')
+
+
+def sanitize_uri(value, protocols):
+    """
+    Return the given (entity-decoded) attribute value if it is a URL using one of the allowed
+    protocols, or None otherwise
+    """
+    normalized = URI_STRIP_RE.sub('', value).replace('\ufffd', '').lower()
+    try:
+        parsed = urlparse(normalized)
+    except ValueError:
+        return None
+
+    if parsed.scheme:
+        if parsed.scheme in protocols:
+            return value
+    elif (
+        normalized.startswith('#')
+        or (':' in normalized and normalized.split(':')[0] in protocols)
+        or 'http' in protocols
+    ):
+        return value
+
+    return None
+
+
+def sanitize_css(style, styles):
+    """
+    Return the (entity-decoded) style attribute value filtered to the allowed CSS properties
+    """
+    if not styles:
+        return ''
+
+    style = CSS_URL_RE.sub(' ', style)
+    if not all(CSS_GAUNTLET_RE.match(part) for part in style.split(';')):
+        return ''
+    if not CSS_DECLARATIONS_RE.match(style):
+        return ''
+
+    return ' '.join(
+        prop + ': ' + value + ';'
+        for prop, value in CSS_DECLARATION_RE.findall(style)
+        if value and prop.lower() in styles
+    )
+
+
+def css_is_clean(style, styles):
+    """
+    Return whether sanitize_css would keep every declaration of the (entity-decoded) style
+    attribute value intact
+    """
+    declarations = [
+        (prop, value) for prop, value in CSS_DECLARATION_RE.findall(style) if value
+    ]
+    if not declarations:
+        return not style.strip()
+    return sanitize_css(style, styles) == ' '.join(
+        prop + ': ' + value + ';' for prop, value in declarations
+    )
+
+
+def replace_invisible_characters(text):
+    """
+    Replace control characters with INVISIBLE_REPLACEMENT_CHAR, leaving leading and trailing
+    whitespace untouched
+    """
+    middle = text.strip(SPACE_CHARACTERS)
+    if not middle:
+        return text
+    start = len(text) - len(text.lstrip(SPACE_CHARACTERS))
+    return (
+        text[:start]
+        + INVISIBLE_CHARACTERS_RE.sub(INVISIBLE_REPLACEMENT_CHAR, middle)
+        + text[start + len(middle):]
+    )
+
+
+def normalize_text(text):
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    if INVISIBLE_CHARACTERS_RE.search(text):
+        text = replace_invisible_characters(text)
+    return text
+
+
+def escape_text(text):
+    return normalize_text(text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def escape_raw_text(text):
+    """
+    Escape text that has not been through entity decoding, leaving existing character
+    references intact
+    """
+    text = normalize_text(text)
+    if '&' in text:
+        parts = []
+        for part in html5lib_shim.next_possible_entity(text):
+            if part.startswith('&') and html5lib_shim.match_entity(part) is None:
+                part = '&amp;' + part[1:]
+            parts.append(part)
+        text = ''.join(parts)
+    return text.replace('<', '&lt;').replace('>', '&gt;')
+
+
+def escape_attribute(value):
+    if '\r' in value:
+        value = value.replace('\r\n', '\n').replace('\r', '\n')
+    value = value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    if '"' not in value:
+        return '"%s"' % value
+    elif "'" not in value:
+        return "'%s'" % value
+    else:
+        return '"%s"' % value.replace('"', '&quot;')
+
+
+# elements that start on a new line, so that whitespace immediately before or after them is not
+# rendered
+BLOCK_TAGS = frozenset([
+    'address', 'article', 'aside', 'blockquote', 'br', 'caption', 'col', 'colgroup', 'dd', 'div',
+    'dl', 'dt', 'figcaption', 'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header',
+    'hgroup', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table', 'tbody', 'td',
+    'tfoot', 'th', 'thead', 'tr', 'ul',
+    'amp-story-page', 'amp-story-grid-layer', 'amp-story-cta-layer',
+])
+
+# elements that lay out their children as grid items, so that whitespace directly within them is
+# not rendered
+GRID_CONTAINER_TAGS = frozenset(['amp-story-page', 'amp-story-grid-layer', 'amp-story-cta-layer'])
+
+# elements whose whitespace is significant
+PRESERVE_WHITESPACE_TAGS = frozenset([
+    'listing', 'noscript', 'plaintext', 'pre', 'script', 'style', 'textarea', 'xmp',
+])
+
+WHITESPACE_RUN_RE = re.compile(r'[ \t\n\r\x0c]+')
+
+
+def compact_whitespace(parts, after_block, before_block):
+    """
+    Given a list of adjacent pieces of text, collapse each run of whitespace to a single space,
+    and remove any at the start (if after_block) or end (if before_block) of the text. Pieces
+    other than strings (such as bleach's entity tokens) are left in place.
+    """
+    merged = []
+    for part in parts:
+        if isinstance(part, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += part
+        else:
+            merged.append(part)
+
+    result = []
+    for i, part in enumerate(merged):
+        if isinstance(part, str):
+            part = WHITESPACE_RUN_RE.sub(' ', part)
+            if i == 0 and after_block:
+                part = part.lstrip(' ')
+            if i == len(merged) - 1 and before_block:
+                part = part.rstrip(' ')
+            if not part:
+                continue
+        result.append(part)
+    return result
+
+
+class CompactWhitespaceFilter(html5lib_shim.Filter):
+    """
+    html5lib filter that removes insignificant whitespace from bleach's output, in the same way as
+    StoryPageTreeCleaner with compact=True
+    """
+    def __iter__(self):
+        open_tags = []
+        preserve_depth = 0
+        after_block = True
+        # Characters tokens, and the Entity tokens that bleach puts between them
+        pending = []
+
+        for token in super().__iter__():
+            token_type = token['type']
+            if token_type in ('Characters', 'SpaceCharacters', 'Entity') and not preserve_depth:
+                pending.append(token['data'] if token_type != 'Entity' else token)
+                continue
+
+            is_tag = token_type in ('StartTag', 'EndTag', 'EmptyTag')
+            if pending:
+                in_grid = not open_tags or open_tags[-1] in GRID_CONTAINER_TAGS
+                yield from self.text_tokens(pending, after_block or in_grid, in_grid or (
+                    is_tag and token['name'] in BLOCK_TAGS
+                ))
+                pending = []
+
+            if is_tag:
+                name = token['name']
+                if token_type == 'StartTag':
+                    open_tags.append(name)
+                    if name in PRESERVE_WHITESPACE_TAGS:
+                        preserve_depth += 1
+                elif token_type == 'EndTag' and name in open_tags:
+                    while open_tags:
+                        open_name = open_tags.pop()
+                        if open_name in PRESERVE_WHITESPACE_TAGS:
+                            preserve_depth -= 1
+                        if open_name == name:
+                            break
+                after_block = name in BLOCK_TAGS
+            yield token
+
+        if pending:
+            yield from self.text_tokens(pending, True, True)
+
+    @staticmethod
+    def text_tokens(pending, after_block, before_block):
+        for part in compact_whitespace(pending, after_block, before_block):
+            if isinstance(part, str):
+                yield {'type': 'Characters', 'data': part}
+            else:
+                yield part
+
+
+class StoryPageTreeCleaner:
+    """
+    Sanitizes an already-parsed BeautifulSoup node in a single pass, producing the same HTML as
+    passing str(node) through StoryPageCleaner (after removing disallowed <script> tags).
+
+    Markup that the html5lib parser inside bleach would restructure (such as a <div> inside a <p>,
+    or any table markup) raises UnsupportedMarkup, so that the caller can fall back on
+    StoryPageCleaner.
+    """
+    class UnsupportedMarkup(Exception):
+        pass
+
+    def __init__(self, policy=None, compact=False):
+        if policy is None:
+            policy = default_policy()
+        self.policy = policy
+        self.compact = compact
+
+    def clean_node(self, node):
+        """
+        Return the AMP-cleaned version of a BeautifulSoup DOM node object, as an HTML string.
+        The node object is not modified.
+        """
+        walk = _TreeWalk(self)
+        if isinstance(node, BeautifulSoup):
+            walk.children(node)
+        else:
+            walk.node(node)
+        return walk.finish()
+
+    def check_insertion(self, name, open_tags):
+        """
+        Raise UnsupportedMarkup if html5lib would not insert an element with the given name as a
+        child of the innermost of open_tags
+        """
+        if name in UNSUPPORTED_TAGS:
+            raise StoryPageTreeCleaner.UnsupportedMarkup(name)
+        if not open_tags:
+            return
+
+        if name in CLOSES_P_TAGS and self.in_scope('p', open_tags, BUTTON_SCOPE_TAGS):
+            raise StoryPageTreeCleaner.UnsupportedMarkup(name)
+        if name in HEADING_TAGS and open_tags[-1] in HEADING_TAGS:
+            raise StoryPageTreeCleaner.UnsupportedMarkup(name)
+        if name == 'button' and self.in_scope('button', open_tags, SCOPE_TAGS):
+            raise StoryPageTreeCleaner.UnsupportedMarkup(name)
+        if name == 'a' and self.in_scope('a', open_tags, SCOPE_TAGS):
+            raise StoryPageTreeCleaner.UnsupportedMarkup(name)
+        if name in RUBY_TAGS and open_tags[-1] in IMPLIED_END_TAGS:
+            raise StoryPageTreeCleaner.UnsupportedMarkup(name)
+
+        if name in ('li', 'dd', 'dt'):
+            closed_by = ('li',) if name == 'li' else ('dd', 'dt')
+            for open_tag in reversed(open_tags):
+                if open_tag in closed_by:
+                    raise StoryPageTreeCleaner.UnsupportedMarkup(name)
+                if open_tag in SPECIAL_TAGS and open_tag not in ('address', 'div', 'p'):
+                    break
+
+    @staticmethod
+    def in_scope(name, open_tags, scope_tags):
+        for open_tag in reversed(open_tags):
+            if open_tag == name:
+                return True
+            if open_tag in scope_tags:
+                return False
+        return False
+
+    def clean_attributes(self, name, attrs):
+        clean_attrs = []
+        for attr_name, value in attrs.items():
+            if isinstance(value, list):
+                value = ' '.join(value)
+            if INVALID_ATTRIBUTE_NAME_RE.search(attr_name) or not attr_name:
+                continue
+            if not self.policy.allows_attribute(name, attr_name, value):
+                continue
+            if attr_name in UNSUPPORTED_ATTRIBUTES:
+                raise StoryPageTreeCleaner.UnsupportedMarkup(attr_name)
+            if attr_name in URI_ATTRIBUTES:
+                value = sanitize_uri(value, self.policy.protocols)
+                if value is None:
+                    continue
+            elif attr_name == 'style':
+                value = sanitize_css(value, self.policy.styles)
+            clean_attrs.append((attr_name, value))
+
+        clean_attrs.sort()
+        boolean_attrs = BOOLEAN_ATTRIBUTES.get(name, ())
+        return ''.join(
+            (
+                ' ' + attr_name if attr_name in boolean_attrs or attr_name in BOOLEAN_ATTRIBUTES['']
+                else ' %s=%s' % (attr_name, escape_attribute(value))
+            )
+            for attr_name, value in clean_attrs
+        )
+
+
+class _TreeWalk:
+    """
+    The state of a single StoryPageTreeCleaner.clean_node call
+    """
+    def __init__(self, cleaner):
+        self.cleaner = cleaner
+        self.output = []
+        self.open_tags = []
+        # adjacent text nodes, which html5lib would merge into one
+        self.text_buffer = []
+        # html5lib drops a newline immediately following a <pre> start tag
+        self.in_empty_pre = False
+
+        self.compact = cleaner.compact
+        # whether the last tag output starts a new line, for compact output
+        self.after_block = True
+        # number of open elements within which whitespace is significant
+        self.preserve_depth = 0
+
+    def children(self, node):
+        for child in node.children:
+            self.node(child)
+
+    def node(self, node):
+        if isinstance(node, NavigableString):
+            if isinstance(node, PreformattedString):
+                # comments, CDATA sections, doctypes and processing instructions are dropped,
+                # apart from any text that bs4 outputs after them
+                if not self.compact:
+                    self.flush_text()
+                self.in_empty_pre = False
+                self.text(node.SUFFIX[node.SUFFIX.rfind('>') + 1:])
+            else:
+                self.text(node)
+            return
+
+        name = node.name
+        if name == 'script' and not self.cleaner.policy.allows_script(node.get('type')):
+            return
+
+        if name not in self.cleaner.policy.tags:
+            # strip the tag but keep its content
+            if name in CDATA_TAGS:
+                self.cdata(node)
+            else:
+                self.children(node)
+            return
+
+        self.cleaner.check_insertion(name, self.open_tags)
+        if name in PARSER_VOID_ELEMENTS and node.contents:
+            raise StoryPageTreeCleaner.UnsupportedMarkup(name)
+        is_block = name in BLOCK_TAGS
+        self.flush_text(is_block)
+        self.in_empty_pre = False
+        self.output.append(
+            '<%s%s>' % (name, self.cleaner.clean_attributes(name, node.attrs))
+        )
+        self.after_block = is_block
+        if name in VOID_ELEMENTS:
+            # any children end up as siblings
+            self.children(node)
+            return
+
+        if name == 'script':
+            self.output.append(escape_raw_text(node.decode_contents()))
+        elif name == 'noscript':
+            # parsed as raw text, as bleach treats scripting as enabled
+            html = self.serialize_contents(node)
+            if '</noscript' in html.lower():
+                raise StoryPageTreeCleaner.UnsupportedMarkup(name)
+            self.output.append(escape_raw_text(html))
+        else:
+            preserve = name in PRESERVE_WHITESPACE_TAGS
+            self.preserve_depth += preserve
+            self.open_tags.append(name)
+            self.in_empty_pre = (name == 'pre')
+            self.children(node)
+            self.flush_text(is_block)
+            self.in_empty_pre = False
+            self.open_tags.pop()
+            self.preserve_depth -= preserve
+
+        self.output.append('</%s>' % name)
+        self.after_block = is_block
+
+    def text(self, text):
+        if not text:
+            return
+        if self.in_empty_pre:
+            self.in_empty_pre = False
+            if text.startswith('\r\n'):
+                text = text[2:]
+            elif text[0] in '\r\n':
+                text = text[1:]
+        self.text_buffer.append(text)
+
+    def flush_text(self, before_block=True):
+        if self.text_buffer:
+            text = ''.join(self.text_buffer)
+            self.text_buffer = []
+            if self.compact and not self.preserve_depth:
+                in_grid = not self.open_tags or self.open_tags[-1] in GRID_CONTAINER_TAGS
+                text = ''.join(compact_whitespace(
+                    [normalize_text(text)], self.after_block or in_grid, before_block or in_grid
+                ))
+            self.output.append(escape_text(text))
+
+    def finish(self):
+        self.flush_text()
+        return ''.join(self.output)
+
+    def cdata(self, node):
+        """
+        Handle the unparsed content of a stripped <style> or <script> element, which html5lib
+        parses as markup
+        """
+        text = node.decode_contents()
+        if '&' in text or '<' in text:
+            raise StoryPageTreeCleaner.UnsupportedMarkup(node.name)
+        self.text(text)
+
+    def serialize_contents(self, node):
+        allows_script = self.cleaner.policy.allows_script
+        scripts = [
+            script for script in node.find_all('script')
+            if not allows_script(script.get('type'))
+        ]
+        if scripts:
+            node = copy.copy(node)
+            for script in node.find_all('script'):
+                if not allows_script(script.get('type')):
+                    script.extract()
+        return node.decode_contents()
@@ -0,0 +1,287 @@
+"""
+Parses and cleans story HTML files in bulk, writing one JSON object per story to the output as
+each one completes:
+
+    python -m webstories stories/ 'archive/**/*.html' backup.tar.gz --output stories.jsonl
+
+Inputs may be files, directories (searched recursively for .html / .htm files), glob patterns,
+tar or zip archives, or '-' for a single story read from standard input.
+"""
+import argparse
+import fnmatch
+import glob
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from . import Story
+from .manifest import METADATA_FIELDS
+
+
+HTML_PATTERNS = ('*.html', '*.htm')
+TAR_PATTERNS = ('*.tar', '*.tar.gz', '*.tgz', '*.tar.bz2', '*.tbz2', '*.tar.xz', '*.txz')
+ZIP_PATTERNS = ('*.zip',)
+
+PAGE_OUTPUTS = ('html', 'fingerprint', 'none')
+
+
+def matches(name, patterns):
+    name = name.lower()
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def iter_sources(inputs, stdin=None, skip=None):
+    """
+    Yield a (name, data) tuple for each story document in the given inputs, where data is the
+    document as bytes, or an OSError if it could not be read. Archives are read one member at a
+    time, and tar archives as a stream, so only one document is held in memory at once. Documents
+    whose names the skip function returns true for are not read.
+    """
+    for path in inputs:
+        if path == '-':
+            if not (skip and skip('-')):
+                yield '-', (stdin or sys.stdin.buffer).read()
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for filename in sorted(files):
+                    if matches(filename, HTML_PATTERNS):
+                        yield from iter_file(os.path.join(root, filename), skip)
+        elif not os.path.exists(path) and glob.has_magic(path):
+            for filename in sorted(glob.glob(path, recursive=True)):
+                if os.path.isfile(filename):
+                    yield from iter_file(filename, skip)
+        else:
+            yield from iter_file(path, skip)
+
+
+def iter_file(path, skip=None):
+    try:
+        if matches(path, TAR_PATTERNS):
+            with tarfile.open(path, 'r|*') as archive:
+                for member in archive:
+                    name = '%s:%s' % (path, member.name)
+                    if (
+                        member.isfile() and matches(member.name, HTML_PATTERNS)
+                        and not (skip and skip(name))
+                    ):
+                        yield name, archive.extractfile(member).read()
+        elif matches(path, ZIP_PATTERNS):
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    name = '%s:%s' % (path, info.filename)
+                    if (
+                        not info.is_dir() and matches(info.filename, HTML_PATTERNS)
+                        and not (skip and skip(name))
+                    ):
+                        yield name, archive.read(info)
+        elif not (skip and skip(path)):
+            with open(path, 'rb') as f:
+                yield path, f.read()
+    except (OSError, tarfile.TarError, zipfile.BadZipFile) as e:
+        yield path, OSError(str(e))
+
+
+def process_story(name, data, engine='native', backend=None, pages='html', compact=False):
+    """
+    Parse a story document and return the JSON-serializable result for it
+    """
+    if isinstance(data, Exception):
+        return error_result(name, data)
+    try:
+        story = Story(data, backend=backend)
+        result = {'source': name}
+        for field in METADATA_FIELDS:
+            result[field] = getattr(story, field)
+        if pages == 'html':
+            result['pages'] = [
+                {
+                    'id': page.id,
+                    'html': page.get_clean_html(engine=engine, backend=backend, compact=compact),
+                }
+                for page in story.pages
+            ]
+        elif pages == 'fingerprint':
+            result['pages'] = [
+                {'id': page.id, 'fingerprint': page.fingerprint} for page in story.pages
+            ]
+        else:
+            result['page_count'] = len(story.pages)
+        return result
+    except Exception as e:
+        return error_result(name, e)
+
+
+def error_result(name, exception):
+    return {
+        'source': name,
+        'error': type(exception).__name__,
+        'message': str(exception),
+    }
+
+
+class Checkpoint:
+    """
+    A file listing the names of the sources that have been processed, one per line, so that an
+    interrupted run can be resumed. Each name is appended once its result has been written.
+    """
+    def __init__(self, path):
+        self.path = path
+        # number of sources passed to is_done that were already processed
+        self.skipped = 0
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done.update(line.rstrip('\n') for line in f if line.strip())
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def is_done(self, name):
+        if name in self.done:
+            self.skipped += 1
+            return True
+        return False
+
+    def add(self, name):
+        self.file.write(name + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class Stats:
+    def __init__(self):
+        self.stories = 0
+        self.errors = 0
+        self.skipped = 0
+        self.pages = 0
+        self.bytes = 0
+        self.start_time = time.perf_counter()
+
+    def add(self, result, size):
+        self.stories += 1
+        self.bytes += size
+        if 'error' in result:
+            self.errors += 1
+        else:
+            self.pages += len(result['pages']) if 'pages' in result else result['page_count']
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9)
+        return (
+            "%d stories (%d pages, %d errors, %d skipped) in %.2fs: "
+            "%.1f stories/s, %.2f MB/s" % (
+                self.stories, self.pages, self.errors, self.skipped, elapsed,
+                self.stories / elapsed, self.bytes / elapsed / 1000000,
+            )
+        )
+
+
+def process(sources, output, workers=None, executor='process', checkpoint=None, **options):
+    """
+    Process each (name, data) tuple from sources, writing the results to the output file as JSON
+    Lines in order of completion (and recording them in the Checkpoint, if given), and return a
+    Stats object. At most twice as many stories as there are workers are read ahead of the
+    results being written.
+    """
+    stats = Stats()
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    def write(result, size):
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+        stats.add(result, size)
+        if checkpoint is not None:
+            checkpoint.add(result['source'])
+
+    if workers <= 1:
+        for name, data in sources:
+            write(process_story(name, data, **options), sizeof(data))
+        return stats
+
+    if executor == 'process':
+        pool = ProcessPoolExecutor(max_workers=workers)
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+
+    # future => input size
+    pending = {}
+    try:
+        for name, data in sources:
+            pending[pool.submit(process_story, name, data, **options)] = sizeof(data)
+            if len(pending) >= workers * 2:
+                done, __ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result(), pending.pop(future))
+        while pending:
+            done, __ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                write(future.result(), pending.pop(future))
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown()
+    return stats
+
+
+def sizeof(data):
+    return 0 if isinstance(data, Exception) else len(data)
+
+
+def main(args=None, stdin=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m webstories', description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('inputs', nargs='+', help="files, directories, globs or archives")
+    parser.add_argument('--output', help="file to write JSON Lines to (defaults to stdout)")
+    parser.add_argument(
+        '--pages', choices=PAGE_OUTPUTS, default='html',
+        help="output the clean HTML of each page (the default), its fingerprint, or neither"
+    )
+    parser.add_argument('--engine', choices=('native', 'bleach'), default='native')
+    parser.add_argument('--backend', help="parser backend to use (defaults to 'auto')")
+    parser.add_argument('--compact', action='store_true', help="remove insignificant whitespace")
+    parser.add_argument(
+        '--workers', type=int, help="number of workers (defaults to the number of CPUs)"
+    )
+    parser.add_argument('--executor', choices=('process', 'thread'), default='process')
+    parser.add_argument(
+        '--checkpoint',
+        help="file recording the sources processed so far; sources listed in it are skipped, "
+        "and output is appended to rather than overwritten"
+    )
+    parser.add_argument('--quiet', action='store_true', help="don't report statistics")
+    options = parser.parse_args(args)
+
+    checkpoint = Checkpoint(options.checkpoint) if options.checkpoint else None
+    if options.output:
+        mode = 'a' if checkpoint is not None and checkpoint.done else 'w'
+        output = open(options.output, mode, encoding='utf-8')
+    else:
+        output = sys.stdout
+
+    try:
+        sources = iter_sources(
+            options.inputs, stdin=stdin, skip=checkpoint and checkpoint.is_done
+        )
+        stats = process(
+            sources, output, workers=options.workers, executor=options.executor,
+            checkpoint=checkpoint, engine=options.engine, backend=options.backend,
+            pages=options.pages, compact=options.compact,
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if checkpoint is not None:
+            checkpoint.close()
+
+    if checkpoint is not None:
+        stats.skipped = checkpoint.skipped
+    if not options.quiet:
+        sys.stderr.write(stats.report() + '\n')
@@ -0,0 +1,406 @@
+import re
+from html.parser import HTMLParser
+
+
+# at-rules whose blocks contain style rules, which are pruned recursively
+CONDITIONAL_AT_RULES = frozenset(['media', 'supports', 'document', '-moz-document', 'layer'])
+
+# attributes that the AMP runtime sets on elements after loading, so selectors on them may match
+# elements that do not have them in the markup
+RUNTIME_ATTRIBUTES = frozenset(['active', 'distance', 'hidden', 'aria-hidden', 'dir'])
+
+# prefixes of classes and attributes that the AMP runtime adds
+RUNTIME_PREFIXES = ('i-amphtml-', 'amp-')
+
+# elements that the AMP runtime renders within AMP elements, so selectors on them may match
+# although they are not in the markup
+RUNTIME_CHILDREN = {
+    'amp-img': ('img',),
+    'amp-anim': ('img',),
+    'amp-video': ('video',),
+    'amp-audio': ('audio',),
+    'amp-iframe': ('iframe',),
+    'amp-video-iframe': ('iframe',),
+    'amp-youtube': ('iframe',),
+    'amp-vimeo': ('iframe',),
+    'amp-dailymotion': ('iframe',),
+}
+
+COMMENT_RE = re.compile(r'/\*.*?(?:\*/|$)', re.S)
+# a run of characters that cannot be part of a string, comment, block or at-rule boundary
+PLAIN_RE = re.compile(r'[^"\'/{};()\[\]\\]+')
+IDENT_RE = re.compile(
+    r'(?:[-_a-zA-Z0-9\u0080-\U0010ffff]|\\[0-9a-fA-F]{1,6}\s?|\\[^\n0-9a-fA-F])+'
+)
+# a namespace separator following an attribute name, as opposed to the |= operator
+ATTRIBUTE_NAMESPACE_RE = re.compile(r'\|(?!=)')
+# characters that split_top_level has to look inside
+NESTING_RE = re.compile(r'[\\"\'(\[]')
+ESCAPE_RE = re.compile(r'\\([0-9a-fA-F]{1,6})\s?|\\(.)', re.S)
+
+
+def unescape_ident(ident):
+    def replace(match):
+        if match.group(1):
+            try:
+                return chr(int(match.group(1), 16))
+            except (ValueError, OverflowError):
+                return '\ufffd'
+        return match.group(2)
+    return ESCAPE_RE.sub(replace, ident)
+
+
+class SelectorIndex(HTMLParser):
+    """
+    An index of the elements of an HTML document by tag name, id, class and attribute name, for
+    testing whether CSS selectors could match any of them. Built once per document by passing it
+    to SelectorIndex.build.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.element_count = 0
+        # (kind, name) => set of element numbers, where kind is 'tag', 'id', 'class' or 'attr'
+        self.elements = {}
+
+    @classmethod
+    def build(cls, html):
+        index = cls()
+        index.feed(html)
+        index.close()
+        return index
+
+    def add(self, key, element):
+        try:
+            self.elements[key].add(element)
+        except KeyError:
+            self.elements[key] = {element}
+
+    def handle_starttag(self, tag, attrs):
+        element = self.element_count
+        self.element_count += 1
+        self.add(('tag', tag), element)
+        for name, value in attrs:
+            self.add(('attr', name), element)
+            if value is None:
+                continue
+            if name == 'id':
+                self.add(('id', value), element)
+            elif name == 'class':
+                for class_name in value.split():
+                    self.add(('class', class_name), element)
+
+        for child_tag in RUNTIME_CHILDREN.get(tag, ()):
+            self.add(('tag', child_tag), self.element_count)
+            self.element_count += 1
+
+    def compound_matches(self, keys):
+        """
+        Return whether any single element has all of the given (kind, name) keys
+        """
+        sets = []
+        for key in keys:
+            elements = self.elements.get(key)
+            if elements is None:
+                return False
+            sets.append(elements)
+        if not sets:
+            return True
+
+        sets.sort(key=len)
+        candidates = sets[0]
+        for elements in sets[1:]:
+            candidates = candidates & elements
+            if not candidates:
+                return False
+        return True
+
+    def selector_matches(self, selector):
+        """
+        Return whether the given complex selector could match an element of the document. This
+        checks that each compound selector within it matches some element, without checking the
+        relationships between them, and ignores pseudo-classes; it never returns False for a
+        selector that matches.
+        """
+        for compound in split_compounds(selector):
+            keys = compound_keys(compound)
+            if keys is None:
+                # something we don't understand, so assume it matches
+                continue
+            if not self.compound_matches(keys):
+                return False
+        return True
+
+
+# compiled patterns for split_top_level, by separator characters
+_split_patterns = {}
+
+
+def split_top_level(text, separators):
+    """
+    Split text on any of the given characters, ignoring those within brackets, parentheses or
+    strings. Returns a list of (part, separator) tuples.
+    """
+    if not NESTING_RE.search(text):
+        # nothing to skip over, so a regular expression split will do
+        pattern = _split_patterns.get(separators)
+        if pattern is None:
+            pattern = _split_patterns[separators] = re.compile('([%s])' % re.escape(separators))
+        pieces = pattern.split(text)
+        return list(zip(pieces[::2], pieces[1::2] + [None]))
+
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == '\\':
+            i += 2
+            continue
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth = max(depth - 1, 0)
+        elif depth == 0 and char in separators:
+            parts.append((text[start:i], char))
+            start = i + 1
+        i += 1
+    parts.append((text[start:], None))
+    return parts
+
+
+def split_compounds(selector):
+    """
+    Return the compound selectors of a complex selector, ignoring the combinators between them
+    """
+    return [
+        part.strip() for part, separator in split_top_level(selector, ' \t\n\r\f>+~')
+        if part.strip()
+    ]
+
+
+def compound_keys(compound):
+    """
+    Return a list of (kind, name) keys that an element must have to match a compound selector,
+    or None if it cannot be interpreted
+    """
+    keys = []
+    i = 0
+    length = len(compound)
+    while i < length:
+        char = compound[i]
+        if char in '.#':
+            match = IDENT_RE.match(compound, i + 1)
+            if match is None:
+                return None
+            name = unescape_ident(match.group())
+            if char == '#':
+                keys.append(('id', name))
+            elif not name.startswith(RUNTIME_PREFIXES):
+                keys.append(('class', name))
+            i = match.end()
+        elif char == '[':
+            end = split_top_level(compound[i + 1:], ']')[0][0]
+            match = IDENT_RE.match(end.strip())
+            if match is None or ATTRIBUTE_NAMESPACE_RE.match(end.strip(), match.end()):
+                return None
+            name = unescape_ident(match.group()).lower()
+            if name not in RUNTIME_ATTRIBUTES and not name.startswith(RUNTIME_PREFIXES):
+                keys.append(('attr', name))
+            i += len(end) + 2
+        elif char == ':':
+            # pseudo-classes and pseudo-elements don't narrow down the element
+            i += 1
+            if compound.startswith(':', i):
+                i += 1
+            match = IDENT_RE.match(compound, i)
+            if match is None:
+                return None
+            i = match.end()
+            if compound.startswith('(', i):
+                argument = split_top_level(compound[i + 1:], ')')[0][0]
+                i += len(argument) + 2
+        elif char == '*':
+            i += 1
+        elif i == 0:
+            match = IDENT_RE.match(compound)
+            if match is None:
+                return None
+            name = unescape_ident(match.group()).lower()
+            if not name.startswith('i-amphtml-'):
+                keys.append(('tag', name))
+            i = match.end()
+        else:
+            return None
+    return keys
+
+
+class CSSRule:
+    """
+    A top-level construct of a stylesheet: a style rule, an at-rule, or text that could not be
+    parsed (kind None). prelude is the text before the block, and block the text inside its
+    braces (None for statements such as @import).
+    """
+    def __init__(self, kind, text, prelude, block):
+        self.kind = kind
+        self.text = text
+        self.prelude = prelude
+        self.block = block
+
+
+def scan(css, start, stop):
+    """
+    Return the index just after the end of the construct starting at start, which ends at the
+    first of stop (';' or '}' or '{') outside strings, comments and brackets, or the index of a
+    '{' if '{' is in stop. Returns len(css) if there is none.
+    """
+    i = start
+    depth = 0
+    length = len(css)
+    while i < length:
+        match = PLAIN_RE.match(css, i)
+        if match:
+            i = match.end()
+            if i >= length:
+                break
+        char = css[i]
+        if char == '\\':
+            i += 2
+        elif char in '"\'':
+            end = i + 1
+            while end < length and css[end] != char and css[end] != '\n':
+                end += 2 if css[end] == '\\' else 1
+            i = end + 1
+        elif char == '/' and css.startswith('/*', i):
+            end = css.find('*/', i + 2)
+            i = length if end == -1 else end + 2
+        elif char in '([':
+            depth += 1
+            i += 1
+        elif char in ')]':
+            depth = max(depth - 1, 0)
+            i += 1
+        elif depth == 0 and char in stop:
+            return i
+        else:
+            i += 1
+    return length
+
+
+def parse_rules(css):
+    """
+    Split a stylesheet (or the content of a conditional at-rule) into a list of CSSRules
+    """
+    rules = []
+    i = 0
+    length = len(css)
+    while i < length:
+        # skip whitespace, comments and stray semicolons
+        while i < length:
+            if css[i] in ' \t\n\r\f;':
+                i += 1
+            elif css.startswith('/*', i):
+                end = css.find('*/', i + 2)
+                i = length if end == -1 else end + 2
+            elif css.startswith('<!--', i) or css.startswith('-->', i):
+                i += 4 if css[i] == '<' else 3
+            else:
+                break
+        if i >= length:
+            break
+
+        start = i
+        end = scan(css, i, '{;}')
+        if end >= length or css[end] == '}':
+            # unterminated or unbalanced; keep the remainder unchanged
+            rules.append(CSSRule(None, css[start:], None, None))
+            break
+        prelude = css[start:end]
+        if css[end] == ';':
+            rules.append(CSSRule('at-rule', css[start:end + 1], prelude, None))
+            i = end + 1
+            continue
+
+        block_start = end + 1
+        block_end = block_start
+        depth = 1
+        while depth:
+            block_end = scan(css, block_end, '{}')
+            if block_end >= length:
+                break
+            depth += 1 if css[block_end] == '{' else -1
+            block_end += 1
+        if depth:
+            rules.append(CSSRule(None, css[start:], None, None))
+            break
+
+        kind = 'at-rule' if prelude.startswith('@') else 'style'
+        rules.append(CSSRule(
+            kind, css[start:block_end], prelude, css[block_start:block_end - 1]
+        ))
+        i = block_end
+    return rules
+
+
+class OptimizedCSS:
+    """
+    The result of pruning a stylesheet: the new css text, the number of style rules removed,
+    and the sizes of the original and new stylesheets in UTF-8 encoded bytes
+    """
+    def __init__(self, css, original_css, removed_rules):
+        self.css = css
+        self.removed_rules = removed_rules
+        self.original_size = len(original_css.encode('utf-8', 'surrogatepass'))
+        self.size = len(css.encode('utf-8', 'surrogatepass'))
+
+    @property
+    def savings(self):
+        return self.original_size - self.size
+
+    def __str__(self):
+        return self.css
+
+    def __repr__(self):
+        return "<OptimizedCSS: %d bytes (saved %d bytes)>" % (self.size, self.savings)
+
+
+def prune_css(css, index):
+    """
+    Return an OptimizedCSS for the given stylesheet with the style rules that cannot match any
+    element in the SelectorIndex removed, along with comments
+    """
+    pruned_css, removed_rules = _prune_rules(css, index)
+    return OptimizedCSS(pruned_css, css, removed_rules)
+
+
+def _prune_rules(css, index):
+    output = []
+    removed_rules = 0
+    for rule in parse_rules(css):
+        if rule.kind == 'style':
+            selectors = COMMENT_RE.sub(' ', rule.prelude)
+            # a rule is only removed if none of its selectors can match, as removing part of a
+            # selector list could make it valid where it was not before
+            if not any(
+                index.selector_matches(selector.strip())
+                for selector, separator in split_top_level(selectors, ',')
+            ):
+                removed_rules += 1
+                continue
+        elif rule.kind == 'at-rule' and rule.block is not None:
+            name = IDENT_RE.match(rule.prelude, 1)
+            if name is not None and name.group().lower() in CONDITIONAL_AT_RULES:
+                block, removed = _prune_rules(rule.block, index)
+                removed_rules += removed
+                if not block and removed:
+                    continue
+                output.append('%s{%s}' % (rule.prelude, block))
+                continue
+        output.append(rule.text)
+    return '\n'.join(output), removed_rules
@@ -0,0 +1,176 @@
+"""
+Building a standalone AMP story document from a Story, for Story.iter_amp_html
+"""
+import re
+from html.parser import HTMLParser
+
+from .cleaner import (
+    INVALID_ATTRIBUTE_NAME_RE, URI_ATTRIBUTES, escape_attribute, escape_text, sanitize_css,
+    sanitize_uri
+)
+
+
+AMP_RUNTIME_URL = 'https://cdn.ampproject.org/v0.js'
+AMP_EXTENSION_URL = 'https://cdn.ampproject.org/v0/%s-%s.js'
+
+# as per https://amp.dev/documentation/guides-and-tutorials/learn/spec/amp-boilerplate/
+AMP_BOILERPLATE = (
+    '<style amp-boilerplate>body{-webkit-animation:-amp-start 8s steps(1,end) 0s 1 normal both;'
+    '-moz-animation:-amp-start 8s steps(1,end) 0s 1 normal both;-ms-animation:-amp-start 8s '
+    'steps(1,end) 0s 1 normal both;animation:-amp-start 8s steps(1,end) 0s 1 normal both}'
+    '@-webkit-keyframes -amp-start{from{visibility:hidden}to{visibility:visible}}'
+    '@-moz-keyframes -amp-start{from{visibility:hidden}to{visibility:visible}}'
+    '@-ms-keyframes -amp-start{from{visibility:hidden}to{visibility:visible}}'
+    '@-o-keyframes -amp-start{from{visibility:hidden}to{visibility:visible}}'
+    '@keyframes -amp-start{from{visibility:hidden}to{visibility:visible}}</style>'
+    '<noscript><style amp-boilerplate>body{-webkit-animation:none;-moz-animation:none;'
+    '-ms-animation:none;animation:none}</style></noscript>'
+)
+
+# elements provided by the AMP runtime itself, which need no extension script
+BUILTIN_ELEMENTS = frozenset(['amp-img', 'amp-layout', 'amp-pixel'])
+
+# elements provided by an extension of a different name
+EXTENSION_ELEMENTS = {
+    'amp-story-page': 'amp-story',
+    'amp-story-grid-layer': 'amp-story',
+    'amp-story-cta-layer': 'amp-story',
+    'amp-story-interactive-binary-poll': 'amp-story-interactive',
+    'amp-story-interactive-poll': 'amp-story-interactive',
+    'amp-story-interactive-quiz': 'amp-story-interactive',
+    'amp-story-interactive-results': 'amp-story-interactive',
+    'amp-state': 'amp-bind',
+}
+
+# extension versions, where not 0.1
+EXTENSION_VERSIONS = {'amp-story': '1.0'}
+
+# URL attributes of the <amp-story> element, which must use one of the policy's protocols
+AMP_STORY_URI_ATTRIBUTES = URI_ATTRIBUTES | {
+    'publisher-logo-src', 'poster-portrait-src', 'poster-square-src', 'poster-landscape-src',
+    'background-audio', 'entity-logo-src', 'entity-url',
+}
+
+# attributes that are never kept on the <amp-story> element: it has no actions, so an on
+# attribute could only be used to navigate away from the story
+EXCLUDED_AMP_STORY_ATTRIBUTES = frozenset(['on'])
+
+STYLE_END_TAG_RE = re.compile(r'</(style)', re.I)
+
+DOCUMENT_END = '</amp-story>\n</body>\n</html>\n'
+
+
+def extension_for_element(name):
+    """
+    Return the name of the extension providing the given AMP element, or None if it is built in
+    """
+    if name in BUILTIN_ELEMENTS:
+        return None
+    return EXTENSION_ELEMENTS.get(name, name)
+
+
+class ElementScanner(HTMLParser):
+    """
+    Event-based parser that collects the names of the elements in page HTML that survive
+    cleaning: those allowed by the policy, outside of comments, raw text (such as the body of a
+    JSON <script>) and <noscript> elements, whose contents are escaped as text by cleaning
+    """
+    def __init__(self, policy):
+        super().__init__()
+        self.policy = policy
+        self.names = set()
+        # <noscript> contents are raw text up to the first </noscript>, as when scripting is enabled
+        self._in_noscript = False
+
+    def handle_starttag(self, tag, attrs):
+        if self._in_noscript:
+            return
+        if tag in self.policy.tags:
+            self.names.add(tag)
+        if tag == 'noscript':
+            self._in_noscript = True
+
+    def handle_endtag(self, tag):
+        if tag == 'noscript':
+            self._in_noscript = False
+
+
+def required_extensions(htmls, policy):
+    """
+    Return the sorted names of the extensions needed by the AMP elements in the given HTML
+    strings that are allowed by the policy (and so survive cleaning). 'amp-story' is always
+    included.
+    """
+    extensions = {'amp-story'}
+    for html in htmls:
+        scanner = ElementScanner(policy)
+        scanner.feed(html)
+        scanner.close()
+        for name in scanner.names:
+            extension = extension_for_element(name)
+            if name.startswith('amp-') and extension is not None:
+                extensions.add(extension)
+    return sorted(extensions)
+
+
+def extension_script(name):
+    return '<script async custom-element="%s" src="%s"></script>' % (
+        name, AMP_EXTENSION_URL % (name, EXTENSION_VERSIONS.get(name, '0.1'))
+    )
+
+
+def story_start_tag(story_attrs, policy):
+    """
+    Return the <amp-story> start tag for the given attributes, keeping only the attributes that
+    the policy allows on <amp-story>, and cleaning their values as for elements within pages
+    """
+    attrs = []
+    for name, value in story_attrs.items():
+        if (
+            name in EXCLUDED_AMP_STORY_ATTRIBUTES or not name
+            or INVALID_ATTRIBUTE_NAME_RE.search(name)
+            or not policy.allows_attribute('amp-story', name, value)
+        ):
+            continue
+        if name in AMP_STORY_URI_ATTRIBUTES:
+            value = sanitize_uri(value, policy.protocols)
+            if value is None:
+                continue
+        elif name == 'style':
+            value = sanitize_css(value, policy.styles)
+        attrs.append((name, value))
+    if not any(name == 'standalone' for name, value in attrs):
+        attrs.append(('standalone', ''))
+
+    return '<amp-story%s>' % ''.join(
+        ' ' + name if name == 'standalone' else ' %s=%s' % (name, escape_attribute(value))
+        for name, value in sorted(attrs)
+    )
+
+
+def custom_style(css):
+    """
+    Return a <style amp-custom> element for the given CSS
+    """
+    return '<style amp-custom>%s</style>' % STYLE_END_TAG_RE.sub(r'<\\/\1', css)
+
+
+def document_head(title, extensions, css=None, canonical_url=None):
+    """
+    Return the start of an AMP document, up to and including the <body> start tag
+    """
+    parts = [
+        '<!doctype html>\n<html amp>\n<head>\n<meta charset="utf-8">\n',
+        '<title>%s</title>\n' % escape_text(title or ''),
+    ]
+    if canonical_url is not None:
+        parts.append('<link rel="canonical" href=%s>\n' % escape_attribute(canonical_url))
+    parts.append('<meta name="viewport" content="width=device-width">\n')
+    parts.append('<script async src="%s"></script>\n' % AMP_RUNTIME_URL)
+    for extension in extensions:
+        parts.append(extension_script(extension) + '\n')
+    parts.append(AMP_BOILERPLATE + '\n')
+    if css:
+        parts.append(custom_style(css) + '\n')
+    parts.append('</head>\n<body>\n')
+    return ''.join(parts)
@@ -0,0 +1,83 @@
+class InvalidStoryException(ValueError):
+    """
+    Raised when the HTML passed to Story is not a valid web story
+    """
+    pass
+
+
+class LimitExceeded(InvalidStoryException):
+    """
+    Raised when a story document exceeds one of the limits in a StoryLimits object. limit is the
+    name of the limit ('max_bytes', 'max_pages', 'max_depth', 'max_page_nodes' or
+    'max_css_bytes') and maximum is its value.
+    """
+    def __init__(self, limit, maximum):
+        self.limit = limit
+        self.maximum = maximum
+        super().__init__("Story exceeds %s (%d)" % (limit, maximum))
+
+    def __reduce__(self):
+        return (self.__class__, (self.limit, self.maximum))
+
+
+class StoryLimits:
+    """
+    Limits on the size and complexity of story documents, checked while parsing so that
+    oversized input is rejected before a full tree is built. Each limit may be None to disable it:
+
+    max_bytes - length of the document, in bytes (or characters, if passed as a string)
+    max_pages - number of <amp-story-page> elements
+    max_depth - nesting depth of elements, as a browser would nest them (so that unclosed <p>
+        and <li> elements are siblings rather than nested)
+    max_page_nodes - number of elements within a single page, including the page itself
+    max_css_bytes - size of the <style amp-custom> content, in UTF-8 encoded bytes
+    """
+    __slots__ = ('max_bytes', 'max_pages', 'max_depth', 'max_page_nodes', 'max_css_bytes')
+
+    def __init__(
+        self, max_bytes=16 * 1024 * 1024, max_pages=1000, max_depth=256, max_page_nodes=10000,
+        max_css_bytes=1024 * 1024
+    ):
+        self.max_bytes = max_bytes
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.max_page_nodes = max_page_nodes
+        self.max_css_bytes = max_css_bytes
+
+    @classmethod
+    def unlimited(cls):
+        return cls(
+            max_bytes=None, max_pages=None, max_depth=None, max_page_nodes=None,
+            max_css_bytes=None
+        )
+
+    def check(self, limit, value):
+        """
+        Raise LimitExceeded if value is over the named limit
+        """
+        maximum = getattr(self, limit)
+        if maximum is not None and value > maximum:
+            raise LimitExceeded(limit, maximum)
+
+    def __repr__(self):
+        return "<StoryLimits: %s>" % ', '.join(
+            '%s=%s' % (name, getattr(self, name)) for name in self.__slots__
+        )
+
+
+_default_limits = StoryLimits()
+
+
+def get_default_limits():
+    """
+    Return the StoryLimits used by Story when none are passed, or None if limits are disabled
+    """
+    return _default_limits
+
+
+def set_default_limits(limits):
+    """
+    Set the StoryLimits used by Story when none are passed; None disables limit checking
+    """
+    global _default_limits
+    _default_limits = limits
@@ -0,0 +1,164 @@
+import hashlib
+import json
+from difflib import SequenceMatcher
+
+
+# increment when the structure of StoryManifest.as_dict() changes
+MANIFEST_VERSION = 1
+
+# Story attributes recorded in a StoryManifest
+METADATA_FIELDS = (
+    'title', 'publisher', 'publisher_logo_src', 'poster_portrait_src', 'poster_square_src',
+    'poster_landscape_src',
+)
+
+
+def fingerprint(*parts):
+    """
+    Return a stable hash of the given strings (or None values)
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if part is None:
+            digest.update(b'\x00')
+        else:
+            digest.update(b'\x01%d:' % len(part))
+            digest.update(part.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+
+class StoryManifest:
+    """
+    A snapshot of a story's metadata, a fingerprint of its custom CSS and the (id, fingerprint)
+    of each of its pages, for comparing against a later version of the story with Story.diff.
+    Manifests can be stored with as_dict() / to_json() and restored with from_dict() /
+    from_json().
+    """
+    def __init__(self, metadata, custom_css_fingerprint, pages):
+        self.metadata = dict(metadata)
+        self.custom_css_fingerprint = custom_css_fingerprint
+        # list of (id, fingerprint) tuples, in page order
+        self.pages = [tuple(page) for page in pages]
+
+    @classmethod
+    def from_story(cls, story):
+        return cls(
+            {field: getattr(story, field) for field in METADATA_FIELDS},
+            fingerprint(story.custom_css),
+            [(page.id, page.fingerprint) for page in story.pages],
+        )
+
+    def as_dict(self):
+        return {
+            'version': MANIFEST_VERSION,
+            'metadata': self.metadata,
+            'custom_css_fingerprint': self.custom_css_fingerprint,
+            'pages': [list(page) for page in self.pages],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != MANIFEST_VERSION:
+            raise ValueError("Unsupported manifest version: %r" % data.get('version'))
+        return cls(data['metadata'], data['custom_css_fingerprint'], data['pages'])
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    def __eq__(self, other):
+        return isinstance(other, StoryManifest) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return "<StoryManifest: %s (%d pages)>" % (self.metadata.get('title'), len(self.pages))
+
+
+class StoryDiff:
+    """
+    The differences between two versions of a story, as returned by Story.diff. Pages are
+    matched by id (and, for pages sharing an id or with none, by order of appearance). Each
+    attribute is a list of page ids:
+
+    added - pages only in the new version
+    removed - pages only in the old version
+    changed - pages whose content differs
+    reordered - pages that moved relative to the others (with the fewest pages counted as moved)
+    unchanged - pages with the same content, whether or not they moved
+
+    metadata_changed is a list of the changed METADATA_FIELDS, and custom_css_changed is a
+    boolean. pages_to_clean is the list of the new version's StoryPage objects that are added or
+    changed.
+    """
+    def __init__(self, story, previous):
+        if not isinstance(previous, StoryManifest):
+            previous = StoryManifest.from_story(previous)
+        current = StoryManifest.from_story(story)
+
+        self.metadata_changed = [
+            field for field in METADATA_FIELDS
+            if current.metadata.get(field) != previous.metadata.get(field)
+        ]
+        self.custom_css_changed = (
+            current.custom_css_fingerprint != previous.custom_css_fingerprint
+        )
+
+        current_keys = self.page_keys(current.pages)
+        previous_keys = self.page_keys(previous.pages)
+        current_fingerprints = dict(zip(current_keys, (page[1] for page in current.pages)))
+        previous_fingerprints = dict(zip(previous_keys, (page[1] for page in previous.pages)))
+
+        self.added = [key[0] for key in current_keys if key not in previous_fingerprints]
+        self.removed = [key[0] for key in previous_keys if key not in current_fingerprints]
+        self.changed = []
+        self.unchanged = []
+        for key in current_keys:
+            if key in previous_fingerprints:
+                if current_fingerprints[key] == previous_fingerprints[key]:
+                    self.unchanged.append(key[0])
+                else:
+                    self.changed.append(key[0])
+
+        # pages outside the longest common subsequence of the two orderings are the ones that moved
+        common_current = [key for key in current_keys if key in previous_fingerprints]
+        common_previous = [key for key in previous_keys if key in current_fingerprints]
+        matcher = SequenceMatcher(None, common_previous, common_current, autojunk=False)
+        in_place = set()
+        for block in matcher.get_matching_blocks():
+            in_place.update(common_current[block.b:block.b + block.size])
+        self.reordered = [key[0] for key in common_current if key not in in_place]
+
+        changed_keys = set(
+            key for key in current_keys
+            if current_fingerprints[key] != previous_fingerprints.get(key)
+        )
+        self.pages_to_clean = [
+            page for page, key in zip(story.pages, current_keys) if key in changed_keys
+        ]
+
+    @staticmethod
+    def page_keys(pages):
+        """
+        Return a list of (id, occurrence) keys for a list of (id, fingerprint) tuples, so that
+        pages with a duplicate (or missing) id are matched in order
+        """
+        counts = {}
+        keys = []
+        for id, page_fingerprint in pages:
+            counts[id] = counts.get(id, 0) + 1
+            keys.append((id, counts[id]))
+        return keys
+
+    @property
+    def has_changes(self):
+        return bool(
+            self.added or self.removed or self.changed or self.reordered
+            or self.metadata_changed or self.custom_css_changed
+        )
+
+    def __repr__(self):
+        return "<StoryDiff: %d added, %d removed, %d changed, %d reordered>" % (
+            len(self.added), len(self.removed), len(self.changed), len(self.reordered)
+        )
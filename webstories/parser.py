@@ -0,0 +1,274 @@
+import re
+from html.parser import HTMLParser
+
+from bs4.builder import HTMLParserTreeBuilder
+from bs4.dammit import UnicodeDammit
+
+from .assets import ASSET_ELEMENTS, MEDIA_ELEMENTS, element_assets
+from .cleaner import CLOSES_P_TAGS
+from .limits import LimitExceeded, StoryLimits
+
+
+# whitespace characters that bs4 collapses when a string consists only of these
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+# elements that BeautifulSoup closes immediately, as they cannot have content
+EMPTY_ELEMENT_TAGS = frozenset(HTMLParserTreeBuilder().empty_element_tags)
+
+# elements that a browser closes when the start tag of one of the given elements is found within
+# them, as per https://html.spec.whatwg.org/multipage/parsing.html#parsing-main-inbody; html.parser
+# leaves them open
+IMPLICITLY_CLOSED_BY = {
+    'p': CLOSES_P_TAGS,
+    'li': frozenset(['li']),
+    'dd': frozenset(['dd', 'dt']),
+    'dt': frozenset(['dd', 'dt']),
+    'option': frozenset(['option', 'optgroup']),
+    'optgroup': frozenset(['optgroup']),
+}
+
+# an <amp-story> start tag, which every parser backend recognises in the same way
+STORY_START_TAG_RE = re.compile(r'<amp-story[\s/>]', re.I)
+
+
+def decode_html(html):
+    """
+    Return the passed HTML document as a string, decoding it in the same way as BeautifulSoup if
+    it is passed as bytes
+    """
+    if isinstance(html, str):
+        return html
+    return UnicodeDammit(html, is_html=True).unicode_markup
+
+
+def may_be_story(html):
+    """
+    Return whether the passed HTML string contains anything that could be parsed as an
+    <amp-story> element, without parsing it
+    """
+    return STORY_START_TAG_RE.search(html) is not None
+
+
+def tag_string(text):
+    """
+    Given the text content of an element consisting of a single text node (or nothing), return
+    the value that BeautifulSoup's Tag.string would give for it
+    """
+    if not text:
+        return None
+    elif not text.strip(ASCII_SPACES):
+        return '\n' if '\n' in text else ' '
+    else:
+        return text
+
+
+class StoryParser(HTMLParser):
+    """
+    Event-based parser that extracts the attributes of the <amp-story> element, the content of the
+    <style amp-custom> element, and the source spans and assets of the <amp-story-page> elements
+    within the story, without building a DOM. Elements are nested in the same way as
+    BeautifulSoup's html.parser tree builder would, so the results match those of searching its
+    tree.
+
+    Parsing stops as soon as everything required has been found; if metadata_only is true, page
+    spans are not required. If a StoryLimits object is passed, LimitExceeded is raised as soon as
+    the part of the document parsed so far exceeds one of its limits.
+    """
+    class Done(Exception):
+        pass
+
+    def __init__(self, metadata_only=False, limits=None):
+        # character references are only meaningful in attribute values, which HTMLParser decodes
+        # regardless of this setting
+        super().__init__(convert_charrefs=False)
+        self.metadata_only = metadata_only
+        if limits is None:
+            limits = StoryLimits.unlimited()
+        self.limits = limits
+
+        self.story_attrs = None
+        self.custom_css = None
+        self.found_custom_css = False
+        self.custom_css_expected = True
+        # list of (start, end, id, assets) tuples
+        self.page_spans = []
+
+        self.source = ''
+        self.position = 0
+        # offset of HTMLParser's rawdata buffer within the document
+        self._rawdata_offset = 0
+        self._open_tags = []
+        # for each open element when max_depth is being checked, a (parent index, depth) tuple
+        # locating it in the tree a browser would build, with implicitly closed elements closed
+        self._implied_nesting = []
+        self._story_depth = None
+        self._story_closed = False
+        self._page_depth = None
+        self._page_start = None
+        self._page_id = None
+        self._page_assets = None
+        # list of (depth, name, attribute dict) for the open amp-video / amp-audio elements
+        self._open_media = []
+        self._custom_css_chunks = None
+        self._custom_css_size = 0
+        # number of elements within the current page
+        self._page_nodes = 0
+
+    @classmethod
+    def parse(cls, html, metadata_only=False, limits=None):
+        parser = cls(metadata_only=metadata_only, limits=limits)
+        parser.source = html
+        # a plain substring search is much cheaper than parsing the remainder of the document
+        # just to find that it has no <style amp-custom>
+        parser.custom_css_expected = 'amp-custom' in html
+        try:
+            parser.feed(html)
+            # feed() leaves any incomplete markup at the end of the document in the buffer for
+            # close() to deal with
+            parser._rawdata_offset = len(html) - len(parser.rawdata)
+            parser.close()
+        except StoryParser.Done:
+            pass
+        return parser
+
+    def updatepos(self, i, j):
+        # Track the offset of the current markup within the document. This replaces the line /
+        # column tracking behind getpos(), which we don't use.
+        self.position = self._rawdata_offset + j
+        return j
+
+    def handle_starttag(self, tag, attrs):
+        limits = self.limits
+        if limits.max_depth is not None:
+            nesting = self.implied_nesting(tag)
+            if nesting[1] > limits.max_depth:
+                raise LimitExceeded('max_depth', limits.max_depth)
+        if self._page_depth is not None:
+            self._page_nodes += 1
+            if limits.max_page_nodes is not None and self._page_nodes > limits.max_page_nodes:
+                raise LimitExceeded('max_page_nodes', limits.max_page_nodes)
+
+        if tag == 'amp-story' and self.story_attrs is None:
+            self.story_attrs = self.attribute_dict(attrs)
+            self._story_depth = len(self._open_tags)
+            self.check_done()
+        elif (
+            tag == 'amp-story-page' and self._page_depth is None
+            and self._story_depth is not None and not self._story_closed
+            and len(self._open_tags) == self._story_depth + 1
+        ):
+            if limits.max_pages is not None and len(self.page_spans) >= limits.max_pages:
+                raise LimitExceeded('max_pages', limits.max_pages)
+            self._page_depth = len(self._open_tags)
+            self._page_nodes = 1
+            self._page_start = self.position
+            page_attrs = self.attribute_dict(attrs)
+            self._page_id = page_attrs.get('id')
+            self._page_assets = element_assets(tag, page_attrs, self._page_id)
+        elif (
+            tag == 'style' and not self.found_custom_css and self._custom_css_chunks is None
+            and any(name == 'amp-custom' for name, value in attrs)
+        ):
+            self._custom_css_chunks = []
+        elif self._page_depth is not None and tag in ASSET_ELEMENTS:
+            attrs = self.attribute_dict(attrs)
+            if tag in MEDIA_ELEMENTS:
+                self._open_media.append((len(self._open_tags), tag, attrs))
+            self._page_assets.extend(element_assets(
+                tag, attrs, self._page_id,
+                self._open_media[-1][1:] if self._open_media else None
+            ))
+
+        if tag not in EMPTY_ELEMENT_TAGS:
+            self._open_tags.append(tag)
+            if limits.max_depth is not None:
+                self._implied_nesting.append(nesting)
+
+    def implied_nesting(self, tag):
+        """
+        Return a (parent index, depth) tuple for an element with the given start tag, where the
+        parent is the innermost open element that a browser would not close implicitly. The
+        nesting of implicitly closed elements is already resolved, so long runs of unclosed <p> or
+        <li> elements are siblings.
+        """
+        open_tags = self._open_tags
+        parent = len(open_tags) - 1
+        while parent >= 0 and tag in IMPLICITLY_CLOSED_BY.get(open_tags[parent], ()):
+            parent = self._implied_nesting[parent][0]
+        return (parent, self._implied_nesting[parent][1] + 1 if parent >= 0 else 1)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in EMPTY_ELEMENT_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_data(self, data):
+        if self._custom_css_chunks is not None:
+            self._custom_css_chunks.append(data)
+            if self.limits.max_css_bytes is not None:
+                self._custom_css_size += len(data.encode('utf-8', 'surrogatepass'))
+                if self._custom_css_size > self.limits.max_css_bytes:
+                    raise LimitExceeded('max_css_bytes', self.limits.max_css_bytes)
+
+    def handle_endtag(self, tag):
+        if tag == 'style' and self._custom_css_chunks is not None:
+            self.finish_custom_css()
+
+        # as per BeautifulSoup, close the most recent open element with this name and everything
+        # within it, or ignore the end tag if there is none
+        open_tags = self._open_tags
+        for depth in range(len(open_tags) - 1, -1, -1):
+            if open_tags[depth] == tag:
+                break
+        else:
+            return
+
+        if self._page_depth is not None and self._page_depth >= depth:
+            if self._page_depth == depth:
+                end = self.source.find('>', self.position) + 1 or len(self.source)
+            else:
+                end = self.position
+            self.finish_page(end)
+        if self._story_depth is not None and self._story_depth >= depth:
+            self._story_closed = True
+
+        while self._open_media and self._open_media[-1][0] >= depth:
+            self._open_media.pop()
+        del open_tags[depth:]
+        del self._implied_nesting[depth:]
+        self.check_done()
+
+    def close(self):
+        super().close()
+        if self._custom_css_chunks is not None:
+            self.finish_custom_css()
+        if self._page_depth is not None:
+            self.finish_page(len(self.source))
+
+    @staticmethod
+    def attribute_dict(attrs):
+        # as per BeautifulSoup, later duplicate attributes override earlier ones, and attributes
+        # without a value are given an empty string
+        return {
+            name: ('' if value is None else value)
+            for name, value in attrs
+        }
+
+    def finish_page(self, end):
+        self.page_spans.append((self._page_start, end, self._page_id, self._page_assets))
+        self._page_depth = self._page_start = self._page_id = self._page_assets = None
+        self._open_media = []
+
+    def finish_custom_css(self):
+        css = ''.join(self._custom_css_chunks)
+        self._custom_css_chunks = None
+        self.found_custom_css = True
+        self.custom_css = tag_string(css)
+
+    def check_done(self):
+        if self.story_attrs is None:
+            return
+        if self.custom_css_expected and not self.found_custom_css:
+            return
+        if self.metadata_only or self._story_closed:
+            raise StoryParser.Done()
@@ -0,0 +1,144 @@
+"""
+Timing hooks for the phases of story parsing and page cleaning.
+
+A hook is a callable that is passed (phase, duration, size, page_id) each time a phase
+completes, where duration is in seconds, size is the length of the phase's input HTML (or None)
+and page_id is the id of the page being cleaned, if known. Hooks apply to all threads in the
+current process; work done by clean_many in worker processes is not reported.
+
+Phases:
+    parse_story - parsing a story document in Story()
+    parse_pages - parsing the pages of a Story created with lazy=True
+    find_pages - extracting the pages from a BeautifulSoup tree (html5lib backend only)
+    cache_lookup - looking up a page in the default cache
+    parse_fragment - parsing page HTML for cleaning
+    clean_native - cleaning with the native engine
+    strip_scripts - removing disallowed <script> elements before cleaning with bleach
+    serialize - serializing the page for bleach
+    clean_bleach - cleaning with bleach
+    validate - checking a page with StoryPage.validate or is_clean
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+_hooks = ()
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook):
+    """
+    Register a callable to be passed (phase, duration, size, page_id) on completion of each phase
+    """
+    global _hooks
+    with _hooks_lock:
+        _hooks = _hooks + (hook,)
+
+
+def remove_hook(hook):
+    global _hooks
+    with _hooks_lock:
+        hooks = list(_hooks)
+        hooks.remove(hook)
+        _hooks = tuple(hooks)
+
+
+def start_timer():
+    """
+    Return the start time for a phase, or None if no hooks are registered (in which case the
+    corresponding record call does nothing)
+    """
+    if _hooks:
+        return time.perf_counter()
+
+
+def record(phase, start, size=None, page_id=None):
+    """
+    Pass the duration of a phase that began at start (as returned by start_timer) to the
+    registered hooks
+    """
+    if start is None:
+        return
+    duration = time.perf_counter() - start
+    for hook in _hooks:
+        hook(phase, duration, size, page_id)
+
+
+class PhaseStats:
+    """
+    A hook that collects the durations of each phase, for reporting percentiles over many calls
+    """
+    def __init__(self):
+        self._durations = defaultdict(list)
+        self._sizes = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def __call__(self, phase, duration, size, page_id):
+        with self._lock:
+            self._durations[phase].append(duration)
+            if size is not None:
+                self._sizes[phase] += size
+
+    def phases(self):
+        with self._lock:
+            return sorted(self._durations)
+
+    def durations(self, phase):
+        with self._lock:
+            return list(self._durations.get(phase, ()))
+
+    def percentile(self, phase, percent):
+        """
+        Return the given percentile (0-100) of the durations recorded for phase, interpolating
+        between the nearest values, or None if there are none
+        """
+        durations = sorted(self.durations(phase))
+        if not durations:
+            return None
+        position = (len(durations) - 1) * percent / 100
+        lower = int(position)
+        upper = min(lower + 1, len(durations) - 1)
+        return durations[lower] + (durations[upper] - durations[lower]) * (position - lower)
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """
+        Return a dict mapping each phase to a dict of its call count, total duration, total input
+        size and the given percentiles of its duration (as 'p50' etc), in seconds
+        """
+        result = {}
+        for phase in self.phases():
+            durations = self.durations(phase)
+            stats = {
+                'count': len(durations),
+                'total': sum(durations),
+                'size': self._sizes.get(phase, 0),
+            }
+            for percent in percentiles:
+                stats['p%g' % percent] = self.percentile(phase, percent)
+            result[phase] = stats
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._sizes.clear()
+
+
+@contextmanager
+def profile(hook=None):
+    """
+    Register a hook (by default, a new PhaseStats) for the duration of a with block:
+
+        with profile() as stats:
+            story.get_clean_pages()
+        stats.summary()
+    """
+    if hook is None:
+        hook = PhaseStats()
+    add_hook(hook)
+    try:
+        yield hook
+    finally:
+        remove_hook(hook)
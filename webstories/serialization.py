@@ -0,0 +1,138 @@
+"""
+Primitives for the binary format written by Story.to_bytes and StoryPage.to_bytes.
+
+Data starts with a header giving the format version, the kind of object and flags; the body
+that follows is a sequence of unsigned 32-bit little-endian integers and length-prefixed UTF-8
+strings (with a length of 0xffffffff standing for None), optionally zlib-compressed. Lists of
+assets are stored as JSON strings, so that they can be decoded when first needed.
+"""
+import json
+import struct
+import zlib
+
+from .assets import Asset
+
+
+MAGIC = b'WSTB'
+
+# increment when the binary format changes; data written in other versions is rejected
+FORMAT_VERSION = 1
+
+# kinds of object
+STORY = 1
+PAGE = 2
+
+# header flags
+COMPRESSED = 1
+
+# ways of storing page HTML: as a span of the story document, or a string of its own
+PAGE_SPAN = 0
+PAGE_HTML = 1
+
+COMPRESSION_LEVEL = 1
+
+NONE_LENGTH = 0xffffffff
+
+HEADER = struct.Struct('<4sBBB')
+UINT = struct.Struct('<I')
+
+
+class Writer:
+    def __init__(self, kind):
+        self.kind = kind
+        self.parts = []
+
+    def uint(self, value):
+        self.parts.append(UINT.pack(value))
+
+    def string(self, value):
+        if value is None:
+            self.parts.append(UINT.pack(NONE_LENGTH))
+        else:
+            data = value.encode('utf-8', 'surrogatepass')
+            self.parts.append(UINT.pack(len(data)))
+            self.parts.append(data)
+
+    def getvalue(self, compress=True):
+        body = b''.join(self.parts)
+        flags = 0
+        if compress:
+            body = zlib.compress(body, COMPRESSION_LEVEL)
+            flags |= COMPRESSED
+        return HEADER.pack(MAGIC, FORMAT_VERSION, self.kind, flags) + body
+
+
+class Reader:
+    """
+    Reads the body of data written by a Writer of the given kind, raising ValueError if it is
+    not in the current format
+    """
+    def __init__(self, data, kind):
+        if len(data) < HEADER.size:
+            raise ValueError("Data is too short to be a serialized story")
+        magic, version, data_kind, flags = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Data is not a serialized story")
+        if version != FORMAT_VERSION:
+            raise ValueError("Unsupported serialization format version: %r" % version)
+        if data_kind != kind:
+            raise ValueError(
+                "Data is a serialized %s" % ('story' if data_kind == STORY else 'page')
+            )
+
+        body = data[HEADER.size:]
+        if flags & COMPRESSED:
+            try:
+                body = zlib.decompress(body)
+            except zlib.error as e:
+                raise ValueError("Invalid compressed data: %s" % e)
+        self.data = body
+        self.position = 0
+
+    def uint(self):
+        try:
+            value, = UINT.unpack_from(self.data, self.position)
+        except struct.error:
+            raise ValueError("Serialized data is truncated")
+        self.position += UINT.size
+        return value
+
+    def string(self):
+        length = self.uint()
+        if length == NONE_LENGTH:
+            return None
+        end = self.position + length
+        if end > len(self.data):
+            raise ValueError("Serialized data is truncated")
+        value = self.data[self.position:end].decode('utf-8', 'surrogatepass')
+        self.position = end
+        return value
+
+    def finish(self):
+        if self.position != len(self.data):
+            raise ValueError("Unexpected data at end of serialized data")
+
+
+def dump_assets(assets):
+    """
+    Return a list of Assets (or None) as a JSON string, leaving out their page_id
+    """
+    if assets is None:
+        return None
+    return json.dumps([
+        [
+            asset.url, asset.type, asset.element, asset.attribute, asset.width, asset.height,
+            asset.layout, asset.srcset,
+        ]
+        for asset in assets
+    ], separators=(',', ':'))
+
+
+def load_assets(data, page_id=None):
+    """
+    Return the list of Assets in a JSON string from dump_assets
+    """
+    return [
+        Asset(url, type, element, attribute, page_id, width, height, layout, map(tuple, srcset))
+        for url, type, element, attribute, width, height, layout, srcset in json.loads(data)
+    ]
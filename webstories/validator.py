@@ -0,0 +1,213 @@
+import re
+from html.parser import HTMLParser
+
+from .cleaner import (
+    INVALID_ATTRIBUTE_NAME_RE, URI_ATTRIBUTES, css_is_clean, default_policy, sanitize_uri
+)
+from .parser import EMPTY_ELEMENT_TAGS
+
+
+# text that a browser could parse as the start of a tag, comment or other markup
+MARKUP_IN_TEXT_RE = re.compile(r'<[a-zA-Z!/?]')
+
+
+class Violation:
+    """
+    A part of a page that cleaning would remove or alter. reason is one of:
+
+    disallowed_tag - an element not in the policy's tags
+    disallowed_script - a <script> element without an allowed type
+    disallowed_attribute - an attribute not allowed on its element, or with an invalid name
+    disallowed_value - a URL with a disallowed protocol, or CSS with disallowed properties
+    duplicate_attribute - an attribute given more than once, which parsers resolve differently
+    unsafe_text - text that a browser could parse as markup, or a <script>, <style> or
+        <noscript> element left open, which would take in any markup following the page as text
+    noscript_markup - a tag within a <noscript> element, which cleaning escapes as text
+    comment - an HTML comment
+    unsupported_markup - a doctype, processing instruction or CDATA section
+
+    path is the location of the element (or for text, its parent) as a slash-separated list of
+    tag names from the root, each followed by its position among siblings of the same name if
+    not the first (e.g. '/amp-story-page/amp-story-grid-layer[2]/h1').
+    """
+    def __init__(self, reason, path, tag=None, attribute=None):
+        self.reason = reason
+        self.path = path
+        self.tag = tag
+        self.attribute = attribute
+
+    def __eq__(self, other):
+        return isinstance(other, Violation) and (
+            (self.reason, self.path, self.tag, self.attribute)
+            == (other.reason, other.path, other.tag, other.attribute)
+        )
+
+    def __repr__(self):
+        if self.attribute is None:
+            return "<Violation: %s at %s>" % (self.reason, self.path)
+        return "<Violation: %s %s at %s>" % (self.reason, self.attribute, self.path)
+
+
+class PageValidator(HTMLParser):
+    """
+    Event-based parser that checks page HTML against a SanitizationPolicy without building a DOM
+    or producing any output. Elements are nested as per StoryParser. If first_only is true,
+    parsing stops at the first violation.
+
+    Checks are stricter than cleaning where browsers could parse the markup differently from
+    html.parser, so that the HTML of a page with no violations can be served as-is.
+    """
+    class Done(Exception):
+        pass
+
+    def __init__(self, policy=None, first_only=False):
+        super().__init__(convert_charrefs=False)
+        if policy is None:
+            policy = default_policy()
+        self.policy = policy
+        self.first_only = first_only
+        self.violations = []
+
+        # list of (tag, position) for the open elements
+        self._open_tags = []
+        # for the document and each open element, a dict of the number of children with each name
+        self._child_counts = [{}]
+        self._raw_text_tag = None
+        self._noscript_depth = 0
+
+    @classmethod
+    def validate(cls, html, policy=None, first_only=False):
+        parser = cls(policy=policy, first_only=first_only)
+        try:
+            parser.feed(html)
+            parser.close()
+        except PageValidator.Done:
+            pass
+        return parser.violations
+
+    def path(self, tag=None):
+        elements = self._open_tags
+        if tag is not None:
+            elements = elements + [(tag, self._child_counts[-1][tag])]
+        return ''.join(
+            '/%s' % name if position == 1 else '/%s[%d]' % (name, position)
+            for name, position in elements
+        )
+
+    def violation(self, reason, tag=None, attribute=None, path=None):
+        self.violations.append(Violation(
+            reason, self.path(tag) if path is None else path, tag, attribute
+        ))
+        if self.first_only:
+            raise PageValidator.Done()
+
+    def handle_starttag(self, tag, attrs):
+        counts = self._child_counts[-1]
+        counts[tag] = counts.get(tag, 0) + 1
+
+        if self._noscript_depth:
+            self.violation('noscript_markup', tag)
+        if tag == 'script' and not self.policy.allows_script(
+            next((value for name, value in attrs if name == 'type'), None)
+        ):
+            self.violation('disallowed_script', tag)
+        elif tag not in self.policy.tags:
+            self.violation('disallowed_tag', tag)
+        self.check_attributes(tag, attrs)
+
+        if tag not in EMPTY_ELEMENT_TAGS:
+            self._open_tags.append((tag, counts[tag]))
+            self._child_counts.append({})
+            if tag in self.CDATA_CONTENT_ELEMENTS:
+                self._raw_text_tag = tag
+            elif tag == 'noscript':
+                self._noscript_depth += 1
+
+    def check_attributes(self, tag, attrs):
+        seen = set()
+        for name, value in attrs:
+            if value is None:
+                value = ''
+            if name in seen:
+                self.violation('duplicate_attribute', tag, name)
+            seen.add(name)
+
+            if (
+                not name or INVALID_ATTRIBUTE_NAME_RE.search(name)
+                or not self.policy.allows_attribute(tag, name, value)
+            ):
+                self.violation('disallowed_attribute', tag, name)
+            elif name in URI_ATTRIBUTES:
+                if sanitize_uri(value, self.policy.protocols) is None:
+                    self.violation('disallowed_value', tag, name)
+            elif name == 'style':
+                if not css_is_clean(value, self.policy.styles):
+                    self.violation('disallowed_value', tag, name)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in EMPTY_ELEMENT_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_data(self, data):
+        if self._raw_text_tag == 'script':
+            lower_data = data.lower()
+            # script content that would change a browser's tokenizer state
+            if '<!--' in lower_data or '<script' in lower_data or '</script' in lower_data:
+                self.violation('unsafe_text', 'script', path=self.path())
+        elif self._raw_text_tag is None and MARKUP_IN_TEXT_RE.search(data):
+            # html.parser passes incomplete markup at the end of the input (such as an
+            # unterminated comment) through as text
+            self.violation('unsafe_text')
+
+    def handle_endtag(self, tag):
+        open_tags = self._open_tags
+        for depth in range(len(open_tags) - 1, -1, -1):
+            if open_tags[depth][0] == tag:
+                break
+        else:
+            depth = None
+
+        # end tags within <noscript>, other than for elements opened within it (which have
+        # already been reported), are markup that cleaning escapes as text
+        if self._noscript_depth and tag != 'noscript' and (
+            depth is None
+            or not any(name == 'noscript' for name, position in open_tags[:depth])
+        ):
+            self.violation('noscript_markup', path=self.path())
+        if depth is None:
+            return
+
+        for name, position in open_tags[depth:]:
+            if name == 'noscript':
+                self._noscript_depth -= 1
+        self._raw_text_tag = None
+        del open_tags[depth:]
+        del self._child_counts[depth + 1:]
+
+    def close(self):
+        super().close()
+        if self._raw_text_tag is not None:
+            self.violation('unsafe_text', self._raw_text_tag, path=self.path())
+        elif self._noscript_depth:
+            self.violation('unsafe_text', 'noscript', path=self.path())
+
+    def handle_comment(self, data):
+        self.violation('comment')
+
+    def handle_decl(self, decl):
+        self.violation('unsupported_markup')
+
+    def handle_pi(self, data):
+        self.violation('unsupported_markup')
+
+    def unknown_decl(self, data):
+        self.violation('unsupported_markup')
+
+
+def validate_html(html, policy=None, first_only=False):
+    """
+    Return a list of the Violations of the given SanitizationPolicy (defaulting to the
+    module-level allowlists) in an HTML fragment, or just the first if first_only is true
+    """
+    return PageValidator.validate(html, policy=policy, first_only=first_only)